@@ -0,0 +1,324 @@
+"""Archival of closed tickets out of the hot tickets collection.
+
+Done tickets closed more than a tenant's retention window ago are moved, in
+batches, from tickets to the archive, so the hot collection and its indexes
+only hold recent and open work:
+
+    ARCHIVE_BACKEND=mongo           mongo: the tickets_archive collection
+                                    files: gzip-compressed NDJSON segments in ARCHIVE_DIR/<tenant>/
+    ARCHIVE_RETENTION_DAYS=90       days after closing; 0 never archives
+    ARCHIVE_TENANT_RETENTION_DAYS=TenantA=30,TenantB=0
+    ARCHIVE_BATCH_SIZE=500          tickets moved per batch
+    ARCHIVE_BATCH_PAUSE_MS=200      pause between batches, to leave the database to the API
+    ARCHIVE_INTERVAL_SECONDS=0      run inside the API this often; 0 leaves it to the CLI
+
+Every batch is written to the archive before it is removed from tickets, so
+a crash in between leaves a ticket in both places, never in neither; readers
+prefer the hot copy. A ticket reopened while its batch was in flight stays
+hot and is dropped from the archive again. Archived tickets still count in
+ticket_stats and are read-only.
+
+Ticket reads include the archive with include_archived=true. Segment files
+carry their creation date range in their name, so a list page only opens
+the segments that can still contribute to it; a lookup by id scans the
+tenant's segments.
+
+    python -m app.archive run [--tenant TenantA] [--dry-run]
+"""
+from pymongo import ReplaceOne
+from bson import json_util
+from bson.json_util import JSONMode, JSONOptions
+from datetime import datetime, timedelta
+from uuid import uuid4
+from app.db import db
+from app.log import parse_pairs, setup_logging
+from app.metrics import registry
+from app.response_cache import response_cache
+import argparse
+import asyncio
+import gzip
+import heapq
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BACKEND = os.getenv("ARCHIVE_BACKEND", "mongo")
+ARCHIVE_COLLECTION = "tickets_archive"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+ARCHIVE_TENANT_RETENTION_DAYS = {
+    tenant: float(days) for tenant, days in parse_pairs(os.getenv("ARCHIVE_TENANT_RETENTION_DAYS", "")).items()
+}
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_BATCH_PAUSE_SECONDS = int(os.getenv("ARCHIVE_BATCH_PAUSE_MS", "200")) / 1000
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "0"))
+CLOSED_STATUS = "Done"
+
+# Dates round-trip as naive UTC with millisecond precision, as they do through MongoDB
+SEGMENT_JSON_OPTIONS = JSONOptions(json_mode=JSONMode.RELAXED, tz_aware=False)
+
+tickets_archived = registry.counter("tickets_archived", "Tickets moved from the hot collection to the archive", ("tenant",))
+
+def retention_days(customer_id):
+    return ARCHIVE_TENANT_RETENTION_DAYS.get(customer_id, ARCHIVE_RETENTION_DAYS)
+
+def archivable_query(customer_id, cutoff):
+    """Done tickets of the tenant closed before cutoff; tickets closed before closed_at existed go by created_at"""
+    return {
+        "customer_id": customer_id,
+        "status": CLOSED_STATUS,
+        "$or": [
+            {"closed_at": {"$lt": cutoff}},
+            {"closed_at": None, "created_at": {"$lt": cutoff}},
+        ],
+    }
+
+def matches(document, query):
+    """Evaluate the subset of the query language the ticket list uses against a document"""
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(document, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = document.get(field)
+            for op, operand in condition.items():
+                if value is None or not COMPARISONS[op](value, operand):
+                    return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+COMPARISONS = {
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+}
+
+def sort_key(document):
+    return document["created_at"], document["_id"]
+
+class MongoArchive:
+    """Archived tickets in their own collection, queried like the hot one"""
+
+    def collection(self):
+        return db.get_collection(ARCHIVE_COLLECTION)
+
+    async def write(self, customer_id, tickets):
+        # Replacing by _id makes a batch that is written twice, by a retry or a second worker, harmless
+        await self.collection().bulk_write([ReplaceOne({"_id": ticket["_id"]}, ticket, upsert=True) for ticket in tickets], ordered=False)
+        return None
+
+    async def discard(self, customer_id, handle, ids):
+        await self.collection().delete_many({"_id": {"$in": ids}, "customer_id": customer_id})
+
+    async def find(self, customer_id, query, sort, limit):
+        return await self.collection().find(query).sort(sort).limit(limit).to_list(None)
+
+    async def get(self, customer_id, object_id):
+        return await self.collection().find_one({"_id": object_id, "customer_id": customer_id})
+
+class SegmentArchive:
+    """Archived tickets in gzip-compressed NDJSON segments, one directory per tenant.
+
+    Segments are named <first created_at ms>-<last created_at ms>-<id>.ndjson.gz
+    and written to a temporary name first, so readers never see half a segment.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def tenant_directory(self, customer_id):
+        # customer_id comes from a signed token, but is still kept out of path traversal
+        return os.path.join(self.directory, customer_id.replace(os.sep, "_").replace("..", "_"))
+
+    def segments(self, customer_id):
+        """[(first created_at ms, last created_at ms, path)] of the tenant's segments"""
+        directory = self.tenant_directory(customer_id)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in names:
+            if name.endswith(".ndjson.gz"):
+                first, last, _ = name.split("-", 2)
+                segments.append((int(first), int(last), os.path.join(directory, name)))
+        return segments
+
+    def _write(self, customer_id, tickets):
+        directory = self.tenant_directory(customer_id)
+        os.makedirs(directory, exist_ok=True)
+        created = sorted(milliseconds(ticket["created_at"]) for ticket in tickets)
+        path = os.path.join(directory, f"{created[0]}-{created[-1]}-{uuid4().hex[:12]}.ndjson.gz")
+        temporary = path + ".tmp"
+        with gzip.open(temporary, "wt", encoding="utf-8") as segment:
+            for ticket in tickets:
+                segment.write(json_util.dumps(ticket, json_options=SEGMENT_JSON_OPTIONS))
+                segment.write("\n")
+        os.replace(temporary, path)
+        return path
+
+    def _read(self, path):
+        with gzip.open(path, "rt", encoding="utf-8") as segment:
+            return [json_util.loads(line, json_options=SEGMENT_JSON_OPTIONS) for line in segment if line.strip()]
+
+    def _discard(self, customer_id, path, ids):
+        ids = set(ids)
+        kept = [ticket for ticket in self._read(path) if ticket["_id"] not in ids]
+        if kept:
+            self._write(customer_id, kept)
+        os.remove(path)
+
+    def _find(self, customer_id, query, sort, limit):
+        descending = sort[0][1] < 0
+        # Newest segments first for a descending page, oldest first otherwise
+        segments = sorted(self.segments(customer_id), key=lambda segment: segment[1] if descending else -segment[0], reverse=True)
+        page = []
+        for first, last, path in segments:
+            if len(page) >= limit:
+                boundary = milliseconds(page[-1]["created_at"])
+                # Every later segment sorts entirely after the page's last entry
+                if (descending and last < boundary) or (not descending and first > boundary):
+                    break
+            found = [ticket for ticket in self._read(path) if matches(ticket, query)]
+            select = heapq.nlargest if descending else heapq.nsmallest
+            page = select(limit, page + found, key=sort_key)
+        return page
+
+    def _get(self, customer_id, object_id):
+        for _, _, path in self.segments(customer_id):
+            for ticket in self._read(path):
+                if ticket["_id"] == object_id:
+                    return ticket
+        return None
+
+    async def write(self, customer_id, tickets):
+        return await asyncio.to_thread(self._write, customer_id, tickets)
+
+    async def discard(self, customer_id, handle, ids):
+        await asyncio.to_thread(self._discard, customer_id, handle, ids)
+
+    async def find(self, customer_id, query, sort, limit):
+        return await asyncio.to_thread(self._find, customer_id, query, sort, limit)
+
+    async def get(self, customer_id, object_id):
+        return await asyncio.to_thread(self._get, customer_id, object_id)
+
+def milliseconds(moment: datetime):
+    return int((moment - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+def merge_pages(hot, archived, descending, limit):
+    """One page from the hot and archived candidates, the hot copy winning for a ticket in both"""
+    seen = {ticket["_id"] for ticket in hot}
+    candidates = hot + [ticket for ticket in archived if ticket["_id"] not in seen]
+    candidates.sort(key=sort_key, reverse=descending)
+    return candidates[:limit]
+
+class TicketArchiver:
+    def __init__(self, store, batch_size: int, pause: float, interval: float):
+        self.store = store
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self._task = None
+
+    async def archive_tenant(self, customer_id, now=None, dry_run=False):
+        """Move the tenant's archivable tickets batch by batch. Returns the number moved (or due, for a dry run)."""
+        days = retention_days(customer_id)
+        if days <= 0:
+            return 0
+        tickets = db.get_collection("tickets")
+        query = archivable_query(customer_id, (now or datetime.utcnow()) - timedelta(days=days))
+        if dry_run:
+            return await tickets.count_documents(query)
+
+        moved = 0
+        while True:
+            batch = await tickets.find(query).limit(self.batch_size).to_list(None)
+            if not batch:
+                return moved
+            ids = [ticket["_id"] for ticket in batch]
+            handle = await self.store.write(customer_id, batch)
+            result = await tickets.delete_many({**query, "_id": {"$in": ids}})
+            if result.deleted_count < len(ids):
+                # Reopened since the batch was read: the hot copy is the ticket now
+                reopened = [ticket["_id"] async for ticket in tickets.find({"_id": {"$in": ids}}, {"_id": 1})]
+                if reopened:
+                    await self.store.discard(customer_id, handle, reopened)
+            moved += result.deleted_count
+            tickets_archived.inc(customer_id, amount=result.deleted_count)
+            response_cache.invalidate(customer_id)
+            if len(batch) < self.batch_size:
+                return moved
+            await asyncio.sleep(self.pause)
+
+    async def run_once(self, customer_ids=None, dry_run=False):
+        """{customer_id: tickets archived} for the given tenants, or every tenant with Done tickets"""
+        if customer_ids is None:
+            customer_ids = sorted(await db.get_collection("tickets").distinct("customer_id", {"status": CLOSED_STATUS}))
+        return {customer_id: await self.archive_tenant(customer_id, dry_run=dry_run) for customer_id in customer_ids}
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                archived = await self.run_once()
+                if any(archived.values()):
+                    logger.info("Archived closed tickets", extra={"archived": archived})
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ticket archival failed")
+
+def build_store(backend=ARCHIVE_BACKEND):
+    return SegmentArchive(ARCHIVE_DIR) if backend == "files" else MongoArchive()
+
+# Global archive and archiver
+archive_store = build_store()
+archiver = TicketArchiver(archive_store, ARCHIVE_BATCH_SIZE, ARCHIVE_BATCH_PAUSE_SECONDS, ARCHIVE_INTERVAL_SECONDS)
+
+async def run(args):
+    await db.connect()
+    try:
+        started = time.perf_counter()
+        archived = await archiver.run_once([args.tenant] if args.tenant else None, dry_run=args.dry_run)
+        elapsed = time.perf_counter() - started
+    finally:
+        await db.close()
+    verb = "would be archived" if args.dry_run else "archived"
+    for customer_id, count in archived.items():
+        print(f"{customer_id}: {count} tickets {verb}")
+    print(f"{sum(archived.values())} tickets {verb} in {elapsed:.1f}s ({ARCHIVE_BACKEND} backend)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move closed tickets past their retention window to the archive")
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--tenant", help="only archive this customer_id")
+    parser.add_argument("--dry-run", action="store_true", help="count the tickets due without moving them")
+    args = parser.parse_args(argv)
+    setup_logging()
+    asyncio.run(run(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
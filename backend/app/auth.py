@@ -1,23 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
+from typing import Optional
 from datetime import datetime, timedelta
 from app.db import db
 from app.models import User
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from app.cache import TTLCache
+from app.passwords import password_hasher, pwd_context
+from app.middleware import current_request_stats
+from app.tokens import (
+    ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, issue_refresh_token, revocations, revoke_refresh_token,
+    use_refresh_token, verify_access_token,
+)
+from jose import JWTError
 import os
 
 router = APIRouter()
 
-# Constants
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Principal cache
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+# Build the principal from the customer_id/role claims without a DB lookup
+AUTH_TRUST_JWT_CLAIMS = os.getenv("AUTH_TRUST_JWT_CLAIMS", "false").lower() == "true"
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
+
+# Authenticated users keyed by (token subject, tenant claim)
+principal_cache = TTLCache(maxsize=AUTH_CACHE_MAX_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
 
 # Request/Response Models
 class UserCreate(BaseModel):
@@ -29,6 +40,14 @@ class UserCreate(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    expires_in: int
+    refresh_token: str
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 # Utility Functions
 def verify_password(plain_password, hashed_password):
@@ -37,24 +56,25 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+def invalidate_principal(email: str, customer_id: str):
+    """Drop a cached principal after the user behind it changes"""
+    principal_cache.pop((email, customer_id))
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await authenticate_token(token)
+
+async def get_stream_user(token: Optional[str] = Depends(oauth2_scheme_optional), access_token: Optional[str] = None):
+    """get_current_user for event streams, also accepting ?access_token= since EventSource cannot set headers"""
+    return await authenticate_token(token or access_token or "")
+
+async def authenticate_token(token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = verify_access_token(token)
         email: str = payload.get("sub")
         customer_id: str = payload.get("customer_id")  # Get from JWT
         if email is None:
@@ -62,8 +82,27 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
+    # Tags this request's log records with the tenant
+    stats = current_request_stats()
+    if stats is not None:
+        stats.tenant = customer_id
+    
+    if AUTH_TRUST_JWT_CLAIMS and payload.get("uid") and customer_id and payload.get("role"):
+        return User(
+            id=payload["uid"],
+            email=email,
+            customer_id=customer_id,
+            role=payload["role"],
+            created_at=None,
+        )
+    
+    cache_key = (email, customer_id)
+    principal = principal_cache.get(cache_key)
+    if principal is not None:
+        return principal
+    
     users = db.get_collection("users")
-    user = users.find_one({"email": email})
+    user = await users.find_one({"email": email}, {"hashed_password": 0})
     if user is None:
         raise credentials_exception
     
@@ -71,42 +110,86 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user["id"] = str(user["_id"])
     del user["_id"]
     
-    return User(**user)
+    principal = User(**user)
+    principal_cache.set(cache_key, principal)
+    return principal
 
 # Routes
 @router.post("/token", response_model=TokenResponse)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     users = db.get_collection("users")
-    user = users.find_one({"email": form_data.username})
+    user = await users.find_one({"email": form_data.username})
     
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(form_data.password, user["hashed_password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # Transparently upgrade hashes made with a different bcrypt cost
+    if new_hash:
+        await users.update_one({"_id": user["_id"]}, {"$set": {"hashed_password": new_hash}})
+    
+    return await issue_tokens(user)
+
+async def issue_tokens(user: dict, family: str = None):
+    """Access token plus a refresh token, in the given refresh token family or a new one"""
     # Include customer_id and role in JWT payload
     access_token = create_access_token(
         data={
             "sub": user["email"], 
+            "uid": str(user["_id"]),
             "customer_id": user["customer_id"],
             "role": user["role"]
         }, 
-        expires_delta=access_token_expires
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": await issue_refresh_token(user, family),
+    }
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_access_token(body: RefreshRequest):
+    """Trade a refresh token for a new access token and a new refresh token, without the password"""
+    record = await use_refresh_token(body.refresh_token)
+    # The user is read again so a changed role or a deleted account takes effect
+    user = await db.get_collection("users").find_one({"email": record["sub"]}, {"hashed_password": 0}) if record else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await issue_tokens(user, record["family"])
+
+@router.post("/logout")
+async def logout(body: Optional[LogoutRequest] = None, token: str = Depends(oauth2_scheme)):
+    """Revoke the access token and, when given, the refresh token's family"""
+    try:
+        claims = verify_access_token(token)
+    except JWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    await revocations.revoke_token(claims)
+    if body is not None and body.refresh_token:
+        await revoke_refresh_token(body.refresh_token)
+    return {"detail": "Logged out"}
 
 @router.post("/register")
 async def register_user(user_data: UserCreate):
     users = db.get_collection("users")
     
     # Check if user already exists
-    if users.find_one({"email": user_data.email}):
+    if await users.find_one({"email": user_data.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     user_doc = {
         "email": user_data.email,
         "hashed_password": hashed_password,
@@ -115,7 +198,8 @@ async def register_user(user_data: UserCreate):
         "created_at": datetime.utcnow()
     }
     
-    result = users.insert_one(user_doc)
+    result = await users.insert_one(user_doc)
+    invalidate_principal(user_doc["email"], user_doc["customer_id"])
     
     # Return user without sensitive data
     response_user = {
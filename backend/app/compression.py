@@ -0,0 +1,279 @@
+"""Response compression negotiated from Accept-Encoding.
+
+A pure ASGI middleware compresses JSON, NDJSON, CSV and text responses
+with the best encoding the client accepts, trying COMPRESSION_ENCODINGS
+in order. A response sent in one piece is compressed whole and keeps its
+Content-Length. A streamed response (the export) is compressed as it goes
+and flushed after every chunk, so the client keeps receiving rows.
+Responses that already have a Content-Encoding, are smaller than
+COMPRESSION_MIN_SIZE, or are event streams are sent unchanged. An event
+stream is held back by proxies as soon as it is compressed.
+
+    COMPRESSION_ENABLED=true
+    COMPRESSION_ENCODINGS=zstd,br,gzip   server preference when the client accepts several equally
+    COMPRESSION_MIN_SIZE=1024            smaller bodies are not worth the CPU
+    COMPRESSION_GZIP_LEVEL=3
+    COMPRESSION_BROTLI_QUALITY=4
+    COMPRESSION_ZSTD_LEVEL=3
+    COMPRESSION_THREAD_MIN_SIZE=262144   bodies this large are compressed off the event loop
+
+br and zstd need the optional brotli and zstandard packages. Without them
+only gzip is offered. Strong ETags become weak on compressed responses,
+since the bytes differ from the identity representation.
+
+Every compressed response adds its input bytes, output bytes and the CPU
+seconds spent compressing to http_compression_*_total, per encoding.
+Responses left uncompressed are counted by reason.
+"""
+from app.metrics import registry
+import asyncio
+import os
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, see requirements.txt
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional, see requirements.txt
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Past 3 zlib switches to lazy matching: on ticket JSON that costs 1.7x the CPU for 12% fewer bytes
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "3"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", str(256 * 1024)))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "text/")
+EXCLUDED_TYPES = ("text/event-stream",)
+
+compressed_responses = registry.counter("http_compressed_responses", "Responses sent compressed", ("encoding",))
+compression_input_bytes = registry.counter("http_compression_input_bytes", "Body bytes before compression", ("encoding",))
+compression_output_bytes = registry.counter("http_compression_output_bytes", "Body bytes after compression", ("encoding",))
+compression_cpu_seconds = registry.counter("http_compression_cpu_seconds", "CPU time spent compressing response bodies", ("encoding",))
+compression_skipped = registry.counter("http_compression_skipped", "Responses sent uncompressed to a client that accepts compression", ("reason",))
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+def compressors(gzip_level=COMPRESSION_GZIP_LEVEL, brotli_quality=COMPRESSION_BROTLI_QUALITY, zstd_level=COMPRESSION_ZSTD_LEVEL):
+    """Encoding name -> compressor factory, for the encodings this process can produce"""
+    available = {"gzip": lambda: GzipCompressor(gzip_level)}
+    if brotli is not None:
+        available["br"] = lambda: BrotliCompressor(brotli_quality)
+    if zstandard is not None:
+        available["zstd"] = lambda: ZstdCompressor(zstd_level)
+    return available
+
+def negotiate(accept_encoding: str, encodings):
+    """The first of `encodings` with the highest q-value in Accept-Encoding, or None"""
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def _compress_whole(factory, body):
+    """Compressed body and the CPU seconds it took"""
+    started = time.thread_time()
+    compressor = factory()
+    compressed = compressor.compress(body) + compressor.finish()
+    return compressed, time.thread_time() - started
+
+def _skip_reason(headers, status, min_size):
+    """Why a response must go out as it is, or None when it may be compressed"""
+    if status < 200 or status in (204, 304):
+        return "status"
+    content_type = ""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return "encoded"
+        if name == b"content-type":
+            content_type = value.decode("latin-1").lower()
+        elif name == b"content-length" and int(value) < min_size:
+            return "small"
+    if content_type.startswith(EXCLUDED_TYPES) or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return "type"
+    return None
+
+def _compressed_headers(headers, encoding, length=None):
+    """Response headers for the compressed body. length=None drops Content-Length for a streamed body."""
+    result = []
+    vary = None
+    for name, value in headers:
+        if name == b"content-length":
+            continue
+        if name == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value
+        if name == b"vary":
+            vary = value
+            continue
+        result.append((name, value))
+    if vary is None:
+        vary = b"Accept-Encoding"
+    elif b"accept-encoding" not in vary.lower() and vary != b"*":
+        vary += b", Accept-Encoding"
+    result += [(b"vary", vary), (b"content-encoding", encoding.encode())]
+    if length is not None:
+        result.append((b"content-length", str(length).encode()))
+    return result
+
+class CompressionMiddleware:
+    """Pure ASGI middleware, so a streamed response is compressed chunk by chunk instead of buffered"""
+
+    def __init__(self, app, enabled=COMPRESSION_ENABLED, encodings=COMPRESSION_ENCODINGS, min_size=COMPRESSION_MIN_SIZE,
+                 thread_min_size=COMPRESSION_THREAD_MIN_SIZE, **levels):
+        self.app = app
+        self.enabled = enabled
+        self.min_size = min_size
+        self.thread_min_size = thread_min_size
+        self.factories = compressors(**levels)
+        self.encodings = [name.strip() for name in encodings.split(",") if name.strip() in self.factories]
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        factory = self.factories[encoding]
+        start = None
+        compressor = None
+        cpu_seconds = 0.0
+        input_bytes = output_bytes = 0
+
+        async def send_compressed(message):
+            nonlocal start, compressor, cpu_seconds, input_bytes, output_bytes
+            if message["type"] == "http.response.start":
+                reason = _skip_reason(message.get("headers", ()), message["status"], self.min_size)
+                if reason is not None:
+                    compression_skipped.inc(reason)
+                    await send(message)
+                else:
+                    # Held back until the first body chunk shows whether the body is streamed
+                    start = message
+                return
+            if message["type"] != "http.response.body" or (start is None and compressor is None):
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None and not more_body:
+                # Whole body in one message
+                status, headers = start["status"], start["headers"]
+                start = None
+                if len(body) < self.min_size:
+                    compression_skipped.inc("small")
+                    await send({"type": "http.response.start", "status": status, "headers": headers})
+                    await send(message)
+                    return
+                if len(body) >= self.thread_min_size:
+                    compressed, cpu = await asyncio.to_thread(_compress_whole, factory, body)
+                else:
+                    compressed, cpu = _compress_whole(factory, body)
+                compression_cpu_seconds.inc(encoding, amount=cpu)
+                if len(compressed) >= len(body):
+                    compression_skipped.inc("no_gain")
+                    await send({"type": "http.response.start", "status": status, "headers": headers})
+                    await send(message)
+                    return
+                compressed_responses.inc(encoding)
+                compression_input_bytes.inc(encoding, amount=len(body))
+                compression_output_bytes.inc(encoding, amount=len(compressed))
+                await send({
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": _compressed_headers(headers, encoding, len(compressed)),
+                })
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            if compressor is None:
+                # Streamed body: compress every chunk as it comes and flush it to the client
+                compressor = factory()
+                await send({
+                    "type": "http.response.start",
+                    "status": start["status"],
+                    "headers": _compressed_headers(start["headers"], encoding),
+                })
+                start = None
+            started = time.thread_time()
+            chunk = compressor.compress(body) + (compressor.flush() if more_body else compressor.finish())
+            cpu_seconds += time.thread_time() - started
+            input_bytes += len(body)
+            output_bytes += len(chunk)
+            if not more_body:
+                compressed_responses.inc(encoding)
+                compression_input_bytes.inc(encoding, amount=input_bytes)
+                compression_output_bytes.inc(encoding, amount=output_bytes)
+                compression_cpu_seconds.inc(encoding, amount=cpu_seconds)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,8 @@
+def etag_matches(if_none_match, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag, as used for GET/HEAD"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in if_none_match.split(","))
@@ -0,0 +1,273 @@
+"""Per-tenant ticket events pushed over Server-Sent Events.
+
+Events come from one of two sources, picked by EVENTS_SOURCE:
+
+* change_stream: a single change stream on the tickets collection, shared
+  by every subscriber of the process. Events written by any worker reach
+  every client. The stream's resume token is kept, so the watcher resumes
+  where it stopped after a transient failure. Deletes carry the tenant only
+  when pre-images are enabled on the collection, which start() attempts.
+* local: the write paths publish to an in-process bus. This needs no
+  replica set, but each worker only sees its own writes.
+
+"auto" (the default) uses the change stream when the deployment is a
+replica set or sharded cluster.
+
+Every event is encoded once and shared by all of the tenant's subscribers.
+A subscriber has a bounded queue. One that falls more than
+EVENTS_SUBSCRIBER_QUEUE_SIZE events behind is sent a "reset" event and
+disconnected rather than slowing down the publisher. The last
+EVENTS_REPLAY_SIZE events of each tenant are kept, so an EventSource that
+reconnects with Last-Event-ID gets what it missed. When the id is no
+longer known it gets a "reset" and should refetch the ticket list.
+"""
+from collections import deque
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import OperationFailure, PyMongoError
+from uuid import uuid4
+from app.db import db
+from app.metrics import registry
+from app.response_cache import response_cache
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+EVENTS_SOURCE = os.getenv("EVENTS_SOURCE", "auto")  # auto | change_stream | local
+EVENTS_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENTS_SUBSCRIBER_QUEUE_SIZE", "256"))
+EVENTS_REPLAY_SIZE = int(os.getenv("EVENTS_REPLAY_SIZE", "512"))
+EVENTS_MAX_SUBSCRIBERS_PER_TENANT = int(os.getenv("EVENTS_MAX_SUBSCRIBERS_PER_TENANT", "1000"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_RETRY_SECONDS = float(os.getenv("EVENTS_RETRY_SECONDS", "2"))
+
+TICKET_EVENT_FIELDS = ("title", "description", "status", "customer_id", "created_by", "created_at", "updated_at")
+# Change stream errors meaning the resume token has fallen off the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+events_published = registry.counter("ticket_events_published", "Ticket events published to subscribers", ("type",))
+events_dropped_subscribers = registry.counter("ticket_events_dropped_subscribers", "Subscribers disconnected for falling behind")
+events_subscribers = registry.gauge("ticket_events_subscribers", "Open ticket event streams")
+
+# Queue marker ending a stream
+CLOSED = object()
+
+class Reset:
+    """Queue item telling the client to refetch, then ending the stream"""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+def ticket_payload(ticket):
+    payload = {"id": str(ticket["_id"])}
+    payload.update({field: ticket[field] for field in TICKET_EVENT_FIELDS if field in ticket})
+    return payload
+
+def sse_frame(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(jsonable_encoder(data), separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+class Subscription:
+    def __init__(self, customer_id):
+        self.customer_id = customer_id
+        self.queue = asyncio.Queue(maxsize=EVENTS_SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, item):
+        """Queue an item; False when the subscriber is too far behind"""
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def interrupt(self, marker):
+        # Pending events are useless once the stream is being reset or closed
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(marker)
+
+class TicketEventBus:
+    def __init__(self, source: str):
+        self.source = source
+        self.mode = None
+        self._boot_id = uuid4().hex[:8]
+        self._seq = 0
+        self._subscribers = {}
+        self._replay = {}
+        self._task = None
+        self.draining = False
+
+    async def start(self):
+        if self.mode is not None:
+            return
+        self.draining = False
+        mode = self.source
+        if mode == "auto":
+            mode = "change_stream" if await db.supports_transactions() else "local"
+        self.mode = mode
+        if mode == "change_stream":
+            try:
+                await db.db.command("collMod", "tickets", changeStreamPreAndPostImages={"enabled": True})
+            except PyMongoError as e:
+                logger.warning("Could not enable pre-images on tickets, delete events will be skipped: %s", e)
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.disconnect_all()
+        self.mode = None
+
+    def disconnect_all(self):
+        """End every open stream; clients reconnect after the retry delay"""
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.interrupt(CLOSED)
+        self._subscribers.clear()
+        events_subscribers.set(0)
+
+    def drain(self):
+        """Close the streams of a worker that is shutting down, so they do not hold up the drain.
+
+        Streams opened from now on end straight away and their clients
+        reconnect, by then to another worker.
+        """
+        self.draining = True
+        self.disconnect_all()
+
+    def _reset_frame(self, customer_id):
+        # Carries the newest id, so a reconnecting client resumes from here and not from the unknown id
+        buffered = self._replay.get(customer_id)
+        event_id = buffered[-1][0] if buffered else ""
+        return sse_frame("reset", {"reason": "Events were missed; refetch the ticket list"}, event_id)
+
+    def _drop(self, subscription):
+        subscription.interrupt(Reset(self._reset_frame(subscription.customer_id)))
+        self.unsubscribe(subscription)
+        events_dropped_subscribers.inc()
+
+    def subscribe(self, customer_id, last_event_id=None):
+        """Register a subscriber. Returns (subscription, frames to replay first) or None when the tenant is full."""
+        subscription = Subscription(customer_id)
+        if self.draining:
+            subscription.interrupt(CLOSED)
+            return subscription, []
+        subscriptions = self._subscribers.setdefault(customer_id, set())
+        if len(subscriptions) >= EVENTS_MAX_SUBSCRIBERS_PER_TENANT:
+            return None
+        subscriptions.add(subscription)
+        events_subscribers.inc()
+
+        replay = []
+        if last_event_id:
+            buffered = self._replay.get(customer_id, ())
+            ids = [event_id for event_id, _ in buffered]
+            if last_event_id in ids:
+                replay = [frame for _, frame in list(buffered)[ids.index(last_event_id) + 1:]]
+            else:
+                replay = [self._reset_frame(customer_id)]
+        return subscription, replay
+
+    def unsubscribe(self, subscription):
+        subscriptions = self._subscribers.get(subscription.customer_id)
+        if subscriptions and subscription in subscriptions:
+            subscriptions.discard(subscription)
+            events_subscribers.dec()
+            if not subscriptions:
+                del self._subscribers[subscription.customer_id]
+
+    def publish(self, customer_id, event_type, ticket, event_id):
+        frame = sse_frame(event_type, ticket_payload(ticket), event_id)
+        self._replay.setdefault(customer_id, deque(maxlen=EVENTS_REPLAY_SIZE)).append((event_id, frame))
+        events_published.inc(event_type)
+        for subscription in list(self._subscribers.get(customer_id, ())):
+            if not subscription.offer(frame):
+                self._drop(subscription)
+
+    def emit(self, event_type, ticket):
+        """Publish from a write path; a no-op when the change stream is the source"""
+        if self.mode != "local":
+            return
+        self._seq += 1
+        self.publish(ticket["customer_id"], event_type, ticket, f"{self._boot_id}-{self._seq}")
+
+    def _publish_change(self, change):
+        operation = change["operationType"]
+        if operation == "delete":
+            ticket = change.get("fullDocumentBeforeChange")
+            event_type = "ticket.deleted"
+        else:
+            ticket = change.get("fullDocument")
+            event_type = "ticket.created" if operation == "insert" else "ticket.updated"
+        if ticket is None or "customer_id" not in ticket:
+            return
+        # Also carries other workers' writes to this worker's cached reads
+        response_cache.invalidate(ticket["customer_id"])
+        self.publish(ticket["customer_id"], event_type, ticket, change["_id"]["_data"])
+
+    async def _watch(self):
+        tickets = db.get_collection("tickets")
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        resume_token = None
+        while True:
+            try:
+                async with await tickets.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    full_document_before_change="whenAvailable",
+                    resume_after=resume_token,
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._publish_change(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                logger.warning("Ticket change stream failed: %s", e)
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # Events were lost for everyone; clients must refetch
+                    resume_token = None
+                    self._replay.clear()
+                    for subscriptions in list(self._subscribers.values()):
+                        for subscription in list(subscriptions):
+                            self._drop(subscription)
+                await asyncio.sleep(EVENTS_RETRY_SECONDS)
+            except PyMongoError as e:
+                logger.warning("Ticket change stream failed: %s", e)
+                await asyncio.sleep(EVENTS_RETRY_SECONDS)
+
+async def event_stream(bus, subscription, replay):
+    """SSE body: the replayed frames, then live events with periodic keepalives"""
+    try:
+        yield f"retry: {int(EVENTS_RETRY_SECONDS * 1000)}\n\n".encode()
+        for frame in replay:
+            yield frame
+        while True:
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield KEEPALIVE_FRAME
+                continue
+            if item is CLOSED:
+                return
+            if isinstance(item, Reset):
+                yield item.frame
+                return
+            yield item
+    finally:
+        bus.unsubscribe(subscription)
+
+# Global event bus
+ticket_events = TicketEventBus(EVENTS_SOURCE)
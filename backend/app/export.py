@@ -0,0 +1,52 @@
+from datetime import datetime
+import csv
+import io
+import json
+import os
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_COLUMNS = ["id", "title", "description", "status", "customer_id", "created_by", "created_at", "updated_at"]
+EXPORT_PROJECTION = {column: 1 for column in EXPORT_COLUMNS if column != "id"}
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def export_row(doc):
+    """Flatten a ticket document into export column order without model validation"""
+    row = []
+    for column in EXPORT_COLUMNS:
+        value = doc.get("_id" if column == "id" else column)
+        if column == "id":
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        row.append(value)
+    return row
+
+def _ndjson_chunk(rows):
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), separators=(",", ":"), default=str) + "\n"
+        for row in rows
+    ).encode()
+
+def _csv_chunk(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+async def stream_export(cursor, format, batch_size):
+    """Yield the cursor's documents as encoded NDJSON or CSV, one chunk per batch"""
+    encode = _ndjson_chunk if format == "ndjson" else _csv_chunk
+    if format == "csv":
+        yield _csv_chunk([EXPORT_COLUMNS])
+
+    rows = []
+    async for doc in cursor:
+        rows.append(export_row(doc))
+        if len(rows) >= batch_size:
+            yield encode(rows)
+            rows = []
+    if rows:
+        yield encode(rows)
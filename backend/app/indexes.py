@@ -0,0 +1,200 @@
+"""Declarative index registry.
+
+Every index the API relies on is declared here and created idempotently at
+startup. The module doubles as a CLI for comparing the declaration with the
+live database:
+
+    python -m app.indexes diff      # exit status 1 when something is missing or changed
+    python -m app.indexes apply
+    python -m app.indexes explain   # index used by each hot query
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from app.db import db
+from app.outbox import OUTBOX_COLLECTION
+from app.webhook_batch import IDEMPOTENCY_COLLECTION, WEBHOOK_IDEMPOTENCY_TTL_SECONDS
+from app.ratelimit import RATE_LIMIT_COLLECTION, RATE_LIMIT_COUNTER_TTL_SECONDS
+from app.archive import ARCHIVE_COLLECTION
+from app.tokens import REFRESH_COLLECTION, REVOCATION_COLLECTION
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Options that make two indexes with the same keys behave differently
+COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="tenant_created"),
+        # Admin user list filtered by role
+        IndexModel([("customer_id", ASCENDING), ("role", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="tenant_role_created"),
+    ],
+    "tickets": [
+        # Keyset pagination and the default ticket list
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="tenant_created"),
+        IndexModel([("customer_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="tenant_status_created"),
+        IndexModel([("customer_id", ASCENDING), ("created_by", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="tenant_creator_created"),
+        # Ticket search; the customer_id prefix partitions the text index by tenant
+        IndexModel([("customer_id", ASCENDING), ("title", TEXT), ("description", TEXT)], name="tenant_text",
+                   weights={"title": 5, "description": 1}, default_language="english"),
+    ],
+    ARCHIVE_COLLECTION: [
+        # include_archived=true pages through the archive like the hot list
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="tenant_created"),
+    ],
+    REFRESH_COLLECTION: [
+        IndexModel([("family", ASCENDING)], name="family"),
+        IndexModel([("sub", ASCENDING)], name="sub"),
+        IndexModel([("expires_at", ASCENDING)], name="expire", expireAfterSeconds=0),
+    ],
+    REVOCATION_COLLECTION: [
+        # A revocation is dropped once every token it covers has expired
+        IndexModel([("expires_at", ASCENDING)], name="expire", expireAfterSeconds=0),
+    ],
+    OUTBOX_COLLECTION: [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_due"),
+        IndexModel([("claim_id", ASCENDING)], name="claim", sparse=True),
+    ],
+    IDEMPOTENCY_COLLECTION: [
+        # Webhook event keys are forgotten after the TTL
+        IndexModel([("created_at", ASCENDING)], name="expire", expireAfterSeconds=WEBHOOK_IDEMPOTENCY_TTL_SECONDS),
+    ],
+    RATE_LIMIT_COLLECTION: [
+        # Shared counters of keys no worker has used for a while
+        IndexModel([("updated_at", ASCENDING)], name="expire", expireAfterSeconds=RATE_LIMIT_COUNTER_TTL_SECONDS),
+    ],
+}
+
+# Queries on the request path and the index each one must use. Lookups by
+# _id plus customer_id (get_ticket, the n8n webhook) are served by _id_.
+HOT_QUERIES = [
+    ("tickets", {"customer_id": "TenantA"}, [("created_at", DESCENDING), ("_id", DESCENDING)], "tenant_created"),
+    ("tickets", {"customer_id": "TenantA", "status": "Open"}, [("created_at", DESCENDING), ("_id", DESCENDING)], "tenant_status_created"),
+    ("tickets", {"customer_id": "TenantA", "created_by": "user@tenantA.com"}, [("created_at", DESCENDING), ("_id", DESCENDING)], "tenant_creator_created"),
+    ("tickets", {"customer_id": "TenantA", "$text": {"$search": "login"}}, None, "tenant_text"),
+    ("users", {"email": "admin@tenantA.com"}, None, "email_unique"),
+    ("users", {"customer_id": "TenantA"}, [("created_at", DESCENDING), ("_id", DESCENDING)], "tenant_created"),
+    ("users", {"customer_id": "TenantA", "role": "Admin"}, [("created_at", DESCENDING), ("_id", DESCENDING)], "tenant_role_created"),
+]
+
+async def ensure_indexes():
+    """Create every declared index. Existing identical indexes are left untouched."""
+    for collection_name, models in INDEXES.items():
+        collection = db.get_collection(collection_name)
+        # One at a time so a single bad index does not block the others
+        for model in models:
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                # A conflicting definition or duplicate data must not stop the API from starting
+                logger.error("Index creation failed for %s.%s: %s", collection_name, model.document["name"], e)
+
+def _index_spec(document):
+    key = []
+    text_fields = []
+    for field, direction in dict(document["key"]).items():
+        if field == "_fts":
+            # The server reports text indexes as _fts/_ftsx keys plus a weights map
+            text_fields.extend(document.get("weights", {}))
+        elif direction == TEXT:
+            text_fields.append(field)
+        elif field != "_ftsx":
+            key.append((field, direction))
+    spec = {"key": key}
+    if text_fields:
+        weights = document.get("weights", {})
+        spec["text"] = {field: weights.get(field, 1) for field in sorted(text_fields)}
+    for option in COMPARED_OPTIONS:
+        if option in document:
+            spec[option] = document[option]
+    return spec
+
+def diff_indexes():
+    """Compare declared indexes with the live ones.
+
+    Returns {collection: {"missing": [...], "changed": [...], "extra": [...]}}
+    for every collection that differs.
+    """
+    report = {}
+    for collection_name, models in INDEXES.items():
+        live = db.get_sync_collection(collection_name).index_information()
+        live.pop("_id_", None)
+        declared = {model.document["name"]: _index_spec(model.document) for model in models}
+        live_specs = {name: _index_spec(info) for name, info in live.items()}
+
+        missing = sorted(name for name in declared if name not in live_specs)
+        changed = sorted(name for name in declared if name in live_specs and declared[name] != live_specs[name])
+        extra = sorted(name for name in live_specs if name not in declared)
+        if missing or changed or extra:
+            report[collection_name] = {"missing": missing, "changed": changed, "extra": extra}
+    return report
+
+def apply_indexes():
+    for collection_name, models in INDEXES.items():
+        db.get_sync_collection(collection_name).create_indexes(models)
+
+def winning_plan_indexes(explain):
+    """Names of the indexes scanned by an explain() result's winning plan ("COLLSCAN" for a full scan)"""
+    plan = explain["queryPlanner"]["winningPlan"]
+    plan = plan.get("queryPlan", plan)
+    found = []
+    stack = [plan]
+    while stack:
+        stage = stack.pop()
+        if stage.get("stage") == "COLLSCAN":
+            found.append("COLLSCAN")
+        if "indexName" in stage:
+            found.append(stage["indexName"])
+        if "inputStage" in stage:
+            stack.append(stage["inputStage"])
+        stack.extend(stage.get("inputStages", []))
+    return found
+
+def explain_hot_queries():
+    """[(collection, filter, expected index, indexes used)] for every hot query"""
+    results = []
+    for collection_name, query, sort, expected in HOT_QUERIES:
+        cursor = db.get_sync_collection(collection_name).find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        results.append((collection_name, query, expected, winning_plan_indexes(cursor.explain())))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the declared MongoDB indexes")
+    parser.add_argument("command", choices=["diff", "apply", "explain"])
+    args = parser.parse_args(argv)
+
+    if args.command == "apply":
+        apply_indexes()
+        print("Indexes applied")
+        return 0
+
+    if args.command == "explain":
+        failures = 0
+        for collection_name, query, expected, used in explain_hot_queries():
+            if "COLLSCAN" in used or not used:
+                outcome = "FAIL"
+                failures += 1
+            else:
+                # The planner may legitimately pick another declared index on tiny collections
+                outcome = "ok  " if expected in used else "warn"
+            print(f"{outcome} {collection_name} {query}: expected {expected}, used {', '.join(used) or 'nothing'}")
+        return 1 if failures else 0
+
+    report = diff_indexes()
+    if not report:
+        print("Indexes match the declaration")
+        return 0
+    for collection_name, changes in report.items():
+        for kind in ("missing", "changed", "extra"):
+            for name in changes[kind]:
+                print(f"{kind:8} {collection_name}.{name}")
+    # Extra indexes are reported but do not fail the check
+    return 1 if any(changes["missing"] or changes["changed"] for changes in report.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Graceful drain of a worker on SIGTERM.
+
+uvicorn (alone or as a gunicorn worker) handles SIGTERM by closing the
+listening socket, waiting for in-flight requests and then running the
+lifespan shutdown. Two things would get in the way. Load balancers keep
+routing to the worker until its readiness probe fails, and open SSE streams
+never finish on their own, so the wait lasts until the graceful timeout.
+
+lifecycle.install() is called from the lifespan, after the server has set
+up its own handlers, and wraps them. On the first SIGTERM or SIGINT it
+marks the worker as draining, which makes /health/ready answer 503, and it
+runs the registered drain callbacks. It then hands the signal to the
+server after DRAIN_DELAY_SECONDS. Keep that delay below gunicorn's
+graceful_timeout. A second signal is passed on at once.
+"""
+import asyncio
+import logging
+import os
+import signal
+import threading
+
+logger = logging.getLogger(__name__)
+
+DRAIN_DELAY_SECONDS = float(os.getenv("DRAIN_DELAY_SECONDS", "0"))
+DRAIN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+class Lifecycle:
+    def __init__(self, drain_delay: float):
+        self.drain_delay = drain_delay
+        self.draining = False
+        self._signalled = False
+        self._callbacks = []
+        self._previous = {}
+        self._loop = None
+
+    def on_drain(self, callback):
+        self._callbacks.append(callback)
+
+    def install(self):
+        self.draining = False
+        self._signalled = False
+        self._loop = asyncio.get_running_loop()
+        # Signal handlers can only be set from the main thread; TestClient runs the lifespan elsewhere
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for sig in DRAIN_SIGNALS:
+            self._previous[sig] = signal.signal(sig, self._handle)
+
+    def uninstall(self):
+        for sig, handler in self._previous.items():
+            signal.signal(sig, handler)
+        self._previous.clear()
+
+    def _handle(self, sig, frame):
+        if self._signalled:
+            self._forward(sig, frame)
+            return
+        self._signalled = True
+        self._loop.call_soon_threadsafe(self.drain)
+        if self.drain_delay > 0:
+            self._loop.call_soon_threadsafe(self._loop.call_later, self.drain_delay, self._forward, sig, frame)
+        else:
+            self._forward(sig, frame)
+
+    def _forward(self, sig, frame):
+        previous = self._previous.get(sig, signal.SIG_DFL)
+        if callable(previous):
+            previous(sig, frame)
+        elif previous == signal.SIG_DFL:
+            signal.signal(sig, previous)
+            signal.raise_signal(sig)
+
+    def drain(self):
+        if self.draining:
+            return
+        self.draining = True
+        logger.info("Draining worker", extra={"pid": os.getpid()})
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.exception("Drain callback failed")
+
+# Global lifecycle of this worker
+lifecycle = Lifecycle(DRAIN_DELAY_SECONDS)
@@ -0,0 +1,175 @@
+"""Structured logging that stays off the request path.
+
+setup_logging() routes every record through a QueueHandler. The request
+thread only resolves the message and copies the request context (request
+id, tenant, method, route) onto the record. A QueueListener thread then
+formats it as one JSON object per line and writes it to stdout. The queue
+is bounded by LOG_QUEUE_SIZE. When it is full, records are dropped and counted rather than
+slowing requests down.
+
+Settings:
+
+    LOG_LEVEL=INFO                                  root level
+    LOG_LEVELS=app.outbox=DEBUG,app.events=WARNING  per-module levels
+    LOG_DEBUG_SAMPLE_RATES=app.ratelimit=0.01       share of DEBUG records kept, per module
+    LOG_FORMAT=json                                 json | text
+    LOG_ACCESS=true                                 one app.access record per request
+
+Modules log through logging.getLogger(__name__) as usual. Extra fields
+passed as extra={...} end up as keys of the JSON object.
+"""
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from app.metrics import registry
+from app.middleware import current_request_stats, route_template
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import traceback
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_DEBUG_SAMPLE_RATES = os.getenv("LOG_DEBUG_SAMPLE_RATES", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_ACCESS = os.getenv("LOG_ACCESS", "true").lower() == "true"
+
+# LogRecord attributes that are not user supplied extras
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+CONTEXT_FIELDS = ("request_id", "tenant", "method", "route")
+
+log_records_dropped = registry.counter("log_records_dropped", "Log records dropped because the log queue was full")
+
+def parse_pairs(value):
+    """"a=1,b=2" -> {"a": "1", "b": "2"}"""
+    pairs = {}
+    for item in value.split(","):
+        name, separator, setting = item.partition("=")
+        if separator and name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+class ContextFilter(logging.Filter):
+    """Copies the current request's context onto records, in the thread that logs them"""
+
+    def filter(self, record):
+        stats = current_request_stats()
+        if stats is not None and not hasattr(record, "request_id"):
+            record.request_id = stats.request_id
+            record.tenant = stats.tenant
+            record.method = stats.method
+            record.route = route_template(stats.scope)
+        return True
+
+class DebugSampler(logging.Filter):
+    """Keeps only a share of DEBUG records, per logger name prefix"""
+
+    def __init__(self, rates):
+        super().__init__()
+        # Longest prefix first, so app.outbox.x matches app.outbox before app
+        self.rates = sorted(((name, float(rate)) for name, rate in rates.items()), key=lambda item: -len(item[0]))
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG or not self.rates:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                return rate >= 1 or random.random() < rate
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler over a SimpleQueue, which never takes a lock in the request thread, with a soft bound"""
+
+    def __init__(self, max_size):
+        super().__init__(queue.SimpleQueue())
+        self.max_size = max_size
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_size:
+            log_records_dropped.inc()
+            return
+        self.queue.put_nowait(record)
+
+    def prepare(self, record):
+        # Only the message is resolved here, so later changes to the arguments cannot alter it.
+        # Formatting is left to the listener thread. This is the root's only handler, so the
+        # record is not copied.
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and key not in CONTEXT_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode()
+        return json.dumps(entry, default=str)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+def setup_logging(stream=None):
+    """Install the queue handler on the root logger and start the listener. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(LOG_QUEUE_SIZE)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(DebugSampler(parse_pairs(LOG_DEBUG_SAMPLE_RATES)))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+    # uvicorn's loggers propagate to the root through the same queue
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+    # app.access replaces the server's access log, which has no tenant or duration
+    logging.getLogger("uvicorn.access").disabled = True
+    logging.getLogger("app.access").disabled = not LOG_ACCESS
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+def shutdown_logging():
+    """Write out whatever is still queued"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,11 +1,74 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import admin, tickets, webhook, me
+from app.routes import admin, tickets, webhook, me, health
 from app import auth
+from app.db import db
+from app.outbox import dispatcher
+from app.indexes import ensure_indexes
+from app.registry import screen_registry
+from app.events import ticket_events
+from app.webhook_batch import webhook_batcher
+from app.lifecycle import lifecycle
+from app.pagination import NEXT_CURSOR_HEADER
+from app.middleware import MetricsMiddleware
+from app.compression import CompressionMiddleware
+from app.ratelimit import RateLimitMiddleware, rate_limiter
+from app.metrics import registry
+from app.profiler import slow_request_profiler
+from app.passwords import password_hasher
+from app.response_cache import response_cache
+from app.archive import archiver
+from app.tokens import revocations, verified_tokens
+from app.log import setup_logging
 import uvicorn
-from app.seed_data import seed_data
+import asyncio
+import os
+import signal
 
-app = FastAPI()
+# Open event streams would otherwise hold a draining worker until the graceful timeout
+lifecycle.on_drain(ticket_events.drain)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared connection pool on the server's event loop
+    await db.connect()
+    if os.getenv("INDEXES_ENSURE_ON_STARTUP", "true").lower() == "true":
+        await ensure_indexes()
+    if os.getenv("OUTBOX_DISPATCHER_ENABLED", "true").lower() == "true":
+        await dispatcher.start()
+    screen_registry.start()
+    await ticket_events.start()
+    await webhook_batcher.start()
+    await rate_limiter.start()
+    await archiver.start()
+    await revocations.start()
+    slow_request_profiler.start()
+    # `kill -HUP` reloads registry.json without waiting for the mtime check
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, screen_registry.reload)
+    except (NotImplementedError, RuntimeError, ValueError, AttributeError):
+        pass
+    lifecycle.install()
+    try:
+        yield
+    finally:
+        lifecycle.uninstall()
+        await archiver.stop()
+        await revocations.stop()
+        await rate_limiter.stop()
+        await webhook_batcher.stop()
+        await ticket_events.stop()
+        await screen_registry.stop()
+        await dispatcher.stop()
+        await db.close()
+
+setup_logging()
+
+app = FastAPI(lifespan=lifespan)
+
+# Innermost, so 429 responses still carry CORS headers and are counted by the metrics
+app.add_middleware(RateLimitMiddleware)
 
 # CORS configuration
 app.add_middleware(
@@ -14,28 +77,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Retry-After", "ETag", "X-Request-ID"],
 )
 
+# Around everything but the metrics, which then see the bytes actually sent
+app.add_middleware(CompressionMiddleware)
+
+# Outermost, so latency covers CORS handling too
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(admin.router, prefix="/admin", tags=["admin"])
 app.include_router(tickets.router, prefix="/api/tickets", tags=["tickets"])
 app.include_router(webhook.router, prefix="/webhook", tags=["webhook"])
 app.include_router(me.router, prefix="/me", tags=["me"])
+app.include_router(health.router, prefix="/health", tags=["health"])
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Flowbit Multitenant App API!"}
 
-@app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+principal_cache_entries = registry.gauge("auth_principal_cache_entries", "Principals held in the auth cache")
+principal_cache_lookups = registry.gauge("auth_principal_cache_lookups", "Principal cache lookups since start", ("result",))
+password_hash_queue_depth = registry.gauge("password_hash_queue_depth", "Password operations waiting for a hashing worker")
+password_hash_in_flight = registry.gauge("password_hash_in_flight", "Password operations running or queued")
+password_hash_rejected = registry.gauge("password_hash_rejected", "Password operations rejected because the queue was full")
+response_cache_entries = registry.gauge("response_cache_entries", "Ticket responses held in the response cache")
+response_cache_bytes = registry.gauge("response_cache_bytes", "Bytes of ticket responses held in the response cache")
+response_cache_lookups = registry.gauge("response_cache_lookups", "Response cache lookups since start", ("result",))
+token_cache_entries = registry.gauge("auth_token_cache_entries", "Verified access tokens held in memory")
+token_cache_lookups = registry.gauge("auth_token_cache_lookups", "Verified token cache lookups since start", ("result",))
+token_revocations = registry.gauge("auth_token_revocations", "Revoked tokens and users held in memory", ("kind",))
+
+def collect_component_stats():
+    cache_stats = auth.principal_cache.stats()
+    principal_cache_entries.set(cache_stats["size"])
+    principal_cache_lookups.set(cache_stats["hits"], "hit")
+    principal_cache_lookups.set(cache_stats["misses"], "miss")
+    hasher_stats = password_hasher.stats()
+    password_hash_queue_depth.set(hasher_stats["queue_depth"])
+    password_hash_in_flight.set(hasher_stats["in_flight"])
+    password_hash_rejected.set(hasher_stats["rejected"])
+    rate_limiter.collect_metrics()
+    response_stats = response_cache.stats()
+    response_cache_entries.set(response_stats["entries"])
+    response_cache_bytes.set(response_stats["bytes"])
+    for result in ("hits", "not_modified", "misses"):
+        response_cache_lookups.set(response_stats[result], result)
+    token_cache_entries.set(len(verified_tokens))
+    token_cache_lookups.set(verified_tokens.hits, "hit")
+    token_cache_lookups.set(verified_tokens.misses, "miss")
+    token_revocations.set(len(revocations.jtis), "token")
+    token_revocations.set(len(revocations.users), "user")
+
+registry.add_collector(collect_component_stats)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
-    # Seed data on startup
-    try:
-        seed_data()
-    except Exception as e:
-        print(f"Database seeding failed: {e}")
-    
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Development server; production runs gunicorn.conf.py and seeds with `python -m app.seed_data`
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1 +1,143 @@
-# This file is now intentionally left blank. All JWT and RBAC logic is handled in auth.py and rbac.py.
\ No newline at end of file
+"""Request instrumentation.
+
+MetricsMiddleware records per-route latency, response size and in-flight
+requests, and attributes MongoDB commands to the request that issued them
+through a context variable updated by MongoCommandMetrics. Slow requests
+can optionally be profiled with the sampling profiler in app.profiler.
+
+The same per-request object carries the request id (X-Request-ID, taken
+from the client or generated) and the tenant once authenticated. Every log
+record emitted during the request is tagged with them, and the request
+ends with one app.access record.
+"""
+from contextvars import ContextVar
+from pymongo import monitoring
+from uuid import uuid4
+from app.metrics import (
+    http_in_flight, http_request_duration, http_requests, http_response_size,
+    mongo_command_duration, mongo_commands, mongo_commands_per_request,
+)
+from app.profiler import slow_request_profiler
+import logging
+import time
+
+access_logger = logging.getLogger("app.access")
+
+REQUEST_ID_HEADER = b"x-request-id"
+MAX_REQUEST_ID_LENGTH = 128
+
+class RequestStats:
+    __slots__ = ("mongo_commands", "mongo_seconds", "request_id", "tenant", "method", "scope")
+
+    def __init__(self, request_id=None, method=None, scope=None):
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.request_id = request_id
+        self.tenant = None
+        self.method = method
+        self.scope = scope
+
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+def current_request_stats():
+    """Stats of the request being handled, or None outside a request"""
+    return _request_stats.get()
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Counts and times every command sent by the clients it is registered on"""
+
+    def started(self, event):
+        pass
+
+    def _record(self, event, outcome):
+        seconds = event.duration_micros / 1_000_000
+        mongo_commands.inc(event.command_name, outcome)
+        mongo_command_duration.observe(seconds, event.command_name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.mongo_commands += 1
+            stats.mongo_seconds += seconds
+
+    def succeeded(self, event):
+        self._record(event, "success")
+
+    def failed(self, event):
+        self._record(event, "failure")
+
+mongo_command_listener = MongoCommandMetrics()
+
+def request_id_of(scope):
+    """The client's X-Request-ID when it is reasonable, otherwise a new one"""
+    for name, value in scope["headers"]:
+        if name == REQUEST_ID_HEADER:
+            if 0 < len(value) <= MAX_REQUEST_ID_LENGTH:
+                return value.decode("latin-1")
+            break
+    return uuid4().hex
+
+def route_template(scope):
+    """Path template of the matched route (e.g. /api/tickets/{ticket_id}), keeping label cardinality bounded"""
+    # Newer FastAPI keeps included routes un-prefixed and records the full path separately
+    if scope is None:
+        return None
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so it adds no extra task or response buffering per request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = request_id_of(scope)
+        stats = RequestStats(request_id, scope["method"], scope)
+        token = _request_stats.set(stats)
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", ()), (REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        wall_started = time.time()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            _request_stats.reset(token)
+
+            route_path = route_template(scope)
+            method = scope["method"]
+            http_requests.inc(method, route_path, str(status_code))
+            http_request_duration.observe(elapsed, method, route_path)
+            http_response_size.observe(size, method, route_path)
+            mongo_commands_per_request.observe(stats.mongo_commands, route_path)
+            slow_request_profiler.request_finished(method, route_path, wall_started, elapsed)
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info(
+                    "%s %s %s", method, route_path, status_code,
+                    extra={
+                        "request_id": request_id,
+                        "tenant": stats.tenant,
+                        "method": method,
+                        "route": route_path,
+                        "status": status_code,
+                        "duration_ms": round(elapsed * 1000, 3),
+                        "response_bytes": size,
+                        "mongo_commands": stats.mongo_commands,
+                    },
+                )
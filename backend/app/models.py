@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List, Literal
 from datetime import datetime
 
 class MongoBaseModel(BaseModel):
@@ -11,10 +11,11 @@ class MongoBaseModel(BaseModel):
 class User(MongoBaseModel):
     id: Optional[str] = Field(None, alias="_id")
     email: str
-    hashed_password: str
+    # Never loaded for authenticated principals
+    hashed_password: Optional[str] = None
     customer_id: str
     role: str = "User"
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
 
 class UserResponse(BaseModel):
     """User model without sensitive data"""
@@ -53,6 +54,63 @@ class TicketResponse(BaseModel):
     created_at: datetime
     updated_at: Optional[datetime] = None
 
+class TicketSearchResult(TicketResponse):
+    score: float
+    # Character spans of the matched words, per field
+    highlights: Dict[str, List[List[int]]]
+
+class DailyCount(BaseModel):
+    date: str
+    count: int
+
+class TicketStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    created_per_day: List[DailyCount]
+    closed_count: int
+    mean_time_to_close_seconds: Optional[float] = None
+    updated_at: Optional[datetime] = None
+
+class BulkTicketOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None          # update and delete
+    ticket: Optional[TicketCreate] = None   # create
+    changes: Optional[TicketUpdate] = None  # update
+
+class BulkTicketRequest(BaseModel):
+    operations: List[BulkTicketOperation]
+    ordered: bool = True
+
+class BulkTicketResult(BaseModel):
+    index: int
+    op: str
+    status: Literal["ok", "error", "skipped"]
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkTicketResponse(BaseModel):
+    created: int
+    updated: int
+    deleted: int
+    failed: int
+    results: List[BulkTicketResult]
+
+class UserImportError(BaseModel):
+    line: int
+    email: Optional[str] = None
+    error: str
+
+class UserImportReport(BaseModel):
+    rows: int
+    created: int
+    updated: int
+    skipped: int      # already registered in the tenant
+    duplicates: int   # repeated in the file
+    failed: int
+    chunks: int
+    truncated: bool
+    errors: List[UserImportError]
+
 class UseCase(MongoBaseModel):
     tenant: str
     screen_url: str
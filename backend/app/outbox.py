@@ -0,0 +1,236 @@
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from bson import ObjectId
+from datetime import datetime, timedelta
+from uuid import uuid4
+from app.db import db
+from app.metrics import n8n_dispatch_duration
+import asyncio
+import httpx
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "n8n_outbox"
+DEAD_LETTER_COLLECTION = "n8n_outbox_dead_letter"
+
+# Dispatcher tuning
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "10"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "1.0"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "1.0"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_HTTP_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_HTTP_TIMEOUT_SECONDS", "5"))
+
+def build_workflow_payload(ticket_data):
+    return {
+        "ticket_id": ticket_data["id"],
+        "customer_id": ticket_data["customer_id"],
+        "title": ticket_data["title"],
+        "description": ticket_data["description"],
+        "status": ticket_data["status"],
+    }
+
+def backoff_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts"""
+    delay = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+def outbox_record(ticket_data, now):
+    return {
+        "ticket_id": ticket_data["_id"],
+        "customer_id": ticket_data["customer_id"],
+        "payload": build_workflow_payload({**ticket_data, "id": str(ticket_data["_id"])}),
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+
+async def enqueue_workflows(ticket_docs, session=None):
+    """Write outbox records for already-inserted tickets and wake the dispatcher"""
+    if not ticket_docs:
+        return
+    now = datetime.utcnow()
+    records = [outbox_record(ticket_data, now) for ticket_data in ticket_docs]
+    await db.get_collection(OUTBOX_COLLECTION).insert_many(records, ordered=False, session=session)
+    dispatcher.notify()
+
+async def insert_ticket_with_outbox(ticket_data, also=None):
+    """Insert a ticket together with the outbox record that dispatches it to n8n.
+
+    Both writes share a transaction when the deployment supports one (replica
+    set or sharded cluster). On a standalone server the outbox record is
+    written right after the ticket. `also(session)` runs in the same
+    transaction for writes that must accompany the ticket.
+    """
+    ticket_data["_id"] = ObjectId()
+    tickets = db.get_collection("tickets")
+
+    async def write(session):
+        await tickets.insert_one(ticket_data, session=session)
+        await enqueue_workflows([ticket_data], session=session)
+        if also is not None:
+            await also(session)
+
+    await db.run_in_transaction(write)
+    return ticket_data["_id"]
+
+class OutboxDispatcher:
+    """Background worker that delivers outbox records to n8n.
+
+    Records are claimed in batches with a lease so several workers can run
+    side by side, posted concurrently over a pooled HTTP client, retried with
+    exponential backoff and moved to the dead-letter collection once they
+    run out of attempts.
+    """
+
+    def __init__(self):
+        self.url = os.getenv("N8N_API_URL", "http://n8n:5678/webhook/flowbit-ticket")
+        self.secret = os.getenv("N8N_WEBHOOK_SECRET", "your_n8n_webhook_secret")
+        self._http = None
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+
+    async def start(self):
+        self._http = httpx.AsyncClient(
+            timeout=OUTBOX_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=OUTBOX_CONCURRENCY,
+                max_keepalive_connections=OUTBOX_CONCURRENCY,
+            ),
+            headers={"X-Shared-Secret": self.secret},
+        )
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def notify(self):
+        """Wake the worker so a freshly enqueued record is sent without waiting for the next poll"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Outbox dispatch round failed")
+                delivered = 0
+
+            # A full batch means more work is probably waiting
+            if delivered < OUTBOX_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim_batch(self):
+        outbox = db.get_collection(OUTBOX_COLLECTION)
+        now = datetime.utcnow()
+        due = {
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "in_flight", "lease_until": {"$lt": now}},
+            ]
+        }
+        ids = [
+            doc["_id"]
+            async for doc in outbox.find(due, {"_id": 1}).sort("next_attempt_at", 1).limit(OUTBOX_BATCH_SIZE)
+        ]
+        if not ids:
+            return []
+
+        claim_id = uuid4().hex
+        await outbox.update_many(
+            {"_id": {"$in": ids}, **due},
+            {"$set": {
+                "status": "in_flight",
+                "claim_id": claim_id,
+                "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+            }},
+        )
+        return await outbox.find({"claim_id": claim_id}).to_list(None)
+
+    async def _deliver(self, record):
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await self._http.post(self.url, json=record["payload"])
+                response.raise_for_status()
+                n8n_dispatch_duration.observe(time.perf_counter() - started, "success")
+                return None
+            except Exception as e:
+                n8n_dispatch_duration.observe(time.perf_counter() - started, "failure")
+                return str(e) or e.__class__.__name__
+
+    async def dispatch_once(self):
+        """Claim one batch, deliver it and record the outcome. Returns the batch size."""
+        records = await self._claim_batch()
+        if not records:
+            return 0
+
+        errors = await asyncio.gather(*(self._deliver(record) for record in records))
+
+        now = datetime.utcnow()
+        operations = []
+        dead_letters = []
+        for record, error in zip(records, errors):
+            claimed = {"_id": record["_id"], "claim_id": record["claim_id"]}
+            if error is None:
+                operations.append(DeleteOne(claimed))
+                continue
+
+            attempts = record["attempts"] + 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                # Replaced rather than inserted: the record may already be there from a round whose outbox delete failed
+                dead_letters.append(ReplaceOne(
+                    {"_id": record["_id"]},
+                    {**record, "attempts": attempts, "last_error": error, "failed_at": now},
+                    upsert=True,
+                ))
+                operations.append(DeleteOne(claimed))
+            else:
+                operations.append(UpdateOne(
+                    claimed,
+                    {"$set": {
+                        "status": "pending",
+                        "attempts": attempts,
+                        "last_error": error,
+                        "next_attempt_at": now + timedelta(seconds=backoff_delay(attempts)),
+                    }, "$unset": {"claim_id": "", "lease_until": ""}},
+                ))
+
+        if dead_letters:
+            await db.get_collection(DEAD_LETTER_COLLECTION).bulk_write(dead_letters, ordered=False)
+        await db.get_collection(OUTBOX_COLLECTION).bulk_write(operations, ordered=False)
+
+        failed = sum(1 for error in errors if error is not None)
+        if failed:
+            logger.warning(
+                "N8N workflow dispatch: %d sent, %d failed, %d dead-lettered", len(records) - failed, failed, len(dead_letters),
+                extra={"sent": len(records) - failed, "failed": failed, "dead_lettered": len(dead_letters)},
+            )
+        return len(records)
+
+# Global dispatcher instance
+dispatcher = OutboxDispatcher()
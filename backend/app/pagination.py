@@ -0,0 +1,48 @@
+from fastapi import HTTPException
+from bson import ObjectId
+from datetime import datetime
+import base64
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(sort_value: datetime, doc_id: ObjectId) -> str:
+    """Opaque cursor pointing just past the given (sort value, _id) position"""
+    raw = json.dumps({"t": sort_value.isoformat(), "id": str(doc_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        return datetime.fromisoformat(position["t"]), ObjectId(position["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(cursor: str, descending: bool, field: str = "created_at"):
+    """Query that resumes a (field, _id) ordered scan after the cursor position"""
+    sort_value, doc_id = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {field: {op: sort_value}},
+        {field: sort_value, "_id": {op: doc_id}},
+    ]}
+
+def keyset_sort(descending: bool, field: str = "created_at"):
+    direction = -1 if descending else 1
+    return [(field, direction), ("_id", direction)]
+
+def encode_offset_cursor(offset: int) -> str:
+    """Opaque cursor for result sets that can only be resumed by position (ranked search)"""
+    raw = json.dumps({"o": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        offset = json.loads(raw)["o"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
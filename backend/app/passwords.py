@@ -0,0 +1,81 @@
+from fastapi import HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+import asyncio
+import os
+
+# bcrypt cost factor. Hashes with a different cost are rehashed on the next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so a thread pool hashes on several cores in parallel
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Operations allowed to wait for a worker before new ones are rejected with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so hashing never blocks the event loop"""
+
+    def __init__(self, workers: int, max_pending: int, context: CryptContext = pwd_context):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Operations submitted and not finished yet (running or queued)
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args, wait=False):
+        if self.pending >= self.max_pending and not wait:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many concurrent password operations",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def hash_many(self, passwords, concurrency: int):
+        """Hash a batch with at most `concurrency` hashes in the pool at once.
+
+        A batch waits for the pool instead of being rejected, and leaves the
+        remaining workers to interactive requests.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def hash_one(password):
+            async with semaphore:
+                return await self._run(self.context.hash, password, wait=True)
+
+        return await asyncio.gather(*(hash_one(password) for password in passwords))
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """Returns (valid, new_hash). new_hash is set when the stored hash uses an outdated cost."""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_depth": max(0, self.pending - self.workers),
+            "in_flight": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+# Global hasher instance
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
@@ -0,0 +1,78 @@
+"""Opt-in sampling profiler for slow requests.
+
+When PROFILE_SLOW_REQUEST_MS is set, a daemon thread samples the event
+loop thread's stack every PROFILE_SAMPLE_INTERVAL_MS into a short ring
+buffer. When a request takes longer than the threshold, the samples taken
+while it ran are written to PROFILE_DIR in the folded format read by
+flamegraph.pl and speedscope. All requests share the event loop thread, so
+the samples show everything the loop did during that window, not only the
+slow request.
+"""
+from collections import Counter, deque
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_RETENTION_SECONDS = float(os.getenv("PROFILE_RETENTION_SECONDS", "30"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+def _folded_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms: float, interval_ms: float, retention_seconds: float, output_dir: str):
+        self.enabled = threshold_ms > 0
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self._samples = deque(maxlen=max(1, int(retention_seconds / self.interval)))
+        self._thread = None
+        self._target = None
+
+    def start(self):
+        """Begin sampling the calling thread (the event loop thread)"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while True:
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self._samples.append((time.time(), _folded_stack(frame)))
+            time.sleep(self.interval)
+
+    def request_finished(self, method, route, started, elapsed):
+        if not self.enabled or elapsed < self.threshold:
+            return
+        ended = started + elapsed
+        stacks = Counter(stack for at, stack in list(self._samples) if started <= at <= ended)
+        if not stacks:
+            return
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = os.path.join(self.output_dir, f"{int(started * 1000)}-{method}-{slug}-{int(elapsed * 1000)}ms.folded")
+        # File I/O stays off the event loop
+        asyncio.get_running_loop().run_in_executor(None, self._write, path, stacks)
+
+    def _write(self, path, stacks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+# Global profiler instance
+slow_request_profiler = SlowRequestProfiler(
+    PROFILE_SLOW_REQUEST_MS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_RETENTION_SECONDS, PROFILE_DIR
+)
@@ -0,0 +1,355 @@
+"""Per-tenant, per-user token bucket rate limiting.
+
+Requests are sorted into route classes (auth, read, write, bulk, stream) by
+method and path. Authenticated requests take one token from the tenant's
+bucket and one from the user's bucket for that class. Anonymous ones take a
+token from a bucket keyed by client address. Whichever bucket is empty
+answers 429 with Retry-After. /health, /metrics and the n8n webhook are
+not limited.
+
+The middleware runs before routing and needs no database. The identity
+comes from the bearer token, through the verified-token cache in app.tokens. Buckets are
+plain lists in a dict, so a decision is a few dict lookups and some float
+arithmetic, and a rejection is sent without reaching the app.
+
+The client address is the one uvicorn reports. Behind a reverse proxy that
+is the proxy's address, so every anonymous client would share one bucket,
+unless the proxy is listed in FORWARDED_ALLOW_IPS (see gunicorn.conf.py)
+and uvicorn takes the address from its X-Forwarded-For instead.
+
+Limits are (rate per second, burst). DEFAULT_LIMITS can be overridden, for
+every tenant or for one tenant, from RATE_LIMIT_CONFIG:
+
+    {"default": {"tenant": {"read": {"rate": 100, "burst": 200}}},
+     "tenants": {"TenantA": {"tenant": {"bulk": {"rate": 20, "burst": 40}},
+                             "user": {"read": null}}}}
+
+null removes a limit. With RATE_LIMIT_BACKEND=mongo the limits hold across
+workers. Each worker still decides locally, but every
+RATE_LIMIT_SYNC_INTERVAL_MS it adds what it let through to shared counters
+in RATE_LIMIT_COLLECTION and debits its own buckets by what the other
+workers let through in the meantime. A burst can overshoot by up to one
+sync interval.
+"""
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from urllib.parse import parse_qs
+from datetime import datetime
+from app.db import db
+from app.metrics import registry
+from app.tokens import verify_access_token
+from jose import JWTError
+import asyncio
+import copy
+import json
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_CONFIG = os.getenv("RATE_LIMIT_CONFIG", os.path.join(os.path.dirname(__file__), "ratelimits.json"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")  # local | mongo
+RATE_LIMIT_COLLECTION = "rate_limit_counters"
+RATE_LIMIT_SYNC_INTERVAL_MS = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL_MS", "250"))
+# Idle shared counters are removed by a TTL index after this long
+RATE_LIMIT_COUNTER_TTL_SECONDS = int(os.getenv("RATE_LIMIT_COUNTER_TTL_SECONDS", "3600"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# scope -> route class -> (tokens per second, burst)
+DEFAULT_LIMITS = {
+    "tenant": {"read": (200, 400), "write": (50, 100), "bulk": (5, 10), "stream": (10, 50)},
+    "user": {"read": (50, 100), "write": (20, 40), "bulk": (2, 5), "stream": (2, 10)},
+    "anonymous": {"auth": (5, 20), "read": (20, 40), "write": (10, 20), "bulk": (1, 2), "stream": (2, 10)},
+}
+
+EXEMPT_PREFIXES = ("/health", "/metrics", "/webhook/", "/docs", "/redoc", "/openapi.json")
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+RATE_LIMITED_BODY = b'{"detail":"Rate limit exceeded"}'
+
+rate_limit_rejections = registry.counter("rate_limit_rejections", "Requests rejected by rate limiting", ("tenant", "scope", "class"))
+rate_limit_decisions = registry.gauge("rate_limit_decisions", "Rate limited requests since start", ("class", "result"))
+rate_limit_buckets = registry.gauge("rate_limit_buckets", "Token buckets held in memory")
+
+def route_class(method, path):
+    """Route class of a request, or None when it is not limited"""
+    if path.startswith("/auth/"):
+        return "auth"
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path.startswith(("/api/tickets/bulk", "/api/tickets/export")):
+        return "bulk"
+    if path.startswith("/api/tickets/events"):
+        return "stream"
+    return "read" if method in READ_METHODS else "write"
+
+class TokenBuckets:
+    """Token buckets keyed by string: key -> [tokens, updated_at, rate, burst]"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = {}
+
+    def take(self, key, rate, burst, now):
+        """Take a token. Returns 0.0 when granted, otherwise the seconds until one is available."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            self._buckets[key] = [burst - 1.0, now, rate, burst]
+            return 0.0
+        tokens = bucket[0] + (now - bucket[1]) * rate
+        if tokens > burst:
+            tokens = burst
+        bucket[1] = now
+        bucket[2] = rate
+        bucket[3] = burst
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / rate
+
+    def refund(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(bucket[3], bucket[0] + 1.0)
+
+    def debit(self, key, amount):
+        """Remove tokens spent elsewhere; the bucket may go as far as one burst into debt"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = max(-bucket[3], bucket[0] - amount)
+
+    def _evict(self, now):
+        # Buckets that have refilled behave exactly like missing ones
+        for key, (tokens, updated_at, rate, burst) in list(self._buckets.items()):
+            if tokens + (now - updated_at) * rate >= burst:
+                del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            # Still full of active keys: forget the oldest half
+            for key in list(self._buckets)[:len(self._buckets) // 2]:
+                del self._buckets[key]
+
+    def clear(self):
+        self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+def _limit(value):
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        value = (value["rate"], value["burst"])
+    rate, burst = float(value[0]), float(value[1])
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit {value!r}")
+    return rate, burst
+
+def _merge(limits, overrides):
+    merged = copy.deepcopy(limits)
+    for scope, classes in (overrides or {}).items():
+        for route_cls, value in classes.items():
+            merged.setdefault(scope, {})[route_cls] = _limit(value)
+    return merged
+
+class RateLimiter:
+    def __init__(self, enabled: bool, config_path: str, backend: str, sync_interval_ms: float, max_keys: int):
+        self.enabled = enabled
+        self.config_path = config_path
+        self.backend = backend
+        self.sync_interval = sync_interval_ms / 1000
+        self.buckets = TokenBuckets(max_keys)
+        self.default_limits = DEFAULT_LIMITS
+        self.tenant_limits = {}
+        self.max_keys = max_keys
+        # (route class, "allowed" | "rejected") -> requests, read by collect_metrics()
+        self.decisions = {}
+        self._consumed = {}
+        self._seen = {}
+        self._task = None
+
+    def configure(self, config):
+        """Apply a {"default": ..., "tenants": {...}} override document"""
+        default_limits = _merge(DEFAULT_LIMITS, config.get("default"))
+        self.tenant_limits = {
+            tenant: _merge(default_limits, overrides) for tenant, overrides in config.get("tenants", {}).items()
+        }
+        self.default_limits = default_limits
+
+    def load_config(self):
+        if not os.path.exists(self.config_path):
+            self.configure({})
+            return
+        with open(self.config_path) as f:
+            self.configure(json.load(f))
+
+    async def start(self):
+        self.load_config()
+        if self.enabled and self.backend == "mongo" and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def identity(self, token):
+        """(customer_id, subject) of a valid token, or None"""
+        # Shares app.tokens' cache of verified tokens with authentication, so a token is checked once
+        try:
+            payload = verify_access_token(token)
+        except JWTError:
+            return None
+        if not payload.get("sub") or not payload.get("customer_id"):
+            return None
+        return payload["customer_id"], payload["sub"]
+
+    def collect_metrics(self):
+        for (route_cls, result), count in self.decisions.items():
+            rate_limit_decisions.set(count, route_cls, result)
+        rate_limit_buckets.set(len(self.buckets))
+
+    def _take(self, key, limit, now):
+        wait = self.buckets.take(key, limit[0], limit[1], now)
+        if wait == 0.0 and self._task is not None:
+            self._consumed[key] = self._consumed.get(key, 0) + 1
+        return wait
+
+    def _refund(self, key):
+        self.buckets.refund(key)
+        if self._task is not None and self._consumed.get(key):
+            self._consumed[key] -= 1
+
+    def check(self, route_cls, identity, client_host, now=None):
+        """None when the request may proceed, otherwise (scope, seconds to wait)"""
+        if now is None:
+            now = time.monotonic()
+        if identity is None:
+            limit = self.default_limits.get("anonymous", {}).get(route_cls)
+            if limit is None:
+                return None
+            wait = self._take(f"a:{client_host}:{route_cls}", limit, now)
+            return ("anonymous", wait) if wait else None
+
+        customer_id, subject = identity
+        limits = self.tenant_limits.get(customer_id, self.default_limits)
+        user_key = None
+        user_limit = limits.get("user", {}).get(route_cls)
+        if user_limit is not None:
+            user_key = f"u:{customer_id}:{subject}:{route_cls}"
+            wait = self._take(user_key, user_limit, now)
+            if wait:
+                return "user", wait
+        tenant_limit = limits.get("tenant", {}).get(route_cls)
+        if tenant_limit is not None:
+            wait = self._take(f"t:{customer_id}:{route_cls}", tenant_limit, now)
+            if wait:
+                # The user's token was not spent on anything
+                if user_key is not None:
+                    self._refund(user_key)
+                return "tenant", wait
+        return None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except PyMongoError as e:
+                logger.warning("Rate limit sync failed: %s", e)
+
+    async def sync(self):
+        """Share what this worker let through and debit what the others did since the last sync"""
+        consumed, self._consumed = self._consumed, {}
+        consumed = {key: count for key, count in consumed.items() if count > 0}
+        # Keys this worker used lately, which other workers may still be spending
+        keys = set(consumed) | set(self._seen)
+        if not keys:
+            return
+        counters = db.get_collection(RATE_LIMIT_COLLECTION)
+        if consumed:
+            now = datetime.utcnow()
+            await counters.bulk_write([
+                UpdateOne({"_id": key}, {"$inc": {"count": count}, "$set": {"updated_at": now}}, upsert=True)
+                for key, count in consumed.items()
+            ], ordered=False)
+        seen = {}
+        async for counter in counters.find({"_id": {"$in": list(keys)}}, {"count": 1}):
+            key, total = counter["_id"], counter["count"]
+            previous = self._seen.get(key)
+            # A key first seen now, or whose counter expired, only sets the baseline
+            if previous is not None and total > previous:
+                others = total - previous - consumed.get(key, 0)
+                if others > 0:
+                    self.buckets.debit(key, others)
+            # Keys nobody used during the interval are dropped, so old traffic is not charged again
+            if consumed.get(key) or total != previous:
+                seen[key] = total
+        self._seen = seen
+
+# Global rate limiter
+rate_limiter = RateLimiter(RATE_LIMIT_ENABLED, RATE_LIMIT_CONFIG, RATE_LIMIT_BACKEND, RATE_LIMIT_SYNC_INTERVAL_MS, RATE_LIMIT_MAX_KEYS)
+
+def _bearer_token(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    query_string = scope.get("query_string", b"")
+    if b"access_token=" in query_string:
+        # EventSource cannot set headers, so event streams pass the token in the query
+        values = parse_qs(query_string.decode("latin-1")).get("access_token")
+        return values[0] if values else None
+    return None
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware answering 429 before the request reaches routing"""
+
+    def __init__(self, app, limiter: RateLimiter = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiter
+        if scope["type"] != "http" or not limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        route_cls = route_class(scope["method"], scope["path"])
+        if route_cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = _bearer_token(scope)
+        identity = limiter.identity(token) if token else None
+        client = scope.get("client")
+        rejected = limiter.check(route_cls, identity, client[0] if client else "")
+        decisions = limiter.decisions
+        if rejected is None:
+            decision = (route_cls, "allowed")
+            decisions[decision] = decisions.get(decision, 0) + 1
+            await self.app(scope, receive, send)
+            return
+
+        limit_scope, wait = rejected
+        decision = (route_cls, "rejected")
+        decisions[decision] = decisions.get(decision, 0) + 1
+        rate_limit_rejections.inc(identity[0] if identity else "", limit_scope, route_cls)
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(RATE_LIMITED_BODY)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+                (b"x-ratelimit-scope", limit_scope.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": RATE_LIMITED_BODY})
@@ -6,7 +6,7 @@ class Role:
 
 def check_role(current_user, required_role: str):
     # Handle both dict and User object
-    user_role = getattr(current_user, "role", None) or current_user.get("role") if hasattr(current_user, "get") else None
+    user_role = current_user.get("role") if isinstance(current_user, dict) else getattr(current_user, "role", None)
     if user_role != required_role:
         raise HTTPException(status_code=403, detail="Operation not permitted")
     return True
\ No newline at end of file
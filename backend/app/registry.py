@@ -0,0 +1,121 @@
+from app.db import db
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = os.getenv("REGISTRY_PATH", os.path.join(os.path.dirname(__file__), "registry.json"))
+# How often the file's mtime is checked on the request path
+REGISTRY_CHECK_INTERVAL_SECONDS = float(os.getenv("REGISTRY_CHECK_INTERVAL_SECONDS", "5"))
+# Optional Mongo collection with extra {tenant, screenUrl} use cases added at runtime
+REGISTRY_COLLECTION = os.getenv("REGISTRY_COLLECTION", "screen_registry")
+REGISTRY_MONGO_ENABLED = os.getenv("REGISTRY_MONGO_ENABLED", "false").lower() == "true"
+REGISTRY_REFRESH_SECONDS = float(os.getenv("REGISTRY_REFRESH_SECONDS", "30"))
+REGISTRY_CACHE_CONTROL = os.getenv("REGISTRY_CACHE_CONTROL", "private, max-age=60")
+
+DEFAULT_SCREEN_URL = "/support"
+
+@dataclass(frozen=True)
+class TenantScreens:
+    body: bytes
+    etag: str
+
+def _tenant_screens(screens):
+    body = json.dumps(screens, separators=(",", ":")).encode()
+    return TenantScreens(body=body, etag=f'"{hashlib.sha1(body).hexdigest()}"')
+
+class ScreenRegistry:
+    """Tenant screen registry held in memory as precomputed per-tenant responses.
+
+    registry.json is loaded once and reloaded when its mtime changes (or on
+    SIGHUP). Use cases from the optional Mongo collection are merged in by a
+    periodic refresh. Every reload builds a new index and swaps it in with a
+    single assignment, so readers never see a half-built registry, and a
+    file that fails to load leaves the last good index in place.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index = None
+        self._file_use_cases = []
+        self._mongo_use_cases = []
+        self._mtime = None
+        self._checked_at = 0.0
+        self._refresh_task = None
+
+    def _rebuild(self):
+        by_tenant = {}
+        for uc in self._file_use_cases + self._mongo_use_cases:
+            by_tenant.setdefault(uc["tenant"], []).append({"tenant": uc["tenant"], "screenUrl": uc["screenUrl"]})
+        self._index = {tenant: _tenant_screens(screens) for tenant, screens in by_tenant.items()}
+
+    def reload(self):
+        """Re-read registry.json. Raises FileNotFoundError when it is missing."""
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, "r") as f:
+            registry = json.load(f)
+        self._file_use_cases = registry["useCases"]
+        self._mtime = mtime
+        self._rebuild()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < REGISTRY_CHECK_INTERVAL_SECONDS:
+            return
+        self._checked_at = now
+        if self._index is None:
+            self.reload()
+            return
+        try:
+            if os.stat(self.path).st_mtime != self._mtime:
+                self.reload()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Most likely caught mid-write; the mtime is left as it was so the next check tries again
+            logger.warning("Screen registry reload failed, keeping the last good one: %s", e)
+
+    def screens_for(self, tenant: str) -> TenantScreens:
+        self._maybe_reload()
+        screens = self._index.get(tenant)
+        if screens is None:
+            # If no screens found for tenant, return default
+            screens = _tenant_screens([{"tenant": tenant, "screenUrl": DEFAULT_SCREEN_URL}])
+        return screens
+
+    async def refresh_from_mongo(self):
+        cursor = db.get_collection(REGISTRY_COLLECTION).find({}, {"_id": 0, "tenant": 1, "screenUrl": 1})
+        self._mongo_use_cases = [uc async for uc in cursor if "tenant" in uc and "screenUrl" in uc]
+        if self._index is None:
+            self.reload()
+        else:
+            self._rebuild()
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh_from_mongo()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Screen registry refresh failed: %s", e)
+            await asyncio.sleep(REGISTRY_REFRESH_SECONDS)
+
+    def start(self):
+        if REGISTRY_MONGO_ENABLED:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+# Global registry instance
+screen_registry = ScreenRegistry(REGISTRY_PATH)
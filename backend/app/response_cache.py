@@ -0,0 +1,149 @@
+"""Tenant-versioned cache of serialized ticket reads.
+
+Every tenant has a version that the ticket write paths (create, update,
+delete, bulk, both n8n webhooks) bump through invalidate(). Change stream
+events from other workers bump it too. The ticket list and the ticket
+detail are cached per tenant and request under the version current when
+they were read, and their ETag is built from that version:
+
+* If-None-Match matching the current ETag gets a 304 with no database query.
+* A cached body for the current version is sent as is, again with no query.
+* Anything else is read from MongoDB, serialized once and stored.
+
+Versions are "<boot id>.<sequence>", so a version is never reused after a
+restart and two workers never hand out the same ETag. A worker only learns
+about another worker's writes through the change stream (EVENTS_SOURCE).
+Without one, a version is also replaced after RESPONSE_CACHE_MAX_AGE_SECONDS,
+which bounds how stale another worker's answer can be. 0 keeps versions
+until the next write, which is exact with a single worker or a change stream.
+
+Bodies live in an LRU bounded by RESPONSE_CACHE_MAX_BYTES. Bodies larger
+than RESPONSE_CACHE_MAX_ENTRY_BYTES are served but not kept. The cache is
+only touched from the event loop, so it takes no lock.
+"""
+from collections import OrderedDict
+from fastapi import Response
+from app.conditional import etag_matches
+from uuid import uuid4
+import hashlib
+import itertools
+import os
+import time
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+RESPONSE_CACHE_MAX_AGE_SECONDS = float(os.getenv("RESPONSE_CACHE_MAX_AGE_SECONDS", "5"))
+# Clients must revalidate every time, which costs them a 304 while nothing changed
+RESPONSE_CACHE_CONTROL = "private, no-cache"
+
+class TenantVersions:
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._boot_id = uuid4().hex[:8]
+        self._sequence = itertools.count(1)
+        # customer_id -> (version, issued at)
+        self._versions = {}
+
+    def current(self, customer_id):
+        entry = self._versions.get(customer_id)
+        if entry is None or (self.max_age > 0 and time.monotonic() - entry[1] >= self.max_age):
+            return self.bump(customer_id)
+        return entry[0]
+
+    def bump(self, customer_id):
+        version = f"{self._boot_id}.{next(self._sequence)}"
+        self._versions[customer_id] = (version, time.monotonic())
+        return version
+
+def make_etag(version, key):
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=6).hexdigest()
+    return f'W/"{version}.{digest}"'
+
+class Lookup:
+    __slots__ = ("key", "version", "etag", "response")
+
+    def __init__(self, key, version, etag, response=None):
+        self.key = key
+        self.version = version
+        self.etag = etag
+        self.response = response
+
+class ResponseCache:
+    def __init__(self, enabled: bool, max_bytes: int, max_entry_bytes: int, max_age: float):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.versions = TenantVersions(max_age)
+        # (customer_id, *key) -> (version, body, headers)
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def invalidate(self, customer_id):
+        """Called by every write to the tenant's tickets"""
+        self.versions.bump(customer_id)
+
+    def lookup(self, customer_id, key, if_none_match=None):
+        """Start a cached read. lookup.response is set when no query is needed."""
+        key = (customer_id, *key)
+        version = self.versions.current(customer_id)
+        etag = make_etag(version, key)
+        if not self.enabled:
+            return Lookup(key, version, etag)
+        headers = {"ETag": etag, "Cache-Control": RESPONSE_CACHE_CONTROL}
+        if etag_matches(if_none_match, etag):
+            self.not_modified += 1
+            return Lookup(key, version, etag, Response(status_code=304, headers=headers))
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return Lookup(key, version, etag, Response(entry[1], media_type="application/json", headers={**entry[2], **headers}))
+            self._remove(key)
+        self.misses += 1
+        return Lookup(key, version, etag)
+
+    def store(self, lookup, response, headers=None):
+        """Tag a freshly built response with the lookup's ETag and keep its body"""
+        if self.enabled:
+            response.headers["ETag"] = lookup.etag
+            response.headers["Cache-Control"] = RESPONSE_CACHE_CONTROL
+            body = response.body
+            if len(body) <= self.max_entry_bytes:
+                self._remove(lookup.key)
+                self._entries[lookup.key] = (lookup.version, body, headers or {})
+                self.size += len(body)
+                while self.size > self.max_bytes and self._entries:
+                    _, (_, evicted, _) = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+                    self.evictions += 1
+        return response
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+# Global response cache
+response_cache = ResponseCache(
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRY_BYTES, RESPONSE_CACHE_MAX_AGE_SECONDS
+)
@@ -1,28 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from app.db import db
-from app.models import User, UserResponse
-from app.auth import get_current_user
+from app.models import User, UserImportReport, UserResponse
+from app.auth import get_current_user, invalidate_principal
+from app.tokens import revocations
 from app.rbac import Role, check_role
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor, keyset_filter, keyset_sort
+from app.serialization import JSONBytesResponse, model_fields, to_public
+from app.user_import import IMPORT_MEDIA_TYPES, import_format, import_users
 from bson import ObjectId
-from typing import List
+from typing import List, Literal, Optional
+import os
+import re
 
 router = APIRouter()
 
+USER_RESPONSE_FIELDS = model_fields(UserResponse)
+USERS_DEFAULT_PAGE_SIZE = int(os.getenv("USERS_DEFAULT_PAGE_SIZE", "50"))
+USERS_MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", "200"))
+
 @router.get("/users", response_model=List[UserResponse])
-async def get_users(current_user: User = Depends(get_current_user)):
-    """Get all users for the current tenant (Admin only)"""
+async def get_users(
+    limit: int = Query(USERS_DEFAULT_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    role: Optional[Literal["Admin", "User"]] = None,
+    email: Optional[str] = Query(None, description="Email prefix"),
+    current_user: User = Depends(get_current_user),
+):
+    """List the tenant's users, newest first, one page at a time (Admin only).
+
+    The next page's cursor is returned in the X-Next-Cursor header and is
+    absent on the last page. email matches the start of the address, case
+    sensitively, so the lookup stays on an index.
+    """
     check_role(current_user, Role.Admin)
     
-    users = list(db.get_collection("users").find(
-        {"customer_id": current_user.customer_id},
+    conditions = [{"customer_id": current_user.customer_id}]
+    if role is not None:
+        conditions.append({"role": role})
+    if email:
+        conditions.append({"email": {"$regex": f"^{re.escape(email)}"}})
+    if cursor is not None:
+        conditions.append(keyset_filter(cursor, True))
+    query = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    
+    users = await db.get_collection("users").find(
+        query,
         {"hashed_password": 0}  # Exclude password field
-    ))
+    ).sort(keyset_sort(True)).limit(limit + 1).to_list(None)
+    
+    headers = {}
+    if len(users) > limit:
+        users = users[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(users[-1]["created_at"], users[-1]["_id"])
+    return JSONBytesResponse([to_public(user, USER_RESPONSE_FIELDS) for user in users], headers=headers)
+
+@router.post("/users/import", response_model=UserImportReport)
+async def import_tenant_users(request: Request, update_existing: bool = False, current_user: User = Depends(get_current_user)):
+    """Create many users in the tenant from a CSV or NDJSON body (Admin only).
+
+    CSV needs a header row with email and password columns and may have a
+    role column. NDJSON lines are {"email", "password", "role"} objects.
+    Emails already registered in the tenant are skipped unless
+    update_existing=true, which sets their password and role from the file.
+    Rows that fail are listed in the report by line number; the rest are
+    imported.
+    """
+    check_role(current_user, Role.Admin)
     
-    for user in users:
-        user["id"] = str(user["_id"])
-        del user["_id"]
+    format = import_format(request.headers.get("content-type", ""))
+    if format is None:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be one of {', '.join(IMPORT_MEDIA_TYPES)}")
+    try:
+        report, updated = await import_users(request.stream(), format, current_user.customer_id, update_existing)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for email in updated:
+        invalidate_principal(email, current_user.customer_id)
+        # A new password or role must not leave the tokens issued under the old one working
+        await revocations.revoke_user(email)
     
-    return users
+    return JSONBytesResponse(report)
 
 @router.delete("/users/{user_id}")
 async def delete_user(user_id: str, current_user: User = Depends(get_current_user)):
@@ -32,14 +89,20 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     # Prevent admin from deleting themselves
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot delete your own account")
+    try:
+        object_id = ObjectId(user_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid user ID")
     
-    users = db.get_collection("users")
-    user = users.find_one({"_id": ObjectId(user_id), "customer_id": current_user.customer_id})
+    # One tenant-scoped round trip: nothing to race between a lookup and the delete
+    user = await db.get_collection("users").find_one_and_delete(
+        {"_id": object_id, "customer_id": current_user.customer_id},
+        projection={"email": 1, "customer_id": 1},
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_principal(user["email"], user["customer_id"])
+    # Tokens already handed out would otherwise work until they expire
+    await revocations.revoke_user(user["email"])
     
-    result = users.delete_one({"_id": ObjectId(user_id)})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=500, detail="Failed to delete user")
-    
-    return {"detail": "User deleted successfully"}
\ No newline at end of file
+    return {"detail": "User deleted successfully"}
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+from pymongo.errors import PyMongoError
+from app.db import db
+from app.lifecycle import lifecycle
+import asyncio
+import os
+
+READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+
+router = APIRouter()
+
+@router.get("/live")
+def liveness():
+    """The worker's event loop is serving requests; no dependency is checked"""
+    return {"status": "alive"}
+
+@router.get("")
+@router.get("/ready")
+async def readiness():
+    """Whether this worker should receive traffic: MongoDB answers and it is not draining"""
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="Shutting down")
+    try:
+        await asyncio.wait_for(db.ping(), READINESS_TIMEOUT_SECONDS)
+    except (PyMongoError, RuntimeError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e) or 'timed out'}")
+    return {"status": "healthy"}
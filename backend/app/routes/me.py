@@ -1,35 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from app.auth import get_current_user
 from app.models import User
-import json
-import os
+from app.registry import REGISTRY_CACHE_CONTROL, screen_registry
+from app.conditional import etag_matches
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.get("/screens")
-async def get_screens(current_user: User = Depends(get_current_user)):
+async def get_screens(request: Request, current_user: User = Depends(get_current_user)):
     """Get available screens for the current user's tenant"""
     try:
-        registry_path = os.path.join(os.path.dirname(__file__), "..", "registry.json")
-        with open(registry_path, "r") as f:
-            registry = json.load(f)
-        
-        # Filter screens by user's customer_id
-        screens = [
-            {"tenant": uc["tenant"], "screenUrl": uc["screenUrl"]}
-            for uc in registry["useCases"]
-            if uc["tenant"] == current_user.customer_id
-        ]
-        
-        # If no screens found for tenant, return default
-        if not screens:
-            screens = [{"tenant": current_user.customer_id, "screenUrl": "/support"}]
-        
-        return screens
+        screens = screen_registry.screens_for(current_user.customer_id)
     except FileNotFoundError:
+        logger.exception("Screen registry not found")
         raise HTTPException(status_code=500, detail="Registry configuration not found")
     except Exception as e:
+        logger.exception("Loading screens failed")
         raise HTTPException(status_code=500, detail=f"Error loading screens: {str(e)}")
+    
+    headers = {"ETag": screens.etag, "Cache-Control": REGISTRY_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), screens.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=screens.body, media_type="application/json", headers=headers)
 
 @router.get("/profile")
 async def get_profile(current_user: User = Depends(get_current_user)):
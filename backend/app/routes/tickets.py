@@ -1,49 +1,212 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from app.db import db
-from app.models import Ticket, TicketCreate, TicketUpdate, TicketResponse, User
-from app.auth import get_current_user
+from app.models import (
+    Ticket, TicketCreate, TicketUpdate, TicketResponse, TicketSearchResult, TicketStats, User,
+    BulkTicketRequest, BulkTicketResponse, BulkTicketResult,
+)
+from app.auth import get_current_user, get_stream_user
 from app.rbac import Role, check_role
+from app.outbox import enqueue_workflows, insert_ticket_with_outbox
+from app.pagination import (
+    NEXT_CURSOR_HEADER, decode_offset_cursor, encode_cursor, encode_offset_cursor, keyset_filter, keyset_sort,
+)
+from app.search import (
+    SEARCH_DEFAULT_PAGE_SIZE, SEARCH_MAX_OFFSET, SEARCH_MAX_PAGE_SIZE, SEARCH_MAX_QUERY_LENGTH,
+    TEXT_SCORE, TEXT_SORT, highlights, search_terms, text_query,
+)
+from app.stats import STATS_PROJECTION, StatsDelta, apply_status_update, get_stats, status_update
+from app.events import event_stream, ticket_events
+from app.serialization import JSONBytesResponse, model_fields, to_public
+from app.response_cache import response_cache
+from app.archive import archive_store, merge_pages
+from app.export import EXPORT_BATCH_SIZE, EXPORT_MEDIA_TYPES, EXPORT_PROJECTION, stream_export
+from app.webhook_batch import utc_naive
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
 from datetime import datetime
-from typing import List
+from typing import List, Literal, Optional
 import os
-import requests
 
 router = APIRouter()
 
-def trigger_n8n_workflow(ticket_data):
-    # Fixed: Use correct webhook path matching n8n workflow
-    n8n_url = os.getenv("N8N_API_URL", "http://n8n:5678/webhook/flowbit-ticket")
-    secret = os.getenv("N8N_WEBHOOK_SECRET", "your_n8n_webhook_secret")
-    payload = {
-        "ticket_id": ticket_data["id"],
-        "customer_id": ticket_data["customer_id"],
-        "title": ticket_data["title"],
-        "description": ticket_data["description"],
-        "status": ticket_data["status"],
-    }
-    headers = {"X-Shared-Secret": secret}
-    try:
-        response = requests.post(n8n_url, json=payload, headers=headers, timeout=5)
-        print(f"N8N workflow triggered: {response.status_code}")
-    except Exception as e:
-        print(f"Failed to trigger n8n workflow: {e}")
+TICKETS_DEFAULT_PAGE_SIZE = int(os.getenv("TICKETS_DEFAULT_PAGE_SIZE", "50"))
+TICKETS_MAX_PAGE_SIZE = int(os.getenv("TICKETS_MAX_PAGE_SIZE", "200"))
+TICKET_RESPONSE_FIELDS = model_fields(TicketResponse)
+TICKET_FIELDS = set(TICKET_RESPONSE_FIELDS)
+SEARCH_RESULT_FIELDS = model_fields(TicketSearchResult)
+BULK_MAX_OPERATIONS = int(os.getenv("BULK_MAX_OPERATIONS", "1000"))
+# Reads of the pre-image a status update retries when another write changes the ticket in between
+STATUS_UPDATE_ATTEMPTS = 3
+
+def ticket_filters(customer_id, status=None, created_by=None, created_after=None, created_before=None):
+    """Query conditions shared by the ticket list and export, always scoped to the tenant.
+
+    Bounds with a UTC offset are made naive UTC like the stored created_at,
+    which the segment archive compares in Python.
+    """
+    conditions = [{"customer_id": customer_id}]
+    if status is not None:
+        conditions.append({"status": status})
+    if created_by is not None:
+        conditions.append({"created_by": created_by})
+    if created_after is not None:
+        conditions.append({"created_at": {"$gte": utc_naive(created_after)}})
+    if created_before is not None:
+        conditions.append({"created_at": {"$lt": utc_naive(created_before)}})
+    return conditions
 
 @router.get("/", response_model=List[TicketResponse])
-async def get_tickets(current_user: User = Depends(get_current_user)):
+async def get_tickets(
+    request: Request,
+    limit: int = Query(TICKETS_DEFAULT_PAGE_SIZE, ge=1, le=TICKETS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    created_by: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    sort: Literal["-created_at", "created_at"] = "-created_at",
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return"),
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user),
+):
+    """List the tenant's tickets one page at a time.
+
+    The next page's cursor is returned in the X-Next-Cursor header and is
+    absent on the last page. Pages are cached per tenant version and carry
+    an ETag, so an unchanged page costs a 304 and no database query.
+    include_archived=true merges in tickets moved to the archive.
+    """
+    descending = sort.startswith("-")
+    conditions = ticket_filters(current_user.customer_id, status, created_by, created_after, created_before)
+    if cursor is not None:
+        conditions.append(keyset_filter(cursor, descending))
+    query = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    projection = None
+    if fields is not None:
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = requested - TICKET_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        # created_at is always read so the next cursor can be built
+        projection = {field: 1 for field in requested - {"id"}} | {"created_at": 1}
+
+    lookup = response_cache.lookup(
+        current_user.customer_id,
+        ("list", limit, cursor, status, created_by, created_after, created_before, sort, fields, include_archived),
+        request.headers.get("if-none-match"),
+    )
+    if lookup.response is not None:
+        return lookup.response
+
     tickets = db.get_collection("tickets")
-    ticket_list = list(tickets.find({"customer_id": current_user.customer_id}))
+    ticket_list = await tickets.find(query, projection).sort(keyset_sort(descending)).limit(limit + 1).to_list(None)
+    if include_archived:
+        archived = await archive_store.find(current_user.customer_id, query, keyset_sort(descending), limit + 1)
+        ticket_list = merge_pages(ticket_list, archived, descending, limit + 1)
     
-    # Convert ObjectId to string
-    for ticket in ticket_list:
-        ticket["id"] = str(ticket["_id"])
-        del ticket["_id"]
+    headers = {}
+    if len(ticket_list) > limit:
+        ticket_list = ticket_list[:limit]
+        last = ticket_list[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last["created_at"], last["_id"])
     
-    return ticket_list
+    fields = TICKET_RESPONSE_FIELDS
+    if projection is not None:
+        fields = tuple(field for field in TICKET_RESPONSE_FIELDS if field in requested)
+    return response_cache.store(lookup, JSONBytesResponse([to_public(ticket, fields) for ticket in ticket_list], headers=headers), headers)
+
+@router.get("/search", response_model=List[TicketSearchResult])
+async def search_tickets(
+    q: str = Query(..., min_length=1, max_length=SEARCH_MAX_QUERY_LENGTH),
+    limit: int = Query(SEARCH_DEFAULT_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """Search the tenant's tickets by title and description, best matches first.
+
+    Supports the $text syntax ("exact phrase", -excluded). Each result
+    carries its relevance score and the character spans of the matched
+    words. The next page's cursor is returned in the X-Next-Cursor header.
+    """
+    offset = decode_offset_cursor(cursor) if cursor is not None else 0
+    if offset > SEARCH_MAX_OFFSET:
+        raise HTTPException(status_code=400, detail="Refine the search to see more results")
+    
+    tickets = db.get_collection("tickets")
+    query = text_query(current_user.customer_id, q, status)
+    results = await tickets.find(query, {"score": TEXT_SCORE}).sort(TEXT_SORT).skip(offset).limit(limit + 1).to_list(None)
+    
+    headers = {}
+    if len(results) > limit:
+        results = results[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_offset_cursor(offset + limit)
+    
+    terms = search_terms(q)
+    for ticket in results:
+        ticket["highlights"] = highlights(ticket, terms)
+    return JSONBytesResponse([to_public(ticket, SEARCH_RESULT_FIELDS) for ticket in results], headers=headers)
+
+@router.get("/stats", response_model=TicketStats)
+async def ticket_stats(
+    days: int = Query(30, ge=1, le=366),
+    current_user: User = Depends(get_current_user),
+):
+    """Counts by status, tickets created per day over the last `days` days and mean time to close.
+
+    Served from the tenant's pre-aggregated counter document, so the cost
+    does not grow with the number of tickets.
+    """
+    return await get_stats(current_user.customer_id, days)
+
+@router.get("/events")
+async def ticket_event_stream(request: Request, current_user: User = Depends(get_stream_user)):
+    """Server-Sent Events stream of the tenant's ticket.created/updated/deleted events.
+
+    Accepts the token in the Authorization header or as ?access_token=.
+    Reconnecting with Last-Event-ID replays missed events; a "reset" event
+    means the client must refetch the ticket list.
+    """
+    subscribed = ticket_events.subscribe(current_user.customer_id, request.headers.get("last-event-id"))
+    if subscribed is None:
+        raise HTTPException(status_code=503, detail="Too many event streams for this tenant", headers={"Retry-After": "30"})
+    subscription, replay = subscribed
+    return StreamingResponse(
+        event_stream(ticket_events, subscription, replay),
+        media_type="text/event-stream",
+        # Proxies must not buffer or cache the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/export")
+async def export_tickets(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    status: Optional[str] = None,
+    created_by: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """Stream every matching ticket of the tenant as NDJSON or CSV (Admin only).
+
+    Rows are read from a server-side cursor and written batch by batch, so
+    memory stays flat however many tickets the tenant has. The compression
+    middleware compresses the stream chunk by chunk.
+    """
+    check_role(current_user, Role.Admin)
+    conditions = ticket_filters(current_user.customer_id, status, created_by, created_after, created_before)
+    query = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    cursor = db.get_collection("tickets").find(query, EXPORT_PROJECTION).sort(keyset_sort(False)).batch_size(EXPORT_BATCH_SIZE)
+
+    body = stream_export(cursor, format, EXPORT_BATCH_SIZE)
+    headers = {"Content-Disposition": f'attachment; filename="tickets-{current_user.customer_id}.{format}"'}
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
 
 @router.post("/", response_model=TicketResponse)
 async def create_ticket(ticket: TicketCreate, current_user: User = Depends(get_current_user)):
-    tickets = db.get_collection("tickets")
     ticket_data = {
         "title": ticket.title,
         "description": ticket.description,
@@ -54,68 +217,233 @@ async def create_ticket(ticket: TicketCreate, current_user: User = Depends(get_c
         "updated_at": None
     }
     
-    result = tickets.insert_one(ticket_data)
-    ticket_data["id"] = str(result.inserted_id)
+    # The n8n workflow is dispatched from the outbox by a background worker
+    await insert_ticket_with_outbox(ticket_data, also=StatsDelta().created(ticket_data).apply)
+    response_cache.invalidate(current_user.customer_id)
+    ticket_events.emit("ticket.created", ticket_data)
+    return JSONBytesResponse(to_public(ticket_data, TICKET_RESPONSE_FIELDS))
+
+@router.post("/bulk", response_model=BulkTicketResponse)
+async def bulk_tickets(bulk: BulkTicketRequest, current_user: User = Depends(get_current_user)):
+    """Apply a batch of create/update/delete operations with a single bulk_write.
+
+    Every operation is scoped to the caller's tenant. With ordered=true
+    processing stops at the first failing operation and the rest are
+    reported as skipped.
+    """
+    if len(bulk.operations) > BULK_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_OPERATIONS} operations per request")
+    
+    tickets = db.get_collection("tickets")
+    now = datetime.utcnow()
+    results = [BulkTicketResult(index=index, op=operation.op, status="ok", id=operation.id)
+               for index, operation in enumerate(bulk.operations)]
+    
+    # Resolve update/delete targets against the tenant in one round trip
+    object_ids = {}
+    for index, operation in enumerate(bulk.operations):
+        if operation.op == "create":
+            if operation.ticket is None:
+                results[index].status, results[index].error = "error", "create requires ticket"
+            continue
+        try:
+            object_ids[index] = ObjectId(operation.id)
+        except Exception:
+            results[index].status, results[index].error = "error", "Invalid ticket ID"
+            continue
+        if operation.op == "update" and operation.changes is None:
+            results[index].status, results[index].error = "error", "update requires changes"
+    existing = {}
+    if object_ids:
+        cursor = tickets.find({"_id": {"$in": list(object_ids.values())}, "customer_id": current_user.customer_id})
+        existing = {doc["_id"]: doc async for doc in cursor}
+    
+    writes = []
+    write_indexes = []
+    created = {}
+    updates = {}
+    stopped_at = None
+    for index, operation in enumerate(bulk.operations):
+        if results[index].status == "ok" and index in object_ids and object_ids[index] not in existing:
+            results[index].status, results[index].error = "error", "Ticket not found"
+        if results[index].status == "error":
+            if bulk.ordered:
+                stopped_at = index
+                break
+            continue
+        
+        if operation.op == "create":
+            ticket_data = {
+                "_id": ObjectId(),
+                "title": operation.ticket.title,
+                "description": operation.ticket.description,
+                "status": "Open",
+                "customer_id": current_user.customer_id,
+                "created_by": current_user.email,
+                "created_at": now,
+                "updated_at": None
+            }
+            created[index] = ticket_data
+            writes.append(InsertOne(ticket_data))
+        elif operation.op == "update":
+            update_data = operation.changes.dict(exclude_unset=True)
+            update_data["updated_at"] = now
+            updates[index] = update_data
+            writes.append(UpdateOne(
+                {"_id": object_ids[index], "customer_id": current_user.customer_id},
+                status_update(update_data, now)
+            ))
+        else:
+            writes.append(DeleteOne({"_id": object_ids[index], "customer_id": current_user.customer_id}))
+        write_indexes.append(index)
     
-    # Fix the syntax error - proper way to delete the key
-    if "_id" in ticket_data:
-        del ticket_data["_id"]
+    # In ordered mode nothing after the first failure is attempted
+    if stopped_at is not None:
+        for result in results[stopped_at + 1:]:
+            result.status, result.error = "skipped", None
     
-    trigger_n8n_workflow(ticket_data)
-    return ticket_data
+    write_errors = {}
+    if writes:
+        try:
+            await tickets.bulk_write(writes, ordered=bulk.ordered)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+    first_write_error = min(write_errors, default=None)
+    stats = StatsDelta()
+    events = []
+    for position, index in enumerate(write_indexes):
+        if position in write_errors:
+            results[index].status, results[index].error = "error", write_errors[position]
+        elif bulk.ordered and first_write_error is not None and position > first_write_error:
+            results[index].status = "skipped"
+        elif index in created:
+            results[index].id = str(created[index]["_id"])
+            stats.created(created[index])
+            events.append(("ticket.created", created[index]))
+            continue
+        else:
+            # Replay the applied operations in order so a ticket named twice is counted once
+            before = existing.pop(object_ids[index], None)
+            if before is not None and index in updates:
+                existing[object_ids[index]] = apply_status_update(before, updates[index], now)
+                stats.changed(before, existing[object_ids[index]])
+                events.append(("ticket.updated", existing[object_ids[index]]))
+            elif before is not None:
+                stats.deleted(before)
+                events.append(("ticket.deleted", before))
+        created.pop(index, None)
+    
+    await stats.apply()
+    response_cache.invalidate(current_user.customer_id)
+    await enqueue_workflows(list(created.values()))
+    for event_type, ticket_data in events:
+        ticket_events.emit(event_type, ticket_data)
+    
+    counts = {"create": 0, "update": 0, "delete": 0}
+    for result in results:
+        if result.status == "ok":
+            counts[result.op] += 1
+    return BulkTicketResponse(
+        created=counts["create"],
+        updated=counts["update"],
+        deleted=counts["delete"],
+        failed=sum(1 for result in results if result.status == "error"),
+        results=results,
+    )
 
 @router.get("/{ticket_id}", response_model=TicketResponse)
-async def get_ticket(ticket_id: str, current_user: User = Depends(get_current_user)):
+async def get_ticket(
+    ticket_id: str,
+    request: Request,
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user),
+):
+    lookup = response_cache.lookup(current_user.customer_id, ("ticket", ticket_id, include_archived), request.headers.get("if-none-match"))
+    if lookup.response is not None:
+        return lookup.response
+
     tickets = db.get_collection("tickets")
     try:
-        ticket = tickets.find_one({
-            "_id": ObjectId(ticket_id), 
-            "customer_id": current_user.customer_id
-        })
+        object_id = ObjectId(ticket_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid ticket ID")
+    ticket = await tickets.find_one({
+        "_id": object_id, 
+        "customer_id": current_user.customer_id
+    })
+    if not ticket and include_archived:
+        ticket = await archive_store.get(current_user.customer_id, object_id)
     
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
-    ticket["id"] = str(ticket["_id"])
-    del ticket["_id"]
-    return ticket
+    return response_cache.store(lookup, JSONBytesResponse(to_public(ticket, TICKET_RESPONSE_FIELDS)))
 
 @router.put("/{ticket_id}", response_model=TicketResponse)
 async def update_ticket(ticket_id: str, ticket: TicketUpdate, current_user: User = Depends(get_current_user)):
     tickets = db.get_collection("tickets")
+    now = datetime.utcnow()
     update_data = ticket.dict(exclude_unset=True)
-    update_data["updated_at"] = datetime.utcnow()
+    update_data["updated_at"] = now
     
     try:
-        result = tickets.update_one(
-            {"_id": ObjectId(ticket_id), "customer_id": current_user.customer_id},
-            {"$set": update_data}
-        )
+        object_id = ObjectId(ticket_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid ticket ID")
     
-    if result.matched_count == 0:
+    scope = {"_id": object_id, "customer_id": current_user.customer_id}
+
+    async def write(session):
+        if "status" not in update_data:
+            # The counters only depend on the status, so there is nothing to count
+            return await tickets.find_one_and_update(
+                scope, status_update(update_data, now), return_document=ReturnDocument.AFTER, session=session
+            )
+        # The stats need the pre-image: the update only matches while the fields they use are as read
+        for _ in range(STATUS_UPDATE_ATTEMPTS):
+            before = await tickets.find_one(scope, projection=STATS_PROJECTION, session=session)
+            if before is None:
+                return None
+            updated = await tickets.find_one_and_update(
+                {**scope, "status": before.get("status"), "closed_at": before.get("closed_at")},
+                status_update(update_data, now),
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if updated is not None:
+                await StatsDelta().changed(before, updated).apply(session)
+                return updated
+        raise HTTPException(status_code=409, detail="Ticket is being changed by another request, try again")
+    
+    updated_ticket = await db.run_in_transaction(write)
+    if updated_ticket is None:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
-    updated_ticket = tickets.find_one({"_id": ObjectId(ticket_id)})
-    updated_ticket["id"] = str(updated_ticket["_id"])
-    del updated_ticket["_id"]
-    return updated_ticket
+    response_cache.invalidate(current_user.customer_id)
+    ticket_events.emit("ticket.updated", updated_ticket)
+    return JSONBytesResponse(to_public(updated_ticket, TICKET_RESPONSE_FIELDS))
 
 @router.delete("/{ticket_id}")
 async def delete_ticket(ticket_id: str, current_user: User = Depends(get_current_user)):
     tickets = db.get_collection("tickets")
     try:
-        result = tickets.delete_one({
-            "_id": ObjectId(ticket_id), 
-            "customer_id": current_user.customer_id
-        })
+        object_id = ObjectId(ticket_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid ticket ID")
     
-    if result.deleted_count == 0:
+    async def write(session):
+        deleted = await tickets.find_one_and_delete({
+            "_id": object_id, 
+            "customer_id": current_user.customer_id
+        }, projection=STATS_PROJECTION, session=session)
+        if deleted is not None:
+            await StatsDelta().deleted(deleted).apply(session)
+        return deleted
+    
+    deleted = await db.run_in_transaction(write)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    response_cache.invalidate(current_user.customer_id)
+    ticket_events.emit("ticket.deleted", deleted)
     
     return {"detail": "Ticket deleted successfully"}
\ No newline at end of file
@@ -1,9 +1,17 @@
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import hmac
 import os
 from app.db import db
+from app.stats import StatsDelta, apply_status_update, status_update
+from app.events import ticket_events
+from app.response_cache import response_cache
+from app.webhook_batch import WEBHOOK_BATCH_MAX_EVENTS, utc_naive, webhook_batcher
 from bson import ObjectId
+from datetime import datetime
 
 router = APIRouter()
 
@@ -12,25 +20,90 @@ class WebhookPayload(BaseModel):
     status: str
     ticket_id: str
 
-@router.post("/ticket-done")  # Remove duplicate "/webhook"
-async def ticket_done(payload: WebhookPayload, request: Request):
-    secret_header = request.headers.get("X-Shared-Secret")
+class WebhookEvent(WebhookPayload):
+    # Deduplicates retries of the same event for WEBHOOK_IDEMPOTENCY_TTL_SECONDS
+    event_id: Optional[str] = None
+    # Events older than the ticket's last status change are rejected; defaults to receipt time
+    occurred_at: Optional[datetime] = None
+
+class WebhookBatchPayload(BaseModel):
+    events: List[WebhookEvent]
+
+def verify_secret(request: Request):
+    secret_header = request.headers.get("X-Shared-Secret") or ""
     expected_secret = os.getenv("N8N_WEBHOOK_SECRET", "your_n8n_webhook_secret")
 
-    if secret_header != expected_secret:
+    # Constant-time, so response timing does not reveal how much of the secret matched
+    if not hmac.compare_digest(secret_header.encode(), expected_secret.encode()):
         raise HTTPException(status_code=403, detail="Forbidden: Invalid secret")
 
+@router.post("/ticket-done")  # Remove duplicate "/webhook"
+async def ticket_done(payload: WebhookPayload, request: Request):
+    verify_secret(request)
+
     tickets = db.get_collection("tickets")
+    now = datetime.utcnow()
+    update_data = {"status": payload.status}
     
     try:
-        result = tickets.update_one(
-            {"_id": ObjectId(payload.ticket_id), "customer_id": payload.customer_id},
-            {"$set": {"status": payload.status}}
-        )
+        object_id = ObjectId(payload.ticket_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid ticket ID: {str(e)}")
     
-    if result.matched_count == 0:
+    async def write(session):
+        before = await tickets.find_one_and_update(
+            {"_id": object_id, "customer_id": payload.customer_id},
+            status_update(update_data, now),
+            session=session
+        )
+        if before is not None:
+            await StatsDelta().changed(before, apply_status_update(before, update_data, now)).apply(session)
+        return before
+    
+    before = await db.run_in_transaction(write)
+    if before is None:
         raise HTTPException(status_code=404, detail="Ticket not found for this tenant")
+    response_cache.invalidate(payload.customer_id)
+    ticket_events.emit("ticket.updated", apply_status_update(before, update_data, now))
+
+    return JSONResponse(status_code=200, content={"message": "Ticket status updated successfully"})
+
+@router.post("/ticket-done/batch")
+async def ticket_done_batch(payload: WebhookBatchPayload, request: Request, wait: bool = False):
+    """Queue a batch of status events; they are written together by the webhook batcher.
+
+    Responds 202 once the events are queued. With wait=true it responds
+    after they are written, with a per-event result: applied, duplicate,
+    stale, not_found or error. Events with an invalid ticket ID are
+    rejected up front.
+    """
+    verify_secret(request)
+    if len(payload.events) > WEBHOOK_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=400, detail=f"At most {WEBHOOK_BATCH_MAX_EVENTS} events per request")
+
+    received_at = datetime.utcnow()
+    queued = []
+    invalid = []
+    for index, event in enumerate(payload.events):
+        try:
+            ticket_id = ObjectId(event.ticket_id)
+        except Exception:
+            invalid.append(index)
+            continue
+        queued.append((index, {
+            "ticket_id": ticket_id,
+            "customer_id": event.customer_id,
+            "status": event.status,
+            "key": f"{event.customer_id}:{event.event_id}" if event.event_id else None,
+            "occurred_at": utc_naive(event.occurred_at) if event.occurred_at else received_at,
+        }))
+
+    futures = webhook_batcher.submit([event for _, event in queued])
+    if not wait:
+        return JSONResponse(status_code=202, content={"accepted": len(queued), "invalid": invalid})
 
-    return JSONResponse(status_code=200, content={"message": "Ticket status updated successfully"})
\ No newline at end of file
+    outcomes = await asyncio.gather(*futures)
+    results = [{"index": index, "status": "invalid"} for index in invalid]
+    results += [{"index": index, "status": outcome} for (index, _), outcome in zip(queued, outcomes)]
+    results.sort(key=lambda result: result["index"])
+    return JSONResponse(status_code=200, content={"results": results})
@@ -0,0 +1,66 @@
+"""Ticket full-text search.
+
+Search is served by the tenant_text index declared in app.indexes. It is a
+compound text index with customer_id as its prefix, so every query is an
+equality match on the tenant followed by a text lookup within that tenant's
+tickets only. MongoDB maintains the index on every write, so the
+create/update/delete handlers and the n8n webhook need no extra
+bookkeeping. Results are ranked by textScore. Highlights are character
+spans computed here rather than markup, so clients can render them safely.
+"""
+import os
+import re
+
+SEARCH_DEFAULT_PAGE_SIZE = int(os.getenv("SEARCH_DEFAULT_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+# Ranked results cannot be resumed with a keyset, so deep pages are refused
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))
+SEARCH_MAX_QUERY_LENGTH = int(os.getenv("SEARCH_MAX_QUERY_LENGTH", "200"))
+SEARCH_HIGHLIGHT_FIELDS = ("title", "description")
+
+TEXT_SCORE = {"$meta": "textScore"}
+TEXT_SORT = [("score", TEXT_SCORE), ("_id", -1)]
+
+_PHRASE = re.compile(r'"([^"]+)"')
+_WORD = re.compile(r"\w+")
+# Suffixes dropped before prefix matching, a rough stand-in for the server's stemmer
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+def search_terms(q: str):
+    """Lower-cased terms of a $text search string, excluding negated ones"""
+    terms = []
+    for phrase in _PHRASE.findall(q):
+        terms.extend(word.lower() for word in _WORD.findall(phrase))
+    for token in _PHRASE.sub(" ", q).split():
+        if token.startswith("-"):
+            continue
+        terms.extend(word.lower() for word in _WORD.findall(token))
+    return list(dict.fromkeys(terms))
+
+def _stem(term: str):
+    for suffix in _SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[:-len(suffix)]
+    return term
+
+def highlight_spans(text: str, terms):
+    """[[start, end], ...] of the words in `text` matching any search term"""
+    if not text or not terms:
+        return []
+    stems = {_stem(term) for term in terms}
+    spans = []
+    for match in _WORD.finditer(text):
+        word = match.group().lower()
+        if any(word.startswith(stem) for stem in stems):
+            spans.append([match.start(), match.end()])
+    return spans
+
+def highlights(ticket, terms):
+    return {field: highlight_spans(ticket.get(field, ""), terms) for field in SEARCH_HIGHLIGHT_FIELDS}
+
+def text_query(customer_id: str, q: str, status=None):
+    """Tenant-scoped $text query; customer_id must be an equality match for the compound text index"""
+    query = {"customer_id": customer_id, "$text": {"$search": q}}
+    if status is not None:
+        query["status"] = status
+    return query
@@ -1,42 +1,63 @@
 from app.db import db
 from app.auth import get_password_hash
-from datetime import datetime
+from app.log import setup_logging
+from app.stats import STATS_COLLECTION, StatsDelta
+from datetime import datetime, timedelta
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import random
+import sys
+import time
 
-def seed_data():
-    """Seed initial data for testing"""
-    users_collection = db.get_collection("users")
-    tickets_collection = db.get_collection("tickets")
+logger = logging.getLogger(__name__)
+
+def seed_data(force=False):
+    """Seed initial data for testing. Returns False when users exist and force is not set."""
+    users_collection = db.get_sync_collection("users")
+    tickets_collection = db.get_sync_collection("tickets")
+    
+    # Runs before every deployment start, so existing data is kept unless asked otherwise
+    if not force and users_collection.find_one({}, {"_id": 1}) is not None:
+        logger.info("Database already seeded, skipping (use --force to reseed)")
+        return False
     
-    # Clear existing data
+    # Clear existing data, counters included so the demo tenants start from zero
     users_collection.delete_many({})
     tickets_collection.delete_many({})
+    db.get_sync_collection(STATS_COLLECTION).delete_many({})
+    
+    # bcrypt is slow on purpose; every seed user shares the same password
+    hashed_password = get_password_hash("password")
     
     # Create test users
     test_users = [
         {
             "email": "admin@tenantA.com",
-            "hashed_password": get_password_hash("password"),
+            "hashed_password": hashed_password,
             "customer_id": "TenantA",
             "role": "Admin",
             "created_at": datetime.utcnow()
         },
         {
             "email": "user@tenantA.com", 
-            "hashed_password": get_password_hash("password"),
+            "hashed_password": hashed_password,
             "customer_id": "TenantA",
             "role": "User",
             "created_at": datetime.utcnow()
         },
         {
             "email": "admin@tenantB.com",
-            "hashed_password": get_password_hash("password"),
+            "hashed_password": hashed_password,
             "customer_id": "TenantB", 
             "role": "Admin",
             "created_at": datetime.utcnow()
         },
         {
             "email": "user@tenantB.com",
-            "hashed_password": get_password_hash("password"),
+            "hashed_password": hashed_password,
             "customer_id": "TenantB",
             "role": "User", 
             "created_at": datetime.utcnow()
@@ -77,7 +98,215 @@ def seed_data():
     ]
     
     tickets_collection.insert_many(test_tickets)
-    print("✅ Seed data inserted successfully!")
+    delta = StatsDelta()
+    for ticket in test_tickets:
+        delta.created(ticket)
+    db.get_sync_collection(STATS_COLLECTION).bulk_write(delta.operations(datetime.utcnow()), ordered=False)
+    logger.info("Seed data inserted", extra={"users": len(test_users), "tickets": len(test_tickets)})
+    return True
+
+# Words for synthetic titles and descriptions
+WORDS = (
+    "login", "password", "reset", "error", "timeout", "invoice", "billing", "payment", "refund", "account",
+    "dashboard", "report", "export", "import", "upload", "download", "email", "notification", "webhook", "workflow",
+    "sync", "integration", "api", "token", "permission", "role", "user", "admin", "tenant", "screen",
+    "slow", "broken", "missing", "duplicate", "failed", "unexpected", "blank", "wrong", "stuck", "crash",
+    "after", "before", "when", "while", "since", "update", "release", "mobile", "browser", "customer",
+    "please", "urgent", "again", "still", "cannot", "shows", "returns", "every", "some", "the",
+)
+CHARS_PER_WORD = 6.5
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def user_email(customer_id, index):
+    return f"user{index}@{customer_id.lower()}.com"
+
+def tenant_users(customer_id, count, hashed_password, now):
+    """The tenant's users; the first one is an Admin"""
+    return [{
+        "email": user_email(customer_id, j),
+        "hashed_password": hashed_password,
+        "customer_id": customer_id,
+        "role": "Admin" if j == 0 else "User",
+        "created_at": now
+    } for j in range(count)]
+
+def _status_for_age(rng, age_days):
+    # Fresh tickets are mostly open, older ones mostly done
+    if age_days < 1:
+        weights = (60, 30, 10)
+    elif age_days < 7:
+        weights = (30, 30, 40)
+    else:
+        weights = (8, 7, 85)
+    return rng.choices(("Open", "In Progress", "Done"), weights)[0]
+
+def generate_tickets(customer_id, users, start, count, now, days=365, text_size=400, seed=0):
+    """Synthetic tickets start..start+count of a tenant, the same ones for the same arguments.
+
+    Creation dates lean towards `now` over the last `days`, statuses depend on
+    the ticket's age, descriptions average `text_size` characters with a
+    long tail, and a few users file most of the tickets.
+    """
+    rng = random.Random(f"{seed}:{customer_id}:{start}")
+    words_mu = math.log(max(1.0, text_size / CHARS_PER_WORD)) - 0.18  # lognormal mean ~= text_size
+    span = days * SECONDS_PER_DAY
+    tickets = []
+    for k in range(start, start + count):
+        age = span * rng.random() ** 2
+        created_at = now - timedelta(seconds=age)
+        status = _status_for_age(rng, age / SECONDS_PER_DAY)
+        ticket = {
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(3, 9))).capitalize(),
+            "description": " ".join(rng.choices(WORDS, k=max(3, int(rng.lognormvariate(words_mu, 0.6))))),
+            "status": status,
+            "customer_id": customer_id,
+            "created_by": user_email(customer_id, int(users * rng.random() ** 3)),
+            "created_at": created_at,
+            "updated_at": None
+        }
+        if status == "Done":
+            ticket["closed_at"] = min(now, created_at + timedelta(seconds=rng.expovariate(1 / (2 * SECONDS_PER_DAY))))
+            ticket["updated_at"] = ticket["closed_at"]
+        elif status == "In Progress":
+            ticket["updated_at"] = created_at + timedelta(seconds=age * rng.random())
+        tickets.append(ticket)
+    return tickets
+
+def _insert_tickets(task):
+    """Generate and insert one chunk of tickets, with its ticket_stats increments. Runs in the pool workers."""
+    customer_id, users, start, count, options = task
+    now = options["now"]
+    tickets = generate_tickets(customer_id, users, start, count, now, options["days"], options["text_size"], options["seed"])
+    db.get_sync_collection("tickets").insert_many(tickets, ordered=False)
+    delta = StatsDelta()
+    for ticket in tickets:
+        delta.created(ticket)
+    db.get_sync_collection(STATS_COLLECTION).bulk_write(delta.operations(now), ordered=False)
+    return count
+
+def tenant_indexes(prefix):
+    """Indexes of the existing tenants named <prefix><n>"""
+    names = db.get_sync_collection("users").distinct("customer_id", {"customer_id": {"$regex": f"^{prefix}[0-9]+$"}})
+    return sorted(int(name[len(prefix):]) for name in names)
+
+def seed_synthetic(tenants, users_per_tenant, tickets_per_tenant, prefix="LoadTenant", password="password",
+                   mode="add", workers=1, chunk_size=5000, days=365, text_size=400, seed=0):
+    """Generate synthetic tenants <prefix><n> and return a throughput report.
+
+    mode "add" creates `tenants` new tenants numbered after the existing ones,
+    "append" adds `tickets_per_tenant` tickets to tenants 0..tenants-1 (creating
+    the ones that are missing), and "replace" removes every <prefix> tenant first.
+    Tickets are inserted with unordered insert_many in chunks of `chunk_size`,
+    spread over `workers` processes, and counted in ticket_stats as they go.
+    """
+    started = time.perf_counter()
+    if mode == "replace":
+        remove_bulk(prefix)
+    existing = tenant_indexes(prefix)
+    first = existing[-1] + 1 if mode == "add" and existing else 0
+    existing = set(existing)
+    customer_ids = [f"{prefix}{i}" for i in range(first, first + tenants)]
+
+    # bcrypt is slow on purpose; every synthetic user shares one hash
+    hashed_password = get_password_hash(password)
+    now = datetime.utcnow()
+    users_collection = db.get_sync_collection("users")
+    tickets_collection = db.get_sync_collection("tickets")
+    users_inserted = 0
+    tasks = []
+    options = {"now": now, "days": days, "text_size": text_size, "seed": seed}
+    for customer_id in customer_ids:
+        offset = 0
+        if int(customer_id[len(prefix):]) in existing:
+            offset = tickets_collection.count_documents({"customer_id": customer_id})
+        else:
+            users = tenant_users(customer_id, users_per_tenant, hashed_password, now)
+            for position in range(0, len(users), chunk_size):
+                users_collection.insert_many(users[position:position + chunk_size], ordered=False)
+            users_inserted += len(users)
+        for position in range(0, tickets_per_tenant, chunk_size):
+            count = min(chunk_size, tickets_per_tenant - position)
+            tasks.append((customer_id, users_per_tenant, offset + position, count, options))
+
+    tickets_inserted = 0
+    progress_step = max(1, len(tasks) // 10)
+    if workers > 1 and len(tasks) > 1:
+        # spawn, so every worker opens its own MongoClient instead of inheriting one across fork
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            for done, count in enumerate(pool.imap_unordered(_insert_tickets, tasks), 1):
+                tickets_inserted += count
+                if done % progress_step == 0:
+                    logger.info("Seeding tickets: %d of %d chunks", done, len(tasks))
+    else:
+        for done, task in enumerate(tasks, 1):
+            tickets_inserted += _insert_tickets(task)
+            if done % progress_step == 0:
+                logger.info("Seeding tickets: %d of %d chunks", done, len(tasks))
+
+    seconds = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "tenants": customer_ids,
+        "users": users_inserted,
+        "tickets": tickets_inserted,
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "seconds": round(seconds, 3),
+        "tickets_per_second": round(tickets_inserted / seconds, 1) if seconds else None,
+    }
+
+def seed_bulk(tenants, users_per_tenant, tickets_per_tenant, prefix="LoadTenant", password="password", chunk_size=1000):
+    """Insert synthetic tenants <prefix>0..<prefix>{tenants-1} alongside existing data. Returns the tenant ids."""
+    report = seed_synthetic(
+        tenants, users_per_tenant, tickets_per_tenant, prefix=prefix, password=password, mode="append", chunk_size=chunk_size
+    )
+    return report["tenants"]
+
+def remove_bulk(prefix="LoadTenant"):
+    """Delete every synthetic tenant created with the given prefix"""
+    tenant_filter = {"customer_id": {"$regex": f"^{prefix}[0-9]+$"}}
+    db.get_sync_collection("users").delete_many(tenant_filter)
+    db.get_sync_collection("tickets").delete_many(tenant_filter)
+    db.get_sync_collection(STATS_COLLECTION).delete_many({"_id": tenant_filter["customer_id"]})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Seed the demo tenants once, or generate synthetic tenants",
+        epilog="python -m app.seed_data synthetic --tenants 100 --users 20 --tickets 10000 --workers 4",
+    )
+    parser.add_argument("--force", action="store_true", help="wipe users and tickets and seed the demo tenants again")
+    commands = parser.add_subparsers(dest="command")
+    synthetic = commands.add_parser("synthetic", help="generate tenants <prefix><n> and report insert throughput")
+    synthetic.add_argument("--tenants", type=int, default=10)
+    synthetic.add_argument("--users", type=int, default=5, help="users per tenant")
+    synthetic.add_argument("--tickets", type=int, default=1000, help="tickets per tenant")
+    synthetic.add_argument("--prefix", default="LoadTenant")
+    synthetic.add_argument("--password", default="password")
+    synthetic.add_argument("--mode", choices=["add", "append", "replace"], default="add",
+                           help="add new tenants, append tickets to tenants 0..N-1, or replace every <prefix> tenant")
+    synthetic.add_argument("--workers", type=int, default=1, help="processes inserting tickets")
+    synthetic.add_argument("--chunk-size", type=int, default=5000, help="documents per insert_many")
+    synthetic.add_argument("--days", type=int, default=365, help="tickets are created over this many days")
+    synthetic.add_argument("--text-size", type=int, default=400, help="mean description length in characters")
+    synthetic.add_argument("--seed", type=int, default=0)
+    remove = commands.add_parser("remove", help="delete every tenant <prefix><n>")
+    remove.add_argument("--prefix", default="LoadTenant")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.command == "synthetic":
+        report = seed_synthetic(
+            args.tenants, args.users, args.tickets, prefix=args.prefix, password=args.password, mode=args.mode,
+            workers=args.workers, chunk_size=args.chunk_size, days=args.days, text_size=args.text_size, seed=args.seed,
+        )
+        report["tenants"] = len(report["tenants"])
+        print(json.dumps(report, indent=2))
+    elif args.command == "remove":
+        remove_bulk(args.prefix)
+        print(f"Removed the {args.prefix}<n> tenants")
+    else:
+        seed_data(force=args.force)
+    return 0
 
 if __name__ == "__main__":
-    seed_data()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""Pre-aggregated per-tenant ticket statistics.
+
+Each tenant has one document in ticket_stats holding counters that are
+incremented in the same write path (and transaction, where available) as the
+ticket change itself. Reading the stats is a single document fetch however
+many tickets the tenant has:
+
+    {_id: customer_id, total, by_status: {status: n},
+     created_per_day: {"YYYY-MM-DD": n}, closed_count, close_seconds_total}
+
+Mean time to close is derived from closed_at, which is stamped on a ticket
+when it moves to CLOSED_STATUS and removed when it is reopened. Counters
+for tickets written outside the API, or from before this module existed,
+are brought back in line with (archived tickets included):
+
+    python -m app.stats rebuild [--tenant TenantA]
+"""
+from pymongo import ReplaceOne, UpdateOne
+from urllib.parse import quote, unquote
+from datetime import datetime, timedelta
+from app.db import db
+from app.archive import ARCHIVE_COLLECTION
+import argparse
+import sys
+
+STATS_COLLECTION = "ticket_stats"
+CLOSED_STATUS = "Done"
+# Fields a write path has to read back to update the counters
+STATS_PROJECTION = {"customer_id": 1, "status": 1, "created_at": 1, "closed_at": 1}
+
+def _status_key(status):
+    # Status values become field names, which must not contain "." or start with "$"
+    return quote(status, safe="").replace(".", "%2E") or "%"
+
+def _status_name(key):
+    return "" if key == "%" else unquote(key)
+
+def day_key(moment: datetime):
+    return moment.strftime("%Y-%m-%d")
+
+def close_seconds(ticket):
+    """Seconds from creation to close, or None when the ticket is not closed"""
+    if ticket.get("status") != CLOSED_STATUS or ticket.get("closed_at") is None or ticket.get("created_at") is None:
+        return None
+    return (ticket["closed_at"] - ticket["created_at"]).total_seconds()
+
+def status_fields(update_data, now):
+    """update_data with status_changed_at stamped when it sets the status, so older webhook events are seen as stale"""
+    if "status" in update_data and "status_changed_at" not in update_data:
+        return {**update_data, "status_changed_at": now}
+    return update_data
+
+def status_update(update_data, now):
+    """Update document for a $set that may change the status, maintaining closed_at and status_changed_at"""
+    update = {"$set": status_fields(update_data, now)}
+    if "status" in update_data:
+        if update_data["status"] == CLOSED_STATUS:
+            # Keeps the original close time when an already closed ticket is closed again
+            update["$min"] = {"closed_at": now}
+        else:
+            update["$unset"] = {"closed_at": ""}
+    return update
+
+def apply_status_update(before, update_data, now):
+    """The ticket as status_update() leaves it, given the document before the update"""
+    after = {**before, **status_fields(update_data, now)}
+    if "status" in update_data:
+        if update_data["status"] == CLOSED_STATUS:
+            after["closed_at"] = before.get("closed_at") or now
+        else:
+            after.pop("closed_at", None)
+    return after
+
+class StatsDelta:
+    """Counter increments collected from one or more ticket writes"""
+
+    def __init__(self):
+        self._increments = {}
+
+    def _inc(self, customer_id, field, amount):
+        increments = self._increments.setdefault(customer_id, {})
+        increments[field] = increments.get(field, 0) + amount
+
+    def _count(self, ticket, sign):
+        customer_id = ticket["customer_id"]
+        self._inc(customer_id, "total", sign)
+        self._inc(customer_id, f"by_status.{_status_key(ticket.get('status') or '')}", sign)
+        if ticket.get("created_at") is not None:
+            self._inc(customer_id, f"created_per_day.{day_key(ticket['created_at'])}", sign)
+        seconds = close_seconds(ticket)
+        if seconds is not None:
+            self._inc(customer_id, "closed_count", sign)
+            self._inc(customer_id, "close_seconds_total", sign * seconds)
+
+    def created(self, ticket):
+        self._count(ticket, 1)
+        return self
+
+    def deleted(self, ticket):
+        self._count(ticket, -1)
+        return self
+
+    def changed(self, before, after):
+        self._count(before, -1)
+        self._count(after, 1)
+        return self
+
+    def operations(self, now):
+        operations = []
+        for customer_id, increments in self._increments.items():
+            increments = {field: amount for field, amount in increments.items() if amount}
+            if increments:
+                operations.append(UpdateOne(
+                    {"_id": customer_id},
+                    {"$inc": increments, "$set": {"updated_at": now}},
+                    upsert=True
+                ))
+        return operations
+
+    async def apply(self, session=None):
+        operations = self.operations(datetime.utcnow())
+        if operations:
+            await db.get_collection(STATS_COLLECTION).bulk_write(operations, ordered=False, session=session)
+
+def stats_response(document, days, today):
+    """Public view of a tenant's counters: the last `days` days, zeros included"""
+    document = document or {}
+    per_day = document.get("created_per_day", {})
+    dates = [day_key(today - timedelta(days=offset)) for offset in range(days - 1, -1, -1)]
+    closed_count = document.get("closed_count", 0)
+    return {
+        "total": document.get("total", 0),
+        "by_status": {_status_name(key): count for key, count in document.get("by_status", {}).items() if count},
+        "created_per_day": [{"date": date, "count": per_day.get(date, 0)} for date in dates],
+        "closed_count": closed_count,
+        "mean_time_to_close_seconds": document.get("close_seconds_total", 0) / closed_count if closed_count else None,
+        "updated_at": document.get("updated_at"),
+    }
+
+async def get_stats(customer_id, days):
+    document = await db.get_collection(STATS_COLLECTION).find_one({"_id": customer_id})
+    return stats_response(document, days, datetime.utcnow())
+
+def rebuild_stats(customer_id=None):
+    """Recompute counters from the tickets with aggregation pipelines. Returns the tenants written.
+
+    Writes that land while the rebuild runs may be lost; run it when the
+    tenant is quiet.
+    """
+    match = [{"$match": {"customer_id": customer_id}}] if customer_id is not None else []
+    documents = {}
+
+    def document(tenant):
+        return documents.setdefault(tenant, {
+            "_id": tenant, "total": 0, "by_status": {}, "created_per_day": {},
+            "closed_count": 0, "close_seconds_total": 0,
+        })
+
+    # Archived tickets still count; those archived to segment files are not seen here
+    for collection_name in ("tickets", ARCHIVE_COLLECTION):
+        tickets = db.get_sync_collection(collection_name)
+        for row in tickets.aggregate(match + [
+            {"$group": {"_id": {"customer_id": "$customer_id", "status": "$status"}, "count": {"$sum": 1}}},
+        ]):
+            stats = document(row["_id"]["customer_id"])
+            stats["total"] += row["count"]
+            key = _status_key(row["_id"].get("status") or "")
+            stats["by_status"][key] = stats["by_status"].get(key, 0) + row["count"]
+
+        for row in tickets.aggregate(match + [
+            {"$match": {"created_at": {"$type": "date"}}},
+            {"$group": {
+                "_id": {"customer_id": "$customer_id", "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}},
+                "count": {"$sum": 1},
+            }},
+        ]):
+            per_day = document(row["_id"]["customer_id"])["created_per_day"]
+            per_day[row["_id"]["day"]] = per_day.get(row["_id"]["day"], 0) + row["count"]
+
+        for row in tickets.aggregate(match + [
+            {"$match": {"status": CLOSED_STATUS, "closed_at": {"$type": "date"}, "created_at": {"$type": "date"}}},
+            {"$group": {
+                "_id": "$customer_id",
+                "count": {"$sum": 1},
+                "milliseconds": {"$sum": {"$subtract": ["$closed_at", "$created_at"]}},
+            }},
+        ]):
+            stats = document(row["_id"])
+            stats["closed_count"] += row["count"]
+            stats["close_seconds_total"] += row["milliseconds"] / 1000
+
+    stats_collection = db.get_sync_collection(STATS_COLLECTION)
+    now = datetime.utcnow()
+    writes = [ReplaceOne({"_id": tenant}, {**stats, "updated_at": now}, upsert=True) for tenant, stats in documents.items()]
+    if writes:
+        stats_collection.bulk_write(writes, ordered=False)
+    # Tenants whose tickets are all gone
+    stale = {"_id": {"$nin": list(documents)}}
+    if customer_id is not None:
+        stale = {"_id": customer_id} if customer_id not in documents else None
+    if stale is not None:
+        stats_collection.delete_many(stale)
+    return sorted(documents)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the pre-aggregated ticket statistics")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--tenant", help="only rebuild this customer_id")
+    args = parser.parse_args(argv)
+
+    tenants = rebuild_stats(args.tenant)
+    print(f"Rebuilt ticket stats for {len(tenants)} tenant(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
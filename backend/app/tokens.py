@@ -0,0 +1,281 @@
+"""Access and refresh tokens: signing keys, verification cache and revocation.
+
+Access tokens are short-lived HS256 JWTs. They are signed with the active
+key of a keyring and name it in their `kid` header, so a new key can be
+introduced while tokens signed with the previous one stay valid until they
+expire:
+
+    JWT_KEYS=2026-10=<secret>,2026-04=<secret>   kid=secret pairs; without it SECRET_KEY is the only key
+    JWT_ACTIVE_KID=2026-10                       key that signs new tokens (default: the first)
+    ACCESS_TOKEN_EXPIRE_MINUTES=30
+    REFRESH_TOKEN_EXPIRE_DAYS=14
+    REFRESH_REUSE_GRACE_SECONDS=10               a used refresh token is only refused, not treated as stolen, this soon after use
+    TOKEN_CACHE_MAX_SIZE=10000                   verified tokens kept in memory
+    TOKEN_REVOCATION_REFRESH_SECONDS=10
+
+Tokens without a kid, issued before the keyring existed, are checked with
+the "default" key, which is SECRET_KEY unless JWT_KEYS says otherwise.
+
+A token whose signature has been checked once is kept in an LRU with its
+claims, so a client polling with the same token skips the HMAC and JSON
+decoding. Expiry and revocation are still checked on every request.
+
+Revocations live in REVOCATION_COLLECTION and in memory: one token by jti
+(logout), or every token a user was issued up to a point in time (user
+deleted). Each worker reloads them every TOKEN_REVOCATION_REFRESH_SECONDS,
+and its own revocations apply at once. Entries expire with the tokens they
+cover.
+
+Refresh tokens are random strings. Only their SHA-256 digest is stored, in
+REFRESH_COLLECTION. Every refresh uses the token up and returns a new one
+from the same family. Presenting a used token again means it was copied,
+so the whole family is revoked. Within REFRESH_REUSE_GRACE_SECONDS of its
+use it is only refused, since two tabs refreshing at once look the same.
+"""
+from collections import OrderedDict
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+from uuid import uuid4
+from app.db import db
+from app.log import parse_pairs
+from jose import JWTError, jwt
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import time
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+DEFAULT_KID = "default"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+REFRESH_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+TOKEN_REVOCATION_REFRESH_SECONDS = float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "10"))
+REVOCATION_COLLECTION = "revoked_tokens"
+REFRESH_COLLECTION = "refresh_tokens"
+
+class Keyring:
+    def __init__(self, keys: dict, active_kid: str):
+        if active_kid not in keys:
+            raise ValueError(f"JWT_ACTIVE_KID {active_kid!r} is not in the keyring")
+        self.keys = keys
+        self.active_kid = active_kid
+
+    @classmethod
+    def from_env(cls):
+        keys = parse_pairs(os.getenv("JWT_KEYS", ""))
+        if not keys:
+            keys = {DEFAULT_KID: os.getenv("SECRET_KEY", "your-secret-key-here")}
+        return cls(keys, os.getenv("JWT_ACTIVE_KID") or next(iter(keys)))
+
+    def sign(self, claims):
+        return jwt.encode(claims, self.keys[self.active_kid], algorithm=ALGORITHM, headers={"kid": self.active_kid})
+
+    def decode(self, token):
+        """Claims of a token signed by any key in the ring. Raises JWTError."""
+        kid = jwt.get_unverified_header(token).get("kid", DEFAULT_KID)
+        key = self.keys.get(kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key, algorithms=[ALGORITHM])
+
+class VerifiedTokens:
+    """LRU of tokens whose signature has been checked: token -> claims. Only used from the event loop."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._tokens = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token, now):
+        claims = self._tokens.get(token)
+        if claims is None:
+            self.misses += 1
+            return None
+        if claims.get("exp", float("inf")) <= now:
+            del self._tokens[token]
+            self.misses += 1
+            return None
+        self._tokens.move_to_end(token)
+        self.hits += 1
+        return claims
+
+    def put(self, token, claims):
+        if self.maxsize <= 0:
+            return
+        self._tokens[token] = claims
+        if len(self._tokens) > self.maxsize:
+            self._tokens.popitem(last=False)
+
+    def clear(self):
+        self._tokens.clear()
+
+    def __len__(self):
+        return len(self._tokens)
+
+class Revocations:
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.jtis = set()
+        # subject -> tokens issued before this time (epoch seconds) are revoked
+        self.users = {}
+        # This worker's own revocations (jti -> exp, ("user", subject) -> before), so a reload
+        # that started before they were written does not drop them
+        self._local = {}
+        self._task = None
+
+    def is_revoked(self, claims):
+        if claims.get("jti") in self.jtis:
+            return True
+        before = self.users.get(claims.get("sub"))
+        # iat has whole seconds: a token from the second of the revocation (a login right after a reset) stays valid
+        return before is not None and claims.get("iat", 0) < int(before)
+
+    async def revoke_token(self, claims):
+        """Revoke one access token until it expires"""
+        jti = claims.get("jti")
+        if jti is None:
+            return
+        expires = claims.get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        self.jtis.add(jti)
+        self._local[jti] = expires
+        await db.get_collection(REVOCATION_COLLECTION).replace_one(
+            {"_id": f"jti:{jti}"}, {"jti": jti, "expires_at": datetime.utcfromtimestamp(expires)}, upsert=True
+        )
+
+    async def revoke_user(self, subject):
+        """Revoke every access and refresh token the user holds now"""
+        now = int(time.time())
+        self.users[subject] = now
+        self._local[("user", subject)] = now
+        expires_at = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        await db.get_collection(REVOCATION_COLLECTION).replace_one(
+            {"_id": f"user:{subject}"}, {"sub": subject, "before": now, "expires_at": expires_at}, upsert=True
+        )
+        await db.get_collection(REFRESH_COLLECTION).delete_many({"sub": subject})
+
+    async def load(self):
+        jtis, users = set(), {}
+        now = datetime.utcnow()
+        # The TTL monitor runs once a minute, so expired entries are skipped here too
+        async for entry in db.get_collection(REVOCATION_COLLECTION).find({"expires_at": {"$gt": now}}):
+            if "jti" in entry:
+                jtis.add(entry["jti"])
+            else:
+                users[entry["sub"]] = max(entry["before"], users.get(entry["sub"], 0))
+        # Revocations made here while the query ran may be missing from its result
+        horizon = time.time() - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        for key, moment in list(self._local.items()):
+            if isinstance(key, tuple):
+                if moment < horizon:
+                    del self._local[key]
+                else:
+                    users[key[1]] = max(moment, users.get(key[1], 0))
+            elif moment < time.time():
+                del self._local[key]
+            else:
+                jtis.add(key)
+        self.jtis = jtis
+        self.users = users
+
+    async def start(self):
+        if self._task is None:
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Loading token revocations failed")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reloading token revocations failed")
+
+# Global keyring, verification cache and revocation list
+keyring = Keyring.from_env()
+verified_tokens = VerifiedTokens(TOKEN_CACHE_MAX_SIZE)
+revocations = Revocations(TOKEN_REVOCATION_REFRESH_SECONDS)
+
+def create_access_token(data: dict, expires_delta: timedelta = None):
+    now = datetime.utcnow()
+    claims = {
+        **data,
+        "iat": now,
+        "exp": now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)),
+        "jti": uuid4().hex,
+    }
+    return keyring.sign(claims)
+
+def verify_access_token(token: str):
+    """Claims of a valid, unexpired and unrevoked access token. Raises JWTError."""
+    claims = verified_tokens.get(token, time.time())
+    if claims is None:
+        claims = keyring.decode(token)
+        verified_tokens.put(token, claims)
+    if revocations.is_revoked(claims):
+        raise JWTError("Token has been revoked")
+    return claims
+
+def _digest(refresh_token: str):
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+async def issue_refresh_token(user: dict, family: str = None):
+    """A new refresh token for the user document, in a new family unless one is given"""
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await db.get_collection(REFRESH_COLLECTION).insert_one({
+        "_id": _digest(refresh_token),
+        "family": family or uuid4().hex,
+        "sub": user["email"],
+        "customer_id": user["customer_id"],
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "used_at": None,
+    })
+    return refresh_token
+
+async def use_refresh_token(refresh_token: str):
+    """Use up a refresh token. Returns its record, or None when it is unknown, expired or already used."""
+    refresh_tokens = db.get_collection(REFRESH_COLLECTION)
+    digest = _digest(refresh_token)
+    now = datetime.utcnow()
+    record = await refresh_tokens.find_one_and_update(
+        {"_id": digest, "used_at": None},
+        {"$set": {"used_at": now}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if record is None:
+        used = await refresh_tokens.find_one({"_id": digest}, {"family": 1, "sub": 1, "used_at": 1})
+        if used is not None and (now - used["used_at"]).total_seconds() >= REFRESH_REUSE_GRACE_SECONDS:
+            await refresh_tokens.delete_many({"family": used["family"]})
+            logger.warning("Refresh token reused; its family was revoked", extra={"sub": used["sub"]})
+        return None
+    if record["expires_at"] <= now:
+        return None
+    return record
+
+async def revoke_refresh_token(refresh_token: str):
+    """Revoke the refresh token's whole family (logout)"""
+    refresh_tokens = db.get_collection(REFRESH_COLLECTION)
+    record = await refresh_tokens.find_one({"_id": _digest(refresh_token)}, {"family": 1})
+    if record is not None:
+        await refresh_tokens.delete_many({"family": record["family"]})
@@ -0,0 +1,219 @@
+"""Bulk user import for onboarding a whole customer in one request.
+
+The body is either CSV with a header row naming `email`, `password` and
+optionally `role`, or NDJSON with one {"email", "password", "role"} object
+per line. It is read as it arrives and processed USER_IMPORT_CHUNK_SIZE rows
+at a time, so memory stays flat however large the file is:
+
+1. rows are validated, and an email repeated in the file is only imported once
+2. one $in lookup finds the emails that already have an account
+3. the remaining passwords are hashed on the bcrypt pool, at most
+   USER_IMPORT_HASH_CONCURRENCY at a time so logins still find a free worker
+4. one unordered bulk_write inserts the new users and updates the existing
+   ones being replaced
+
+The unique email index has the last word: an account registered by someone
+else between the lookup and the write fails its insert and is reported as
+already existing, without a second query. Existing accounts of the importing tenant are
+skipped, or get the file's password and role with update_existing. Accounts
+of another tenant are never touched.
+
+    USER_IMPORT_CHUNK_SIZE=500
+    USER_IMPORT_MAX_ROWS=100000     rows after this are not read; the report says truncated
+    USER_IMPORT_MAX_ERRORS=100      failed rows listed in the report (all are counted)
+"""
+from app.db import db
+from app.metrics import registry
+from app.passwords import PASSWORD_HASH_WORKERS, password_hasher
+from app.rbac import Role
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+import codecs
+import csv
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+USER_IMPORT_CHUNK_SIZE = int(os.getenv("USER_IMPORT_CHUNK_SIZE", "500"))
+USER_IMPORT_MAX_ROWS = int(os.getenv("USER_IMPORT_MAX_ROWS", "100000"))
+USER_IMPORT_MAX_ERRORS = int(os.getenv("USER_IMPORT_MAX_ERRORS", "100"))
+# Hashes an import may run at once. The other workers stay free for logins.
+USER_IMPORT_HASH_CONCURRENCY = int(os.getenv("USER_IMPORT_HASH_CONCURRENCY", str(max(1, PASSWORD_HASH_WORKERS // 2))))
+
+ROLES = (Role.Admin, Role.User)
+IMPORT_MEDIA_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+DUPLICATE_KEY = 11000
+
+user_import_rows = registry.counter("user_import_rows", "Rows of bulk user imports by outcome", ("result",))
+
+def import_format(content_type: str):
+    """csv or ndjson for a request Content-Type, None when it is neither"""
+    return IMPORT_MEDIA_TYPES.get(content_type.split(";")[0].strip().lower())
+
+async def iter_lines(chunks):
+    """Complete lines from a stream of byte chunks, numbered from 1"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    number = 0
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            number += 1
+            yield number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+async def iter_rows(lines, format):
+    """(line number, row dict) for every non-blank line. The row is a str error when it cannot be parsed."""
+    header = None
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        if format == "ndjson":
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = "Invalid JSON"
+            else:
+                if not isinstance(row, dict):
+                    row = "Expected a JSON object"
+        else:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip().lower() for name in values]
+                if "email" not in header or "password" not in header:
+                    raise ValueError("The CSV header must name email and password columns")
+                continue
+            row = dict(zip(header, values))
+        yield number, row
+
+def validate(row):
+    """(email, password, role) of a row, or a str error"""
+    if isinstance(row, str):
+        return row
+    email, password, role = row.get("email"), row.get("password"), row.get("role") or Role.User
+    if not isinstance(email, str) or "@" not in email.strip():
+        return "Invalid email"
+    if not isinstance(password, str) or not password:
+        return "Missing password"
+    if role not in ROLES:
+        return f"Role must be one of {', '.join(ROLES)}"
+    return email.strip(), password, role
+
+class UserImport:
+    """One import into a tenant. Feed it rows with add(), then call finish() for the report."""
+
+    def __init__(self, customer_id: str, update_existing: bool = False):
+        self.customer_id = customer_id
+        self.update_existing = update_existing
+        self.seen = set()
+        self.chunk = []
+        self.counts = {"rows": 0, "created": 0, "updated": 0, "skipped": 0, "duplicates": 0, "failed": 0}
+        self.errors = []
+        self.chunks = 0
+        self.truncated = False
+        # Existing users of the tenant whose password or role changed
+        self.updated_emails = []
+
+    def fail(self, line, email, error):
+        self.counts["failed"] += 1
+        if len(self.errors) < USER_IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "email": email, "error": error})
+
+    async def add(self, line, row):
+        """Queue one row. Returns False once USER_IMPORT_MAX_ROWS rows have been read."""
+        if self.counts["rows"] >= USER_IMPORT_MAX_ROWS:
+            self.truncated = True
+            return False
+        self.counts["rows"] += 1
+        valid = validate(row)
+        if isinstance(valid, str):
+            self.fail(line, row.get("email") if isinstance(row, dict) else None, valid)
+        elif valid[0] in self.seen:
+            self.counts["duplicates"] += 1
+        else:
+            self.seen.add(valid[0])
+            self.chunk.append((line, *valid))
+            if len(self.chunk) >= USER_IMPORT_CHUNK_SIZE:
+                await self.flush()
+        return True
+
+    async def flush(self):
+        chunk, self.chunk = self.chunk, []
+        if not chunk:
+            return
+        users = db.get_collection("users")
+        existing = {
+            user["email"]: user
+            async for user in users.find({"email": {"$in": [email for _, email, _, _ in chunk]}}, {"customer_id": 1, "email": 1})
+        }
+
+        to_write = []
+        for line, email, password, role in chunk:
+            user = existing.get(email)
+            if user is None or (self.update_existing and user["customer_id"] == self.customer_id):
+                to_write.append((line, email, password, role, user))
+            elif user["customer_id"] == self.customer_id:
+                self.counts["skipped"] += 1
+            else:
+                self.fail(line, email, "Email already registered")
+
+        hashes = await password_hasher.hash_many([password for _, _, password, _, _ in to_write], USER_IMPORT_HASH_CONCURRENCY)
+        now = datetime.utcnow()
+        writes = []
+        for (line, email, password, role, user), hashed_password in zip(to_write, hashes):
+            if user is None:
+                writes.append(InsertOne({
+                    "email": email,
+                    "hashed_password": hashed_password,
+                    "customer_id": self.customer_id,
+                    "role": role,
+                    "created_at": now,
+                }))
+            else:
+                writes.append(UpdateOne({"_id": user["_id"]}, {"$set": {"hashed_password": hashed_password, "role": role}}))
+
+        write_errors = {}
+        if writes:
+            try:
+                await users.bulk_write(writes, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {error["index"]: error for error in e.details["writeErrors"]}
+
+        for position, (line, email, _, _, user) in enumerate(to_write):
+            error = write_errors.get(position)
+            if error is not None:
+                # Registered by someone else after the lookup
+                self.fail(line, email, "Email already registered" if error["code"] == DUPLICATE_KEY else error["errmsg"])
+            elif user is not None:
+                self.counts["updated"] += 1
+                self.updated_emails.append(email)
+            else:
+                self.counts["created"] += 1
+
+        self.chunks += 1
+        logger.info("User import progress", extra={"customer_id": self.customer_id, "progress": {**self.counts, "chunks": self.chunks}})
+
+    async def finish(self):
+        await self.flush()
+        for result in ("created", "updated", "skipped", "duplicates", "failed"):
+            if self.counts[result]:
+                user_import_rows.inc(result, amount=self.counts[result])
+        return {**self.counts, "chunks": self.chunks, "truncated": self.truncated, "errors": self.errors}
+
+async def import_users(chunks, format: str, customer_id: str, update_existing: bool = False):
+    """Import users from a byte stream into the tenant. Returns (report, emails of updated users)."""
+    user_import = UserImport(customer_id, update_existing)
+    async for line, row in iter_rows(iter_lines(chunks), format):
+        if not await user_import.add(line, row):
+            break
+    return await user_import.finish(), user_import.updated_emails
@@ -0,0 +1,280 @@
+"""Batched ingestion of n8n ticket status callbacks.
+
+Events posted to /webhook/ticket-done/batch are validated, queued in memory
+and acknowledged straight away. A background flusher applies the queue
+every WEBHOOK_FLUSH_INTERVAL_MS, or as soon as WEBHOOK_FLUSH_MAX_EVENTS
+are waiting. A flush costs a fixed number of round trips however many
+events it carries:
+
+1. insert_many of the idempotency keys. Keys already present (n8n
+   retries) are duplicates and are skipped. The keys expire after
+   WEBHOOK_IDEMPOTENCY_TTL_SECONDS through a TTL index.
+2. One find for the current state of the tickets involved.
+3. One ordered bulk_write of the status updates, plus the stats counters.
+
+Each update is conditional on the ticket's status_changed_at being older
+than the event's occurred_at, so an event that arrives after a newer one
+for the same ticket is rejected as stale. This also makes replaying an
+event harmless. Only the updates that matched are counted in the stats and
+sent to SSE subscribers; when a write fails part way, the events after the
+failure get their idempotency keys back so n8n can retry them.
+
+Acknowledged events live only in memory until the next flush (tens of
+milliseconds). Shutdown flushes whatever is queued. Callers that need
+the outcome can pass wait=true.
+"""
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from datetime import datetime, timedelta, timezone
+from app.db import db
+from app.events import ticket_events
+from app.response_cache import response_cache
+from app.metrics import registry
+from app.stats import StatsDelta, apply_status_update, status_update
+from fastapi import HTTPException
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_COLLECTION = "webhook_idempotency"
+WEBHOOK_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("WEBHOOK_IDEMPOTENCY_TTL_SECONDS", "86400"))
+WEBHOOK_BATCH_MAX_EVENTS = int(os.getenv("WEBHOOK_BATCH_MAX_EVENTS", "1000"))
+WEBHOOK_FLUSH_MAX_EVENTS = int(os.getenv("WEBHOOK_FLUSH_MAX_EVENTS", "500"))
+WEBHOOK_FLUSH_INTERVAL_MS = float(os.getenv("WEBHOOK_FLUSH_INTERVAL_MS", "50"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "10000"))
+
+DUPLICATE_KEY = 11000
+
+webhook_events = registry.counter("webhook_events", "n8n status events processed", ("result",))
+webhook_pending = registry.gauge("webhook_events_pending", "n8n status events acknowledged but not yet written")
+webhook_flush_size = registry.histogram("webhook_flush_size", "Events written per webhook flush", (), (1, 5, 10, 50, 100, 250, 500, 1000))
+
+def utc_naive(moment: datetime):
+    """Timestamps are stored as naive UTC like the rest of the tickets"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+async def claim_keys(events, now):
+    """Record the events' idempotency keys. Returns the positions whose key was already there."""
+    keyed = [(position, event["key"]) for position, event in enumerate(events) if event["key"] is not None]
+    if not keyed:
+        return set()
+    try:
+        await db.get_collection(IDEMPOTENCY_COLLECTION).insert_many(
+            [{"_id": key, "created_at": now} for _, key in keyed], ordered=False
+        )
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(error["code"] != DUPLICATE_KEY for error in errors):
+            raise
+        return {keyed[error["index"]][0] for error in errors}
+    return set()
+
+async def release_keys(events):
+    keys = [event["key"] for event in events if event["key"] is not None]
+    if keys:
+        await db.get_collection(IDEMPOTENCY_COLLECTION).delete_many({"_id": {"$in": keys}})
+
+async def apply_status_events(events):
+    """Apply a batch of status events. Returns one of applied/duplicate/stale/not_found/error per event."""
+    now = datetime.utcnow()
+    results = [None] * len(events)
+    duplicates = await claim_keys(events, now)
+    for position in duplicates:
+        results[position] = "duplicate"
+    pending = [position for position in range(len(events)) if position not in duplicates]
+    if not pending:
+        return results
+
+    tickets = db.get_collection("tickets")
+    # Positions whose update reached the database; every other claimed key is given back on failure
+    written_positions = set()
+    try:
+        ticket_ids = list({events[position]["ticket_id"] for position in pending})
+        current = {ticket["_id"]: ticket async for ticket in tickets.find({"_id": {"$in": ticket_ids}})}
+
+        writes = []
+        applied = []
+        # Oldest first, so several events for one ticket in a flush end on the newest
+        for position in sorted(pending, key=lambda position: events[position]["occurred_at"]):
+            event = events[position]
+            before = current.get(event["ticket_id"])
+            if before is None or before["customer_id"] != event["customer_id"]:
+                results[position] = "not_found"
+                continue
+            changed_at = before.get("status_changed_at")
+            if changed_at is not None and changed_at >= event["occurred_at"]:
+                results[position] = "stale"
+                continue
+            update_data = {"status": event["status"], "status_changed_at": event["occurred_at"]}
+            after = apply_status_update(before, update_data, now)
+            writes.append(UpdateOne(
+                {
+                    "_id": event["ticket_id"],
+                    "customer_id": event["customer_id"],
+                    "$or": [
+                        {"status_changed_at": {"$exists": False}},
+                        {"status_changed_at": {"$lt": event["occurred_at"]}},
+                    ],
+                },
+                status_update(update_data, now)
+            ))
+            current[event["ticket_id"]] = after
+            applied.append((position, before, after))
+        if not writes:
+            return results
+
+        written = len(writes)
+        try:
+            matched = (await tickets.bulk_write(writes, ordered=True)).matched_count
+        except BulkWriteError as e:
+            # Ordered, so the writes before the first error went through and none after it ran
+            written = e.details["writeErrors"][0]["index"]
+            matched = e.details["nMatched"]
+            logger.error("Webhook batch write failed at %d of %d: %s", written, len(writes), e)
+        except PyMongoError as e:
+            written = matched = 0
+            logger.error("Webhook batch write failed: %s", e)
+
+        applied, failed = applied[:written], applied[written:]
+        written_positions.update(position for position, _, _ in applied)
+        if failed:
+            # Let n8n retry these events
+            await release_keys([events[position] for position, _, _ in failed])
+            for position, _, _ in failed:
+                results[position] = "error"
+        if matched < written:
+            applied = await confirm_applied(tickets, events, applied, results)
+    except BaseException:
+        await release_keys([events[position] for position in pending if position not in written_positions])
+        raise
+
+    stats = StatsDelta()
+    for position, before, after in applied:
+        stats.changed(before, after)
+        results[position] = "applied"
+    if applied:
+        # The tickets are written, so a failure from here on must not turn the results into errors
+        try:
+            await stats.apply()
+        except PyMongoError as e:
+            logger.error("Webhook batch stats update failed, counters are behind until rebuild_stats: %s", e)
+        for customer_id in {ticket["customer_id"] for _, _, ticket in applied}:
+            response_cache.invalidate(customer_id)
+        for _, _, ticket in applied:
+            ticket_events.emit("ticket.updated", ticket)
+    return results
+
+async def confirm_applied(tickets, events, written, results):
+    """The written events whose guarded update matched.
+
+    Fewer matches than writes means someone changed a ticket between the read
+    and the write. The tickets are read again: a ticket's events count as
+    applied up to the one whose occurred_at it now carries, the others are
+    marked stale.
+    """
+    ticket_ids = list({events[position]["ticket_id"] for position, _, _ in written})
+    stored = {
+        ticket["_id"]: ticket.get("status_changed_at")
+        async for ticket in tickets.find({"_id": {"$in": ticket_ids}}, {"status_changed_at": 1})
+    }
+    last = {}
+    for index, (position, _, _) in enumerate(written):
+        event = events[position]
+        changed_at = stored.get(event["ticket_id"])
+        # BSON dates keep milliseconds only
+        if changed_at is not None and abs(changed_at - event["occurred_at"]) < timedelta(milliseconds=1):
+            last[event["ticket_id"]] = index
+    confirmed = []
+    for index, entry in enumerate(written):
+        if index <= last.get(events[entry[0]]["ticket_id"], -1):
+            confirmed.append(entry)
+        else:
+            results[entry[0]] = "stale"
+    return confirmed
+
+class WebhookBatcher:
+    """In-memory queue of status events, flushed on size or time"""
+
+    def __init__(self, max_events: int, interval_ms: float, max_pending: int):
+        self.max_events = max_events
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+        self._pending = []
+        self._wake = None
+        self._task = None
+        self._stopping = False
+
+    async def start(self):
+        if self._task is None:
+            # Bound to the running loop, which differs between app lifespans in tests
+            self._wake = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        try:
+            if self._task is not None:
+                # Not cancelled: a flush in progress owns its batch and must finish it
+                self._stopping = True
+                self._wake.set()
+                try:
+                    await self._task
+                finally:
+                    self._task = None
+            # Acknowledged events must not be lost on a clean shutdown
+            await self.flush()
+        finally:
+            batch, self._pending = self._pending, []
+            webhook_pending.set(0)
+            self._resolve(batch, ["error"] * len(batch))
+
+    def submit(self, events):
+        """Queue events; returns one future per event resolving to its result"""
+        if len(self._pending) + len(events) > self.max_pending:
+            raise HTTPException(status_code=503, detail="Webhook queue is full", headers={"Retry-After": "1"})
+        loop = asyncio.get_running_loop()
+        futures = []
+        for event in events:
+            future = loop.create_future()
+            self._pending.append((event, future))
+            futures.append(future)
+        webhook_pending.set(len(self._pending))
+        if len(self._pending) >= self.max_events and self._wake is not None:
+            self._wake.set()
+        return futures
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_events], self._pending[self.max_events:]
+            webhook_pending.set(len(self._pending))
+            results = ["error"] * len(batch)
+            try:
+                results = await apply_status_events([event for event, _ in batch])
+            except Exception:
+                logger.exception("Webhook batch failed", extra={"events": len(batch)})
+            finally:
+                # Also when cancelled, so no request is left waiting on a future
+                webhook_flush_size.observe(len(batch))
+                self._resolve(batch, results)
+
+    def _resolve(self, batch, results):
+        for (_, future), result in zip(batch, results):
+            webhook_events.inc(result)
+            if not future.done():
+                future.set_result(result)
+
+# Global batcher instance
+webhook_batcher = WebhookBatcher(WEBHOOK_FLUSH_MAX_EVENTS, WEBHOOK_FLUSH_INTERVAL_MS, WEBHOOK_MAX_PENDING)
@@ -0,0 +1,5 @@
+"""Backend benchmarks. Their reports are printed to stdout as JSON, so the app's
+per-request access log stays off unless LOG_ACCESS is set."""
+import os
+
+os.environ.setdefault("LOG_ACCESS", "false")
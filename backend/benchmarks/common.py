@@ -0,0 +1,44 @@
+"""Shared helpers for the backend benchmarks"""
+import asyncio
+import json
+import statistics
+import time
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(name, latencies, elapsed, **extra):
+    """Turn raw per-request latencies (seconds) into a JSON-friendly report"""
+    return {
+        "name": name,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        **extra,
+    }
+
+async def run_concurrently(request, total, concurrency):
+    """Call the async `request(i)` `total` times with at most `concurrency` in flight"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await request(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(i) for i in range(total)))
+    return latencies, time.perf_counter() - started
+
+def print_report(results):
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,100 @@
+"""End-to-end latency of large ticket lists with and without compression.
+
+Sends 1k and 10k-ticket JSON bodies through CompressionMiddleware and
+measures the server's compression time, the bytes on the wire and the
+client's decompression time. The end-to-end latency over each link is
+compression + transfer + decompression, where the transfer time is
+modeled from the link's bandwidth. Needs no database or network.
+
+    python -m benchmarks.compression --sizes 1000 10000 --links-mbps 2 20 100 1000
+    python -m benchmarks.compression --gzip-levels 1 6 9 --brotli-qualities 4 --zstd-levels 3
+"""
+from app.compression import CompressionMiddleware, brotli, zstandard
+from benchmarks.common import print_report
+from benchmarks.serialization import fast_path, make_tickets
+import argparse
+import asyncio
+import statistics
+import time
+import zlib
+
+def decompressor(encoding):
+    if encoding == "gzip":
+        return lambda body: zlib.decompress(body, 31)
+    if encoding == "br":
+        return brotli.decompress
+    if encoding == "zstd":
+        return lambda body: zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return lambda body: body
+
+async def serve(middleware, accept_encoding):
+    """Run one request through the middleware and return the body sent"""
+    chunks = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    await middleware(scope, None, send)
+    return b"".join(chunks)
+
+async def measure(name, encoding, body, repeat, links, **levels):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    # The whole body is compressed inline so the timing is the CPU cost
+    middleware = CompressionMiddleware(app, enabled=True, encodings=encoding or "gzip", thread_min_size=float("inf"), **levels)
+    decode = decompressor(encoding)
+    server, client = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        sent = await serve(middleware, encoding or "identity")
+        server.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        assert decode(sent) == body
+        client.append(time.perf_counter() - started)
+    compress_ms = statistics.median(server) * 1000
+    decompress_ms = statistics.median(client) * 1000
+    return {
+        "name": name,
+        "bytes": len(sent),
+        "ratio": round(len(body) / len(sent), 2),
+        "compress_ms": round(compress_ms, 2),
+        "decompress_ms": round(decompress_ms, 2),
+        "end_to_end_ms": {
+            f"{mbps:g}mbps": round(compress_ms + len(sent) * 8 / (mbps * 1e6) * 1000 + decompress_ms, 1) for mbps in links
+        },
+    }
+
+async def main(args):
+    results = []
+    for size in args.sizes:
+        body = fast_path(make_tickets(size))
+        variants = [("identity", None, {})]
+        variants += [(f"gzip-{level}", "gzip", {"gzip_level": level}) for level in args.gzip_levels]
+        if brotli is not None:
+            variants += [(f"br-{quality}", "br", {"brotli_quality": quality}) for quality in args.brotli_qualities]
+        if zstandard is not None:
+            variants += [(f"zstd-{level}", "zstd", {"zstd_level": level}) for level in args.zstd_levels]
+        for name, encoding, levels in variants:
+            result = await measure(name, encoding, body, args.repeat, args.links_mbps, **levels)
+            results.append({"tickets": size, **result})
+    print_report({
+        "repeat": args.repeat,
+        "available": ["gzip"] + (["br"] if brotli is not None else []) + (["zstd"] if zstandard is not None else []),
+        "results": results,
+    })
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--links-mbps", type=float, nargs="+", default=[2, 20, 100, 1000])
+    parser.add_argument("--gzip-levels", type=int, nargs="+", default=[1, 3, 6])
+    parser.add_argument("--brotli-qualities", type=int, nargs="+", default=[4])
+    parser.add_argument("--zstd-levels", type=int, nargs="+", default=[3])
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
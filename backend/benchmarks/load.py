@@ -0,0 +1,259 @@
+"""Load test for the multitenant API.
+
+Seeds N synthetic tenants with M tickets each, then drives every scenario
+at the requested concurrency and reports throughput, latency percentiles
+and MongoDB commands per request (read from /metrics) as JSON. By default
+the app runs in-process through httpx; --base-url targets a running
+uvicorn instead. Seeding always goes straight to the database in MONGO_URL.
+
+    python -m benchmarks.load --tenants 5 --tickets 2000 --requests 500 --concurrency 50
+    python -m benchmarks.load --mongomock                       # no mongod needed
+    python -m benchmarks.load --baseline benchmarks/baseline.json --update-baseline
+    python -m benchmarks.load --baseline benchmarks/baseline.json   # exit 1 on regression
+"""
+from benchmarks.common import print_report, run_concurrently, summarize
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+from uuid import uuid4
+
+PREFIX = "LoadTenant"
+PASSWORD = "password"
+WEBHOOK_SECRET = os.getenv("N8N_WEBHOOK_SECRET", "your_n8n_webhook_secret")
+
+# name -> (method, route template used to read per-route metrics)
+SCENARIOS = {
+    "auth_token": ("POST", "/auth/token"),
+    "tickets_list": ("GET", "/api/tickets/"),
+    "tickets_list_revalidate": ("GET", "/api/tickets/"),
+    "ticket_get": ("GET", "/api/tickets/{ticket_id}"),
+    "ticket_create": ("POST", "/api/tickets/"),
+    "ticket_update": ("PUT", "/api/tickets/{ticket_id}"),
+    "ticket_delete": ("DELETE", "/api/tickets/{ticket_id}"),
+    "me_screens": ("GET", "/me/screens"),
+    "webhook_ticket_done": ("POST", "/webhook/ticket-done"),
+    "webhook_ticket_done_batch": ("POST", "/webhook/ticket-done/batch"),
+}
+WEBHOOK_BATCH_SIZE = 20
+# Keeps event ids unique across runs, so they are not deduplicated as retries
+RUN_ID = uuid4().hex[:8]
+
+METRIC_LINE = re.compile(r'^mongo_commands_per_request_(sum|count)\{route="([^"]*)"\} (\S+)$')
+
+async def mongo_ops_by_route(client):
+    """{route: (commands, requests)} parsed from /metrics"""
+    response = await client.get("/metrics")
+    totals = {}
+    for line in response.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            kind, route, value = match.groups()
+            commands, requests = totals.get(route, (0.0, 0.0))
+            totals[route] = (float(value), requests) if kind == "sum" else (commands, float(value))
+    return totals
+
+class Context:
+    """Tokens and ticket ids shared by the scenarios"""
+
+    def __init__(self, tenants):
+        self.tenants = tenants
+        self.tokens = {}
+        self.ticket_ids = {}
+        self.list_etags = {}
+        self.created = {tenant: [] for tenant in tenants}
+
+    def tenant(self, i):
+        return self.tenants[i % len(self.tenants)]
+
+    def auth(self, tenant):
+        return {"Authorization": f"Bearer {self.tokens[tenant]}"}
+
+async def prepare(client, ctx):
+    for tenant in ctx.tenants:
+        response = await client.post("/auth/token", data={"username": f"user0@{tenant.lower()}.com", "password": PASSWORD})
+        response.raise_for_status()
+        ctx.tokens[tenant] = response.json()["access_token"]
+        response = await client.get("/api/tickets/", params={"fields": "id", "limit": 200}, headers=ctx.auth(tenant))
+        response.raise_for_status()
+        ctx.ticket_ids[tenant] = [ticket["id"] for ticket in response.json()]
+
+def build_request(name, client, ctx):
+    async def auth_token(i):
+        tenant = ctx.tenant(i)
+        return await client.post("/auth/token", data={"username": f"user0@{tenant.lower()}.com", "password": PASSWORD})
+
+    async def tickets_list(i):
+        return await client.get("/api/tickets/", params={"limit": 50}, headers=ctx.auth(ctx.tenant(i)))
+
+    async def tickets_list_revalidate(i):
+        # A dashboard polling with If-None-Match; the ETag changes whenever the tenant's tickets do
+        tenant = ctx.tenant(i)
+        headers = ctx.auth(tenant)
+        if tenant in ctx.list_etags:
+            headers["If-None-Match"] = ctx.list_etags[tenant]
+        response = await client.get("/api/tickets/", params={"limit": 50}, headers=headers)
+        if "etag" in response.headers:
+            ctx.list_etags[tenant] = response.headers["etag"]
+        return response
+
+    async def ticket_get(i):
+        tenant = ctx.tenant(i)
+        return await client.get(f"/api/tickets/{random.choice(ctx.ticket_ids[tenant])}", headers=ctx.auth(tenant))
+
+    async def ticket_create(i):
+        tenant = ctx.tenant(i)
+        response = await client.post("/api/tickets/", json={"title": f"Load {i}", "description": "Load test"}, headers=ctx.auth(tenant))
+        if response.status_code == 200:
+            ctx.created[tenant].append(response.json()["id"])
+        return response
+
+    async def ticket_update(i):
+        tenant = ctx.tenant(i)
+        ticket_id = random.choice(ctx.ticket_ids[tenant])
+        return await client.put(f"/api/tickets/{ticket_id}", json={"status": "In Progress"}, headers=ctx.auth(tenant))
+
+    async def ticket_delete(i):
+        tenant = ctx.tenant(i)
+        if not ctx.created[tenant]:
+            return None
+        return await client.delete(f"/api/tickets/{ctx.created[tenant].pop()}", headers=ctx.auth(tenant))
+
+    async def me_screens(i):
+        return await client.get("/me/screens", headers=ctx.auth(ctx.tenant(i)))
+
+    async def webhook_ticket_done(i):
+        tenant = ctx.tenant(i)
+        return await client.post("/webhook/ticket-done", json={
+            "customer_id": tenant,
+            "status": "Done",
+            "ticket_id": random.choice(ctx.ticket_ids[tenant]),
+        }, headers={"X-Shared-Secret": WEBHOOK_SECRET})
+
+    async def webhook_ticket_done_batch(i):
+        tenant = ctx.tenant(i)
+        events = [{
+            "customer_id": tenant,
+            "status": "Done",
+            "ticket_id": random.choice(ctx.ticket_ids[tenant]),
+            "event_id": f"load-{RUN_ID}-{i}-{j}",
+        } for j in range(WEBHOOK_BATCH_SIZE)]
+        # wait=true so latency includes the flush, not just the enqueue
+        return await client.post("/webhook/ticket-done/batch", params={"wait": "true"}, json={"events": events},
+                                 headers={"X-Shared-Secret": WEBHOOK_SECRET})
+
+    handler = locals()[name]
+
+    async def request(i):
+        response = await handler(i)
+        if response is not None and response.status_code >= 400:
+            raise RuntimeError(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+
+    return request
+
+async def run_scenarios(client, ctx, names, total, concurrency):
+    results = []
+    for name in names:
+        method, route = SCENARIOS[name]
+        before = (await mongo_ops_by_route(client)).get(route, (0.0, 0.0))
+        latencies, elapsed = await run_concurrently(build_request(name, client, ctx), total, concurrency)
+        after = (await mongo_ops_by_route(client)).get(route, (0.0, 0.0))
+        # The metric is labelled by route only; scenarios run one at a time so the diff is theirs alone
+        commands, requests = after[0] - before[0], after[1] - before[1]
+        results.append(summarize(
+            name, latencies, elapsed,
+            method=method,
+            route=route,
+            db_ops_per_request=round(commands / requests, 2) if requests else None,
+        ))
+    return results
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Regressions: p95 latency above or throughput below the baseline by more than `tolerance`"""
+    by_name = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        reference = by_name.get(result["name"])
+        if reference is None:
+            continue
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{result['name']}: p95 {result['p95_ms']}ms vs baseline {reference['p95_ms']}ms")
+        if result["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: {result['throughput_rps']} rps vs baseline {reference['throughput_rps']} rps")
+    return regressions
+
+async def main(args):
+    if args.mongomock:
+        from benchmarks.mock_mongo import install
+        install()
+
+    # The scenarios measure the API, not the per-tenant limits they would run into
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    import httpx
+    from app.seed_data import remove_bulk, seed_bulk
+
+    tenants = seed_bulk(args.tenants, args.users, args.tickets, prefix=PREFIX, password=PASSWORD)
+    names = args.scenarios or list(SCENARIOS)
+    try:
+        if args.base_url:
+            async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+                ctx = Context(tenants)
+                await prepare(client, ctx)
+                results = await run_scenarios(client, ctx, names, args.requests, args.concurrency)
+        else:
+            from app.main import app
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=30) as client:
+                    ctx = Context(tenants)
+                    await prepare(client, ctx)
+                    results = await run_scenarios(client, ctx, names, args.requests, args.concurrency)
+    finally:
+        remove_bulk(PREFIX)
+
+    report = {
+        "tenants": args.tenants,
+        "tickets_per_tenant": args.tickets,
+        "requests_per_scenario": args.requests,
+        "concurrency": args.concurrency,
+        "target": args.base_url or "in-process",
+        "results": results,
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        if args.update_baseline:
+            with open(args.baseline, "w") as f:
+                json.dump(report, f, indent=2)
+            return 0
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --update-baseline to create one", file=sys.stderr)
+            return 0
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=3)
+    parser.add_argument("--users", type=int, default=2, help="users per tenant")
+    parser.add_argument("--tickets", type=int, default=500, help="tickets per tenant")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenarios", nargs="*", choices=list(SCENARIOS))
+    parser.add_argument("--base-url", help="target a running server instead of the in-process app")
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory MongoDB stand-in")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="baseline report to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,104 @@
+"""Cost of logging per request.
+
+Calls MetricsMiddleware directly with an app behind it that logs one
+record per request, as a route would, and reports the time per request:
+
+* disabled: app.access and the route's logger turned off
+* queue_request_path: the QueueHandler set up by app.log, with a listener
+  that discards records, so only the work left in the request is timed
+* queue: the same, with the listener writing JSON to /dev/null. In this
+  CPU-bound loop the listener thread competes for the GIL; a server waiting
+  on MongoDB gives it idle time instead
+* sync: the same JSON formatter on a plain StreamHandler, formatting and
+  writing in the request
+
+Needs no database.
+
+    python -m benchmarks.logging_overhead --requests 50000
+"""
+from logging.handlers import QueueListener
+from app.log import ContextFilter, JsonFormatter, NonBlockingQueueHandler, log_records_dropped
+from app.middleware import MetricsMiddleware
+from benchmarks.common import print_report
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+route_logger = logging.getLogger("app.routes.bench")
+
+class DiscardHandler(logging.Handler):
+    def emit(self, record):
+        pass
+
+async def logging_app(scope, receive, send):
+    route_logger.info("Ticket listed", extra={"ticket_id": "0123456789abcdef01234567"})
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"[]"})
+
+async def noop_send(message):
+    pass
+
+def install(handler):
+    root = logging.getLogger()
+    root.handlers = [handler] if handler is not None else []
+    root.setLevel(logging.INFO)
+    for name in ("app.access", "app.routes.bench"):
+        logging.getLogger(name).disabled = handler is None
+
+async def measure(name, handler, requests):
+    install(handler)
+    middleware = MetricsMiddleware(logging_app)
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/tickets/",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"x-request-id", b"bench-request")],
+    }
+    for _ in range(100):
+        await middleware(scope, None, noop_send)
+    dropped = log_records_dropped.value()
+    started = time.perf_counter()
+    for _ in range(requests):
+        await middleware(scope, None, noop_send)
+    elapsed = time.perf_counter() - started
+    return {
+        "name": name,
+        "requests": requests,
+        "us_per_request": round(elapsed / requests * 1e6, 3),
+        "records_dropped": log_records_dropped.value() - dropped,
+    }
+
+async def main(args):
+    devnull = open(os.devnull, "w")
+    output = logging.StreamHandler(devnull)
+    output.setFormatter(JsonFormatter())
+
+    synchronous = logging.StreamHandler(devnull)
+    synchronous.addFilter(ContextFilter())
+    synchronous.setFormatter(JsonFormatter())
+
+    results = [await measure("disabled", None, args.requests)]
+    try:
+        for name, sink in (("queue_request_path", DiscardHandler()), ("queue", output)):
+            queued = NonBlockingQueueHandler(args.queue_size)
+            queued.addFilter(ContextFilter())
+            listener = QueueListener(queued.queue, sink)
+            listener.start()
+            try:
+                results.append(await measure(name, queued, args.requests))
+            finally:
+                listener.stop()
+        results.append(await measure("sync", synchronous, args.requests))
+    finally:
+        install(None)
+        devnull.close()
+    print_report({"results": results})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,41 @@
+"""In-memory MongoDB stand-in for running the benchmarks without a mongod.
+
+Requires the optional `mongomock` and `mongomock-motor` packages. Latency
+numbers measured against it describe the API's own overhead only, and
+mongomock emits no command events, so DB ops per request read as 0.
+"""
+from app.db import db
+import app.db
+
+def install():
+    """Point the global Database at one shared in-memory server"""
+    try:
+        import mongomock
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("--mongomock needs the mongomock and mongomock-motor packages")
+
+    server = mongomock.MongoClient()
+
+    # PyMongo 4.11+ passes sort= to bulk update/replace operations, which mongomock predates
+    builder = mongomock.collection.BulkOperationBuilder
+    for name in ("add_update", "add_replace"):
+        original = getattr(builder, name)
+        setattr(builder, name, lambda self, *args, sort=None, _original=original, **kwargs: _original(self, *args, **kwargs))
+
+    class AsyncClient(AsyncMongoMockClient):
+        def __init__(self, uri, **options):
+            super().__init__(mock_mongo_client=server)
+
+        async def aconnect(self):
+            pass
+
+        async def close(self):
+            pass
+
+    async def no_transactions():
+        return False
+
+    app.db.AsyncMongoClient = AsyncClient
+    app.db.MongoClient = lambda uri, **options: server
+    db.supports_transactions = no_transactions
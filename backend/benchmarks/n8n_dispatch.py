@@ -0,0 +1,116 @@
+"""Compare ticket creation latency with inline n8n dispatch against the outbox.
+
+The inline path reproduces the old handler, which called `requests.post`
+to n8n from inside `create_ticket`. The outbox path goes through the real
+`POST /api/tickets/` route and only writes the outbox record. Both run
+in-process against the database from MONGO_URL and a local stub n8n server.
+
+    python -m benchmarks.n8n_dispatch --requests 200 --concurrency 20 --n8n-delay 0.2
+"""
+from fastapi import Depends, FastAPI
+from datetime import datetime
+from app.db import db
+from app.auth import create_access_token, get_current_user
+from app.models import TicketCreate, User
+from app.outbox import OUTBOX_COLLECTION, build_workflow_payload, dispatcher
+from app.main import app
+from benchmarks.common import print_report, run_concurrently, summarize
+from benchmarks.stub_n8n import StubN8N
+import argparse
+import asyncio
+import httpx
+import requests
+import time
+
+BENCH_TENANT = "BenchTenant"
+BENCH_EMAIL = "bench@benchtenant.com"
+
+def build_inline_app(n8n_url):
+    """App with the pre-outbox create_ticket handler"""
+    inline_app = FastAPI()
+
+    @inline_app.post("/api/tickets/")
+    async def create_ticket(ticket: TicketCreate, current_user: User = Depends(get_current_user)):
+        ticket_data = {
+            "title": ticket.title,
+            "description": ticket.description,
+            "status": "Open",
+            "customer_id": current_user.customer_id,
+            "created_by": current_user.email,
+            "created_at": datetime.utcnow(),
+            "updated_at": None
+        }
+        result = await db.get_collection("tickets").insert_one(ticket_data)
+        ticket_data["id"] = str(result.inserted_id)
+        try:
+            requests.post(n8n_url, json=build_workflow_payload(ticket_data), timeout=5)
+        except Exception:
+            pass
+        return {"id": ticket_data["id"]}
+
+    return inline_app
+
+async def measure(name, target_app, token, total, concurrency):
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=target_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        async def create(i):
+            response = await client.post("/api/tickets/", json={"title": f"Bench {i}", "description": "n8n dispatch benchmark"})
+            response.raise_for_status()
+
+        latencies, elapsed = await run_concurrently(create, total, concurrency)
+    return summarize(name, latencies, elapsed)
+
+async def wait_for_delivery(stub, expected, timeout):
+    started = time.perf_counter()
+    while stub.received < expected and time.perf_counter() - started < timeout:
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+async def main(args):
+    stub = StubN8N(delay=args.n8n_delay).start()
+    await db.connect()
+    users = db.get_collection("users")
+    await users.update_one(
+        {"email": BENCH_EMAIL},
+        {"$setOnInsert": {
+            "email": BENCH_EMAIL,
+            "hashed_password": "!",
+            "customer_id": BENCH_TENANT,
+            "role": "User",
+            "created_at": datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+    token = create_access_token({"sub": BENCH_EMAIL, "customer_id": BENCH_TENANT, "role": "User"})
+
+    try:
+        inline = await measure("inline_requests_post", build_inline_app(stub.url), token, args.requests, args.concurrency)
+
+        stub.received = 0
+        dispatcher.url = stub.url
+        await dispatcher.start()
+        outbox = await measure("outbox", app, token, args.requests, args.concurrency)
+        outbox["delivery_drain_s"] = round(await wait_for_delivery(stub, args.requests, timeout=60), 3)
+        outbox["delivered"] = stub.received
+        await dispatcher.stop()
+
+        print_report({
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "n8n_delay_s": args.n8n_delay,
+            "results": [inline, outbox],
+        })
+    finally:
+        await db.get_collection("tickets").delete_many({"customer_id": BENCH_TENANT})
+        await db.get_collection(OUTBOX_COLLECTION).delete_many({"customer_id": BENCH_TENANT})
+        await users.delete_one({"email": BENCH_EMAIL})
+        await db.close()
+        stub.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--n8n-delay", type=float, default=0.2, help="seconds the stub n8n waits before answering")
+    asyncio.run(main(parser.parse_args()))
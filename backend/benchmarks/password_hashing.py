@@ -0,0 +1,71 @@
+"""Login password verification throughput: inline on the event loop vs the bcrypt pool.
+
+Runs a burst of concurrent bcrypt verifications the way the login handler
+performs them, and measures how long the event loop is stalled meanwhile
+(the delay seen by every other request in the worker). Needs no database.
+
+    python -m benchmarks.password_hashing --logins 64 --concurrency 16 --rounds 12
+"""
+from passlib.context import CryptContext
+from app.passwords import PasswordHasher
+from benchmarks.common import percentile, print_report, run_concurrently, summarize
+import argparse
+import asyncio
+import os
+import time
+
+LOOP_PROBE_INTERVAL = 0.005
+
+async def probe_loop_lag(samples, stop):
+    """Record how late a short sleep wakes up while the burst is running"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - LOOP_PROBE_INTERVAL)
+
+async def measure(name, verify, total, concurrency):
+    lag, stop = [], asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(lag, stop))
+    latencies, elapsed = await run_concurrently(verify, total, concurrency)
+    stop.set()
+    await probe
+    cores = os.cpu_count() or 1
+    return summarize(
+        name, latencies, elapsed,
+        logins_per_core_s=round(len(latencies) / elapsed / cores, 2),
+        loop_lag_p99_ms=round(percentile(lag, 99) * 1000, 2),
+        loop_lag_max_ms=round(max(lag, default=0) * 1000, 2),
+    )
+
+async def main(args):
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds)
+    stored_hash = context.hash("password")
+    # The benchmark uses its own cost factor rather than BCRYPT_ROUNDS
+    hasher = PasswordHasher(args.workers, max_pending=args.logins, context=context)
+
+    async def inline(i):
+        context.verify("password", stored_hash)
+
+    async def pooled(i):
+        await hasher.verify_and_update("password", stored_hash)
+
+    results = [
+        await measure("inline_event_loop", inline, args.logins, args.concurrency),
+        await measure("thread_pool", pooled, args.logins, args.concurrency),
+    ]
+    print_report({
+        "logins": args.logins,
+        "concurrency": args.concurrency,
+        "bcrypt_rounds": args.rounds,
+        "pool_workers": args.workers,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    })
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+"""Cost of a rate limiting decision in RateLimitMiddleware.
+
+Calls the middleware directly with a no-op app behind it, once with limits
+that let every request through and once with a bucket that is already
+empty, and reports the time per request. Needs no database.
+
+    python -m benchmarks.rate_limit --requests 100000
+"""
+from app.auth import create_access_token
+from app.ratelimit import RateLimiter, RateLimitMiddleware
+from benchmarks.common import print_report
+import argparse
+import asyncio
+import time
+
+async def noop_app(scope, receive, send):
+    pass
+
+async def noop_send(message):
+    pass
+
+async def measure(name, limits, requests):
+    limiter = RateLimiter(True, "/nonexistent", "local", 250, 100000)
+    limiter.configure(limits)
+    middleware = RateLimitMiddleware(noop_app, limiter)
+    token = create_access_token({"sub": "user@tenantbench.com", "customer_id": "TenantBench", "role": "User"})
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/tickets/",
+        "query_string": b"limit=50",
+        "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 50000),
+    }
+    # Warm the verified-token cache, and drain the bucket when it should reject
+    for _ in range(100):
+        await middleware(scope, None, noop_send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await middleware(scope, None, noop_send)
+    elapsed = time.perf_counter() - started
+    return {"name": name, "requests": requests, "us_per_request": round(elapsed / requests * 1e6, 3)}
+
+async def main(args):
+    unlimited = {"default": {"user": {"read": None}, "tenant": {"read": None}}}
+    generous = {"default": {"user": {"read": {"rate": 1e9, "burst": 1e9}}, "tenant": {"read": {"rate": 1e9, "burst": 1e9}}}}
+    exhausted = {"default": {"user": {"read": {"rate": 1e-9, "burst": 1}}}}
+    print_report({"results": [
+        await measure("no_limits", unlimited, args.requests),
+        await measure("allowed", generous, args.requests),
+        await measure("rejected", exhausted, args.requests),
+    ]})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""Per-item cost of serializing ticket list responses.
+
+Compares the response_model path (each Mongo document validated into
+TicketResponse, run through jsonable_encoder, then json.dumps) with the
+fast path used by the routes (to_public() and app.serialization.dumps).
+Needs no database: the tickets are generated in memory.
+
+    python -m benchmarks.serialization --sizes 1000 10000 --repeat 5
+"""
+from bson import ObjectId
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from app.models import TicketResponse
+from app.serialization import dumps, model_fields, orjson, to_public
+from benchmarks.common import print_report
+import argparse
+import json
+import time
+
+FIELDS = model_fields(TicketResponse)
+
+def make_tickets(count):
+    created = datetime(2024, 1, 1)
+    return [{
+        "_id": ObjectId(),
+        "title": f"Ticket {i}",
+        "description": "Printer on the third floor is out of toner again " * 3,
+        "status": ("Open", "In Progress", "Done")[i % 3],
+        "customer_id": "TenantA",
+        "created_by": "user0@tenanta.com",
+        "created_at": created + timedelta(minutes=i),
+        "updated_at": None if i % 2 else created + timedelta(minutes=i, seconds=30),
+        "workflow_status": "completed",
+    } for i in range(count)]
+
+def model_path(tickets):
+    items = []
+    for ticket in tickets:
+        document = dict(ticket, id=str(ticket["_id"]))
+        items.append(TicketResponse.model_validate(document))
+    return json.dumps(jsonable_encoder(items), separators=(",", ":")).encode()
+
+def fast_path(tickets):
+    return dumps([to_public(ticket, FIELDS) for ticket in tickets])
+
+def measure(name, serialize, tickets, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = serialize(tickets)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "name": name,
+        "items": len(tickets),
+        "best_ms": round(best * 1000, 2),
+        "us_per_item": round(best / len(tickets) * 1e6, 3),
+        "bytes": len(body),
+    }
+
+def main(args):
+    results = []
+    for size in args.sizes:
+        tickets = make_tickets(size)
+        # The two paths must agree before their timings mean anything
+        assert json.loads(model_path(tickets)) == json.loads(fast_path(tickets))
+        model = measure("response_model", model_path, tickets, args.repeat)
+        fast = measure("fast_path", fast_path, tickets, args.repeat)
+        fast["speedup"] = round(model["best_ms"] / fast["best_ms"], 1) if fast["best_ms"] else None
+        results += [model, fast]
+    print_report({
+        "encoder": "orjson" if orjson is not None else "json",
+        "repeat": args.repeat,
+        "results": results,
+    })
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
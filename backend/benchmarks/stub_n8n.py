@@ -0,0 +1,44 @@
+"""Minimal stand-in for the n8n webhook used by the benchmarks"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+class StubN8N:
+    """Threaded HTTP server that answers every POST after a fixed delay"""
+
+    def __init__(self, delay=0.2, status_code=200):
+        self.delay = delay
+        self.status_code = status_code
+        self.received = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.received += 1
+                self.send_response(stub.status_code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/webhook/flowbit-ticket"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
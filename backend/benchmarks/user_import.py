@@ -0,0 +1,67 @@
+"""Onboarding a customer: one /auth/register call per user vs one bulk import.
+
+Runs the app in-process. The imported ImportBench* users are removed
+afterwards. Use a low --rounds to measure the request handling rather than
+bcrypt itself.
+
+    python -m benchmarks.user_import --users 2000 --concurrency 20 --rounds 4
+    python -m benchmarks.user_import --mongomock
+"""
+from benchmarks.common import print_report, run_concurrently, summarize
+import argparse
+import asyncio
+import os
+import time
+
+PASSWORD = "password"
+
+async def main(args):
+    if args.mongomock:
+        from benchmarks.mock_mongo import install
+        install()
+    # The bcrypt cost is read when app.passwords is imported
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    import httpx
+    from app.main import app
+    from app.db import db
+    from app.auth import create_access_token
+
+    async with app.router.lifespan_context(app):
+        users = db.get_collection("users")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://import", timeout=600) as client:
+            try:
+                async def register(i):
+                    response = await client.post("/auth/register", json={
+                        "email": f"user{i}@importbenchregister.com", "password": PASSWORD, "customer_id": "ImportBenchRegister",
+                    })
+                    response.raise_for_status()
+
+                latencies, elapsed = await run_concurrently(register, args.users, args.concurrency)
+                results = [summarize("register_each", latencies, elapsed, users_per_s=round(args.users / elapsed, 1))]
+
+                await users.insert_one({"email": "admin@importbenchbulk.com", "hashed_password": "!", "customer_id": "ImportBenchBulk", "role": "Admin"})
+                token = create_access_token({"sub": "admin@importbenchbulk.com", "customer_id": "ImportBenchBulk", "role": "Admin"})
+                body = "email,password\n" + "".join(f"user{i}@importbenchbulk.com,{PASSWORD}\n" for i in range(args.users))
+                started = time.perf_counter()
+                response = await client.post(
+                    "/admin/users/import", content=body.encode(),
+                    headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv"},
+                )
+                elapsed = time.perf_counter() - started
+                response.raise_for_status()
+                results.append(summarize("bulk_import", [elapsed], elapsed, users_per_s=round(args.users / elapsed, 1),
+                                         created=response.json()["created"]))
+            finally:
+                await users.delete_many({"customer_id": {"$in": ["ImportBenchRegister", "ImportBenchBulk"]}})
+
+    print_report({"users": args.users, "concurrency": args.concurrency, "bcrypt_rounds": args.rounds, "results": results})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent /auth/register calls")
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt cost factor")
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory MongoDB stand-in")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,37 @@
+"""Production server: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+WEB_CONCURRENCY workers (one per core by default) share the listening
+socket. The app is not preloaded, so each worker imports it after the fork
+and its lifespan opens that worker's own MongoDB clients and background
+tasks. Nothing is shared between processes. On SIGTERM gunicorn asks every
+worker to drain (see app/lifecycle.py) and kills the ones still running
+after GRACEFUL_TIMEOUT seconds.
+"""
+import os
+
+cpu_count = os.cpu_count() or 1
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(cpu_count)))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = False
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Seconds a worker may go without a heartbeat before the master restarts it
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Recycle workers now and then to bound slow leaks; 0 disables
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+# Peers trusted to set X-Forwarded-For. uvicorn takes the client address from the header only for
+# these, and the rate limiter keys anonymous requests by that address. Behind a reverse proxy list
+# its address here (or "*" when the workers are reachable only through it); otherwise every
+# anonymous client shares the proxy's bucket.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+# The app writes its own access log (app.access, JSON with tenant and duration); set ACCESS_LOG=- for gunicorn's too
+accesslog = os.getenv("ACCESS_LOG") or None
+
+# Every worker has its own bcrypt pool; split the cores between them instead of
+# giving each worker one thread per core. Workers inherit the environment.
+os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, cpu_count // workers)))
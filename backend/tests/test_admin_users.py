@@ -0,0 +1,114 @@
+import pytest
+from fastapi.testclient import TestClient
+from datetime import datetime, timedelta
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.tokens import keyring
+from uuid import uuid4
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+@pytest.fixture
+def users():
+    users_collection = db.get_sync_collection("users")
+    now = datetime.utcnow().replace(microsecond=0)
+    users_collection.insert_many([
+        {
+            "email": f"{'admin' if i == 0 else 'user'}{i}@tenantUsers.com",
+            "hashed_password": "!",
+            "customer_id": "TenantUsers",
+            "role": "Admin" if i == 0 else "User",
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(5)
+    ] + [
+        {"email": "admin@tenantOther.com", "hashed_password": "!", "customer_id": "TenantOther", "role": "Admin", "created_at": now},
+        {"email": "taken@tenantOther.com", "hashed_password": "!", "customer_id": "TenantOther", "role": "User", "created_at": now},
+    ])
+    yield users_collection
+    users_collection.delete_many({"customer_id": {"$in": ["TenantUsers", "TenantOther"]}})
+
+def admin_headers(email="admin0@tenantUsers.com", customer_id="TenantUsers"):
+    token = create_access_token({"sub": email, "customer_id": customer_id, "role": "Admin"})
+    return {"Authorization": f"Bearer {token}"}
+
+def test_users_are_listed_a_page_at_a_time(users):
+    first = client.get("/admin/users?limit=3", headers=admin_headers())
+    assert [user["email"] for user in first.json()] == ["admin0@tenantUsers.com", "user1@tenantUsers.com", "user2@tenantUsers.com"]
+    rest = client.get(f"/admin/users?limit=3&cursor={first.headers['x-next-cursor']}", headers=admin_headers())
+    assert [user["email"] for user in rest.json()] == ["user3@tenantUsers.com", "user4@tenantUsers.com"]
+    assert "x-next-cursor" not in rest.headers
+    assert "hashed_password" not in rest.json()[0]
+
+    admins = client.get("/admin/users?role=Admin", headers=admin_headers()).json()
+    assert [user["email"] for user in admins] == ["admin0@tenantUsers.com"]
+    assert [user["email"] for user in client.get("/admin/users?email=user4", headers=admin_headers()).json()] == ["user4@tenantUsers.com"]
+
+def test_delete_is_scoped_to_the_tenant(users):
+    user_id = str(users.find_one({"email": "user1@tenantUsers.com"})["_id"])
+    assert client.delete(f"/admin/users/{user_id}", headers=admin_headers("admin@tenantOther.com", "TenantOther")).status_code == 404
+    assert client.delete("/admin/users/not-an-id", headers=admin_headers()).status_code == 400
+    assert client.delete(f"/admin/users/{user_id}", headers=admin_headers()).status_code == 200
+    assert users.find_one({"email": "user1@tenantUsers.com"}) is None
+
+def test_import_creates_new_users_in_chunks_and_reports_the_rest(users, monkeypatch):
+    monkeypatch.setattr("app.user_import.USER_IMPORT_CHUNK_SIZE", 2)
+    body = "\n".join([
+        "email,password,role",
+        "new1@tenantUsers.com,secret,User",
+        "new2@tenantUsers.com,secret,Admin",
+        "new1@tenantUsers.com,other,User",
+        "user2@tenantUsers.com,secret,User",
+        "taken@tenantOther.com,secret,User",
+        "not-an-email,secret,User",
+        "new3@tenantUsers.com,,User",
+        "",
+    ])
+    response = client.post("/admin/users/import", content=body, headers={**admin_headers(), "Content-Type": "text/csv"})
+    assert response.status_code == 200
+    report = response.json()
+    assert {key: report[key] for key in ("rows", "created", "skipped", "duplicates", "failed")} == {
+        "rows": 7, "created": 2, "skipped": 1, "duplicates": 1, "failed": 3,
+    }
+    assert [(error["line"], error["error"]) for error in report["errors"]] == [
+        (6, "Email already registered"), (7, "Invalid email"), (8, "Missing password"),
+    ]
+    assert users.find_one({"email": "new2@tenantUsers.com"})["role"] == "Admin"
+    # The other tenant's account is untouched
+    assert users.find_one({"email": "taken@tenantOther.com"})["customer_id"] == "TenantOther"
+
+    login = client.post("/auth/token", data={"username": "new1@tenantUsers.com", "password": "secret"})
+    assert login.status_code == 200
+
+    ndjson = '{"email": "user3@tenantUsers.com", "password": "changed", "role": "Admin"}\n[1]\n'
+    response = client.post(
+        "/admin/users/import?update_existing=true", content=ndjson,
+        headers={**admin_headers(), "Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["updated"] == 1
+    assert response.json()["errors"] == [{"line": 2, "email": None, "error": "Expected a JSON object"}]
+    assert users.find_one({"email": "user3@tenantUsers.com"})["role"] == "Admin"
+
+    assert client.post("/admin/users/import", content="{}", headers={**admin_headers(), "Content-Type": "application/json"}).status_code == 415
+
+def test_update_import_revokes_tokens_issued_before_it(users):
+    now = datetime.utcnow()
+    old_token = keyring.sign({
+        "sub": "user4@tenantUsers.com", "customer_id": "TenantUsers", "role": "User",
+        "iat": now - timedelta(minutes=1), "exp": now + timedelta(minutes=5), "jti": uuid4().hex,
+    })
+    old_headers = {"Authorization": f"Bearer {old_token}"}
+    assert client.get("/api/tickets/", headers=old_headers).status_code == 200
+
+    response = client.post(
+        "/admin/users/import?update_existing=true", content="email,password,role\nuser4@tenantUsers.com,changed,Admin\n",
+        headers={**admin_headers(), "Content-Type": "text/csv"},
+    )
+    assert response.json()["updated"] == 1
+    assert client.get("/api/tickets/", headers=old_headers).status_code == 401
@@ -0,0 +1,103 @@
+import pytest
+from fastapi.testclient import TestClient
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.archive import ARCHIVE_COLLECTION, SegmentArchive, archiver
+from app.routes.tickets import ticket_filters
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def ticket(title, status, created_days_ago, closed_days_ago=None, customer_id="TenantArchive"):
+    now = datetime.utcnow().replace(microsecond=0)
+    document = {
+        "_id": ObjectId(),
+        "title": title,
+        "description": title,
+        "status": status,
+        "customer_id": customer_id,
+        "created_by": "user@tenantArchive.com",
+        "created_at": now - timedelta(days=created_days_ago),
+        "updated_at": None,
+    }
+    if closed_days_ago is not None:
+        document["closed_at"] = now - timedelta(days=closed_days_ago)
+    return document
+
+def test_old_closed_tickets_move_to_the_archive_and_stay_readable():
+    users_collection = db.get_sync_collection("users")
+    users_collection.insert_one({
+        "email": "user@tenantArchive.com",
+        "hashed_password": "!",
+        "customer_id": "TenantArchive",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+    tickets = db.get_sync_collection("tickets")
+    old_done = ticket("Old done", "Done", 300, 299)
+    recent_done = ticket("Recent done", "Done", 10, 5)
+    old_open = ticket("Old open", "Open", 400)
+    tickets.insert_many([old_done, recent_done, old_open])
+
+    try:
+        token = create_access_token({"sub": "user@tenantArchive.com", "customer_id": "TenantArchive", "role": "User"})
+        headers = {"Authorization": f"Bearer {token}"}
+        before = client.get("/api/tickets/", headers=headers)
+
+        assert client.portal.call(archiver.archive_tenant, "TenantArchive") == 1
+        assert tickets.count_documents({"customer_id": "TenantArchive"}) == 2
+        assert db.get_sync_collection(ARCHIVE_COLLECTION).count_documents({"customer_id": "TenantArchive"}) == 1
+
+        # The write is visible at once: the cached page was invalidated
+        hot = client.get("/api/tickets/", headers={**headers, "If-None-Match": before.headers["etag"]})
+        assert [item["title"] for item in hot.json()] == ["Recent done", "Old open"]
+        everything = client.get("/api/tickets/?include_archived=true", headers=headers).json()
+        assert [item["title"] for item in everything] == ["Recent done", "Old done", "Old open"]
+        page = client.get("/api/tickets/?include_archived=true&limit=2", headers=headers)
+        rest = client.get(f"/api/tickets/?include_archived=true&cursor={page.headers['x-next-cursor']}", headers=headers)
+        assert [item["title"] for item in rest.json()] == ["Old open"]
+
+        path = f"/api/tickets/{old_done['_id']}"
+        assert client.get(path, headers=headers).status_code == 404
+        assert client.get(f"{path}?include_archived=true", headers=headers).json()["title"] == "Old done"
+    finally:
+        users_collection.delete_many({"customer_id": "TenantArchive"})
+        tickets.delete_many({"customer_id": "TenantArchive"})
+        db.get_sync_collection(ARCHIVE_COLLECTION).delete_many({"customer_id": "TenantArchive"})
+
+def test_segment_archive_pages_and_discards(tmp_path):
+    store = SegmentArchive(str(tmp_path))
+    older = [ticket(f"Older {i}", "Done", 100 + i, 99) for i in range(3)]
+    newer = [ticket(f"Newer {i}", "Done", 50 + i, 49) for i in range(3)]
+    store._write("TenantArchive", older)
+    handle = store._write("TenantArchive", newer)
+    assert len(store.segments("TenantArchive")) == 2
+
+    page = store._find("TenantArchive", {"customer_id": "TenantArchive"}, [("created_at", -1), ("_id", -1)], 4)
+    assert [item["title"] for item in page] == ["Newer 0", "Newer 1", "Newer 2", "Older 0"]
+    oldest = store._find("TenantArchive", {"title": {"$gte": "Older 2"}}, [("created_at", 1), ("_id", 1)], 1)
+    assert [item["title"] for item in oldest] == ["Older 2"]
+    assert store._get("TenantArchive", older[1]["_id"])["created_at"] == older[1]["created_at"]
+
+    store._discard("TenantArchive", handle, [newer[0]["_id"]])
+    assert store._get("TenantArchive", newer[0]["_id"]) is None
+    assert store._get("TenantArchive", newer[1]["_id"])["title"] == "Newer 1"
+    assert store.segments("Nobody") == []
+
+def test_segment_archive_filters_on_offset_qualified_bounds(tmp_path):
+    store = SegmentArchive(str(tmp_path))
+    tickets = [ticket(f"Ticket {i}", "Done", 10 * i, 1) for i in range(1, 4)]
+    store._write("TenantArchive", tickets)
+
+    # 25 days ago in UTC, written in +02:00 as a client would send it
+    bound = (datetime.utcnow() - timedelta(days=25)).replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=2)))
+    query = {"$and": ticket_filters("TenantArchive", created_after=bound)}
+    page = store._find("TenantArchive", query, [("created_at", -1), ("_id", -1)], 10)
+    assert [item["title"] for item in page] == ["Ticket 1", "Ticket 2"]
@@ -0,0 +1,84 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from bson import ObjectId
+from datetime import datetime
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+@pytest.fixture
+def headers():
+    # Nothing is seeded at startup, so the caller's account is created here
+    db.get_sync_collection("users").insert_one({
+        "email": "admin@tenantBulk.com",
+        "hashed_password": "!",
+        "customer_id": "TenantBulk",
+        "role": "Admin",
+        "created_at": datetime.utcnow()
+    })
+    token = create_access_token({"sub": "admin@tenantBulk.com", "customer_id": "TenantBulk", "role": "Admin"})
+    yield {"Authorization": f"Bearer {token}"}
+    db.get_sync_collection("users").delete_many({"customer_id": "TenantBulk"})
+
+def insert_ticket(customer_id):
+    return str(db.get_sync_collection("tickets").insert_one({
+        "title": f"{customer_id} bulk target",
+        "description": "Bulk test",
+        "status": "Open",
+        "customer_id": customer_id,
+        "created_by": f"user@{customer_id.lower()}.com",
+        "created_at": datetime.utcnow(),
+        "updated_at": None
+    }).inserted_id)
+
+def test_bulk_operations_are_tenant_scoped(headers):
+    """Operations on another tenant's ticket fail per item and never touch it"""
+    tickets_collection = db.get_sync_collection("tickets")
+    own_id = insert_ticket("TenantBulk")
+    other_id = insert_ticket("TenantBulkOther")
+    created_ids = []
+
+    try:
+        response = client.post("/api/tickets/bulk", json={
+            "ordered": False,
+            "operations": [
+                {"op": "create", "ticket": {"title": "Bulk created", "description": "Bulk test"}},
+                {"op": "update", "id": own_id, "changes": {"status": "Closed"}},
+                {"op": "delete", "id": other_id},
+            ],
+        }, headers=headers)
+
+        assert response.status_code == 200
+        body = response.json()
+        created_ids = [result["id"] for result in body["results"] if result["op"] == "create" and result["id"]]
+        assert (body["created"], body["updated"], body["deleted"], body["failed"]) == (1, 1, 0, 1)
+        assert body["results"][2]["error"] == "Ticket not found"
+        assert tickets_collection.find_one({"_id": ObjectId(own_id)})["status"] == "Closed"
+        assert tickets_collection.find_one({"_id": ObjectId(other_id)}) is not None
+    finally:
+        tickets_collection.delete_many({"_id": {"$in": [ObjectId(i) for i in [own_id, other_id, *created_ids]]}})
+
+def test_ordered_bulk_stops_at_first_failure(headers):
+    tickets_collection = db.get_sync_collection("tickets")
+    own_id = insert_ticket("TenantBulk")
+
+    try:
+        response = client.post("/api/tickets/bulk", json={
+            "operations": [
+                {"op": "update", "id": "not-an-id", "changes": {"status": "Closed"}},
+                {"op": "delete", "id": own_id},
+            ],
+        }, headers=headers)
+
+        assert response.status_code == 200
+        assert [result["status"] for result in response.json()["results"]] == ["error", "skipped"]
+        assert tickets_collection.find_one({"_id": ObjectId(own_id)}) is not None
+    finally:
+        tickets_collection.delete_one({"_id": ObjectId(own_id)})
@@ -0,0 +1,31 @@
+from app.cache import TTLCache
+import time
+
+def test_lru_eviction_and_counters():
+    """Least recently used entries are evicted first and lookups are counted"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+def test_entries_expire_after_ttl():
+    """Expired entries count as misses and are dropped"""
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_pop_invalidates_entry():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set(("user@tenantA.com", "TenantA"), "principal")
+
+    assert cache.pop(("user@tenantA.com", "TenantA")) == "principal"
+    assert cache.get(("user@tenantA.com", "TenantA")) is None
@@ -0,0 +1,86 @@
+import pytest
+import asyncio
+import zlib
+from fastapi.testclient import TestClient
+from datetime import datetime, timedelta
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.compression import CompressionMiddleware, compression_input_bytes, negotiate
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+@pytest.fixture
+def headers():
+    db.get_sync_collection("users").insert_one({
+        "email": "admin@tenantCompress.com",
+        "hashed_password": "!",
+        "customer_id": "TenantCompress",
+        "role": "Admin",
+        "created_at": datetime.utcnow()
+    })
+    now = datetime.utcnow()
+    db.get_sync_collection("tickets").insert_many([{
+        "title": f"Ticket {i}",
+        "description": "Printer on the third floor is out of toner again",
+        "status": "Open",
+        "customer_id": "TenantCompress",
+        "created_by": "admin@tenantCompress.com",
+        "created_at": now - timedelta(minutes=i),
+        "updated_at": None,
+    } for i in range(60)])
+    token = create_access_token({"sub": "admin@tenantCompress.com", "customer_id": "TenantCompress", "role": "Admin"})
+    yield {"Authorization": f"Bearer {token}"}
+    db.get_sync_collection("users").delete_many({"customer_id": "TenantCompress"})
+    db.get_sync_collection("tickets").delete_many({"customer_id": "TenantCompress"})
+
+def test_negotiate_prefers_the_highest_quality_then_the_server_order():
+    assert negotiate("gzip, deflate, br, zstd", ["zstd", "br", "gzip"]) == "zstd"
+    assert negotiate("gzip;q=1.0, br;q=0.5", ["zstd", "br", "gzip"]) == "gzip"
+    assert negotiate("*;q=0.1, gzip;q=0", ["gzip"]) is None
+    assert negotiate("*", ["br", "gzip"]) == "br"
+    assert negotiate("identity", ["gzip"]) is None
+    assert negotiate("", ["gzip"]) is None
+
+def test_large_json_is_compressed_and_small_or_unaccepted_responses_are_not(headers):
+    before = compression_input_bytes.value("gzip")
+    response = client.get("/api/tickets/?limit=50", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.headers["etag"].startswith("W/")
+    assert len(response.json()) == 50
+    assert int(response.headers["content-length"]) < compression_input_bytes.value("gzip") - before
+
+    plain = client.get("/api/tickets/?limit=50", headers={**headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == response.json()
+    assert "content-encoding" not in client.get("/", headers={"Accept-Encoding": "gzip"}).headers
+
+def test_streamed_export_is_compressed_chunk_by_chunk(headers):
+    response = client.get("/api/tickets/export", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert len(response.text.splitlines()) == 60
+
+    # Each chunk is flushed, so the client can decode it before the next one is produced
+    async def streaming_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/x-ndjson")]})
+        await send({"type": "http.response.body", "body": b'{"row":1}\n', "more_body": True})
+        await send({"type": "http.response.body", "body": b'{"row":2}\n', "more_body": False})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(streaming_app, encodings="gzip")(scope, None, send))
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(messages[1]["body"]) == b'{"row":1}\n'
+    assert decompressor.decompress(messages[2]["body"]) == b'{"row":2}\n'
+    assert decompressor.eof
@@ -0,0 +1,53 @@
+import asyncio
+from bson import ObjectId
+from app import events
+from app.events import TicketEventBus, event_stream
+
+def ticket(customer_id, status="Open"):
+    return {"_id": ObjectId(), "title": "Event test", "description": "Event test", "status": status, "customer_id": customer_id}
+
+def local_bus():
+    bus = TicketEventBus("local")
+    bus.mode = "local"
+    return bus
+
+def test_events_fan_out_to_the_tenant_only():
+    async def scenario():
+        bus = local_bus()
+        first, _ = bus.subscribe("TenantA")
+        second, _ = bus.subscribe("TenantA")
+        other, _ = bus.subscribe("TenantB")
+        bus.emit("ticket.created", ticket("TenantA"))
+        assert b"event: ticket.created" in first.queue.get_nowait()
+        assert b"event: ticket.created" in second.queue.get_nowait()
+        assert other.queue.empty()
+    asyncio.run(scenario())
+
+def test_last_event_id_replays_missed_events():
+    async def scenario():
+        bus = local_bus()
+        tickets = [ticket("TenantA") for _ in range(3)]
+        for item in tickets:
+            bus.emit("ticket.updated", item)
+        first_id = bus._replay["TenantA"][0][0]
+        _, replay = bus.subscribe("TenantA", first_id)
+        assert [str(item["_id"]).encode() in frame for frame, item in zip(replay, tickets[1:])] == [True, True]
+
+        _, replay = bus.subscribe("TenantA", "unknown-id")
+        assert len(replay) == 1 and b"event: reset" in replay[0]
+    asyncio.run(scenario())
+
+def test_slow_subscriber_is_reset_instead_of_blocking(monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_SUBSCRIBER_QUEUE_SIZE", 2)
+
+    async def scenario():
+        bus = local_bus()
+        subscription, replay = bus.subscribe("TenantA")
+        for _ in range(3):
+            bus.emit("ticket.created", ticket("TenantA"))
+        assert "TenantA" not in bus._subscribers
+
+        frames = [frame async for frame in event_stream(bus, subscription, replay)]
+        assert frames[0].startswith(b"retry:")
+        assert b"event: reset" in frames[-1]
+    asyncio.run(scenario())
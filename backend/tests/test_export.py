@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import pytest
+from fastapi.testclient import TestClient
+from datetime import datetime, timedelta
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.export import EXPORT_COLUMNS, stream_export
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+@pytest.fixture
+def headers():
+    db.get_sync_collection("users").insert_many([
+        {"email": "admin@tenantExport.com", "hashed_password": "!", "customer_id": "TenantExport", "role": "Admin", "created_at": datetime.utcnow()},
+        {"email": "user@tenantExport.com", "hashed_password": "!", "customer_id": "TenantExport", "role": "User", "created_at": datetime.utcnow()},
+    ])
+    base = datetime(2024, 3, 1)
+    db.get_sync_collection("tickets").insert_many([{
+        "title": f"Export {i}",
+        "description": f"Line, with \"quotes\" {i}",
+        "status": "Closed" if i % 2 else "Open",
+        "customer_id": customer_id,
+        "created_by": "admin@tenantExport.com",
+        "created_at": base + timedelta(days=i),
+        "updated_at": None,
+    } for customer_id in ("TenantExport", "TenantExportOther") for i in range(5)])
+    token = create_access_token({"sub": "admin@tenantExport.com", "customer_id": "TenantExport", "role": "Admin"})
+    yield {"Authorization": f"Bearer {token}"}
+    db.get_sync_collection("users").delete_many({"customer_id": "TenantExport"})
+    db.get_sync_collection("tickets").delete_many({"customer_id": {"$in": ["TenantExport", "TenantExportOther"]}})
+
+def test_ndjson_export_is_tenant_scoped_and_oldest_first(headers):
+    response = client.get("/api/tickets/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="tickets-TenantExport.ndjson"'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["title"] for row in rows] == [f"Export {i}" for i in range(5)]
+    assert {row["customer_id"] for row in rows} == {"TenantExport"}
+    assert list(rows[0]) == EXPORT_COLUMNS
+    assert rows[0]["created_at"] == "2024-03-01T00:00:00"
+    assert rows[0]["updated_at"] is None
+
+def test_csv_export_has_a_header_and_quotes_values(headers):
+    response = client.get("/api/tickets/export?format=csv", headers=headers)
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == EXPORT_COLUMNS
+    assert len(rows) == 6
+    assert rows[1][1:3] == ["Export 0", 'Line, with "quotes" 0']
+
+def test_export_filters_and_requires_admin(headers):
+    closed = client.get("/api/tickets/export?status=Closed&created_after=2024-03-02T12:00:00Z", headers=headers)
+    assert [json.loads(line)["title"] for line in closed.text.splitlines()] == ["Export 3"]
+
+    token = create_access_token({"sub": "user@tenantExport.com", "customer_id": "TenantExport", "role": "User"})
+    assert client.get("/api/tickets/export", headers={"Authorization": f"Bearer {token}"}).status_code == 403
+
+def test_stream_export_yields_one_chunk_per_batch():
+    async def cursor():
+        for i in range(5):
+            yield {"_id": i, "title": f"T{i}", "created_at": datetime(2024, 1, 1)}
+
+    async def collect():
+        return [chunk async for chunk in stream_export(cursor(), "ndjson", 2)]
+
+    chunks = client.portal.call(collect)
+    assert [len(chunk.splitlines()) for chunk in chunks] == [2, 2, 1]
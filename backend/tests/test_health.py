@@ -0,0 +1,67 @@
+import asyncio
+import os
+import signal
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import db
+from app.events import ticket_events
+from app.lifecycle import Lifecycle, lifecycle
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_liveness_and_readiness():
+    assert client.get("/health/live").json() == {"status": "alive"}
+    assert client.get("/health/ready").status_code == 200
+    assert client.get("/health").status_code == 200
+
+def test_readiness_reports_a_ping_timeout(monkeypatch):
+    async def hanging_ping():
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(db, "ping", hanging_ping)
+    monkeypatch.setattr("app.routes.health.READINESS_TIMEOUT_SECONDS", 0.01)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Database unavailable: timed out"
+
+def test_draining_worker_fails_readiness_and_closes_streams():
+    subscription, _ = ticket_events.subscribe("TenantDrain")
+    try:
+        lifecycle.drain()
+        assert client.get("/health/ready").status_code == 503
+        assert client.get("/health/live").status_code == 200
+        assert not subscription.queue.empty()
+        # Streams opened while draining end at once, so clients reconnect elsewhere
+        late, replay = ticket_events.subscribe("TenantDrain")
+        assert replay == [] and not late.queue.empty()
+    finally:
+        lifecycle.draining = False
+        ticket_events.draining = False
+
+def test_sigterm_drains_before_reaching_the_server_handler():
+    received = []
+    drained = []
+    previous = signal.signal(signal.SIGTERM, lambda sig, frame: received.append((sig, list(drained))))
+    worker = Lifecycle(drain_delay=0.05)
+    worker.on_drain(lambda: drained.append(True))
+
+    async def run():
+        worker.install()
+        try:
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0.2)
+        finally:
+            worker.uninstall()
+
+    try:
+        asyncio.run(run())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    assert worker.draining
+    assert received == [(signal.SIGTERM, [True])]
@@ -0,0 +1,27 @@
+from app.indexes import INDEXES, apply_indexes, diff_indexes, explain_hot_queries
+
+def test_declared_indexes_exist():
+    """After applying the registry nothing is missing or defined differently"""
+    apply_indexes()
+    for collection_name, changes in diff_indexes().items():
+        assert changes["missing"] == [], collection_name
+        assert changes["changed"] == [], collection_name
+
+def test_hot_queries_use_declared_indexes():
+    """Fails when a query on the request path falls back to a collection scan"""
+    apply_indexes()
+    for collection_name, query, expected, used in explain_hot_queries():
+        declared = {model.document["name"] for model in INDEXES[collection_name]}
+        assert "COLLSCAN" not in used, (collection_name, query)
+        assert declared & set(used), (collection_name, query, used)
+
+def test_text_index_spec_matches_server_form():
+    """The server reports text indexes as _fts/_ftsx keys; they must not show up as changed"""
+    from app.indexes import _index_spec
+    declared = next(model.document for model in INDEXES["tickets"] if model.document["name"] == "tenant_text")
+    live = {
+        "key": [("customer_id", 1), ("_fts", "text"), ("_ftsx", 1)],
+        "weights": {"description": 1, "title": 5},
+        "default_language": "english",
+    }
+    assert _index_spec(declared) == _index_spec(live)
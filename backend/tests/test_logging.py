@@ -0,0 +1,73 @@
+import json
+import logging
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+from app.log import ContextFilter, DebugSampler, JsonFormatter, parse_pairs
+from app.middleware import RequestStats, _request_stats
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def test_access_record_is_one_json_line_with_request_context():
+    capture = Capture()
+    access = logging.getLogger("app.access")
+    access.addHandler(capture)
+    disabled = access.disabled
+    access.disabled = False
+    try:
+        token = create_access_token({"sub": "user@tenantLog.com", "customer_id": "TenantLog", "role": "User"})
+        response = client.get("/me/profile", headers={"Authorization": f"Bearer {token}", "X-Request-ID": "req-42"})
+    finally:
+        access.removeHandler(capture)
+        access.disabled = disabled
+
+    assert response.headers["x-request-id"] == "req-42"
+    [record] = capture.records
+    line = json.loads(JsonFormatter().format(record))
+    assert line["request_id"] == "req-42"
+    # The token was valid, so the tenant is known even though the user does not exist
+    assert line["tenant"] == "TenantLog"
+    assert line["route"] == "/me/profile"
+    assert line["status"] == response.status_code
+    assert line["duration_ms"] >= 0
+
+def test_request_id_is_generated_when_missing():
+    assert len(client.get("/health/live").headers["x-request-id"]) == 32
+
+def test_records_logged_during_a_request_carry_its_context():
+    stats = RequestStats("req-7", "GET", {"route": None})
+    stats.tenant = "TenantLog"
+    token = _request_stats.set(stats)
+    try:
+        record = logging.LogRecord("app.outbox", logging.WARNING, __file__, 1, "Dispatch failed", (), None)
+        ContextFilter().filter(record)
+    finally:
+        _request_stats.reset(token)
+    line = json.loads(JsonFormatter().format(record))
+    assert (line["request_id"], line["tenant"], line["method"]) == ("req-7", "TenantLog", "GET")
+
+def test_debug_records_are_sampled_per_module():
+    sampler = DebugSampler(parse_pairs("app.ratelimit=0, app=1"))
+
+    def kept(name, level=logging.DEBUG):
+        return sampler.filter(logging.LogRecord(name, level, __file__, 1, "", (), None))
+
+    assert not kept("app.ratelimit")
+    assert not kept("app.ratelimit.sync")
+    assert kept("app.ratelimit", logging.INFO)
+    assert kept("app.outbox")
+    assert kept("uvicorn")
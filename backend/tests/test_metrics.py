@@ -0,0 +1,28 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.metrics import Registry
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("demo_seconds", "Demo latency", ("route",), buckets=(0.1, 1.0))
+    latency.observe(0.05, "/a")
+    latency.observe(0.5, "/a")
+    latency.observe(5.0, "/a")
+
+    text = registry.render()
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{route="/a"} 3' in text
+
+def test_metrics_endpoint_reports_route_templates():
+    """Requests are labelled by route template, not by raw path"""
+    with TestClient(app) as client:
+        client.get("/health")
+        client.get("/api/tickets/0123456789abcdef01234567")  # unauthenticated, still counted
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in response.text
+    assert 'route="/api/tickets/{ticket_id}",status="401"' in response.text
@@ -0,0 +1,97 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from bson import ObjectId
+from datetime import datetime, timedelta
+from app.main import app
+from app.db import db
+from app.outbox import DEAD_LETTER_COLLECTION, OUTBOX_COLLECTION, OUTBOX_MAX_ATTEMPTS, OutboxDispatcher, outbox_record
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    # The app's own dispatcher would race the one under test for the records
+    previous = os.environ.get("OUTBOX_DISPATCHER_ENABLED")
+    os.environ["OUTBOX_DISPATCHER_ENABLED"] = "false"
+    try:
+        with client:
+            yield
+    finally:
+        if previous is None:
+            os.environ.pop("OUTBOX_DISPATCHER_ENABLED")
+        else:
+            os.environ["OUTBOX_DISPATCHER_ENABLED"] = previous
+
+class FakeN8n:
+    """Stands in for the dispatcher's HTTP client, recording the posted ticket ids"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.posted = []
+
+    async def post(self, url, json):
+        self.posted.append(json["ticket_id"])
+        if self.fail:
+            raise RuntimeError("n8n is down")
+        return self
+
+    def raise_for_status(self):
+        pass
+
+@pytest.fixture
+def outbox():
+    outbox = db.get_sync_collection(OUTBOX_COLLECTION)
+    yield outbox
+    outbox.delete_many({"customer_id": "TenantOutbox"})
+    db.get_sync_collection(DEAD_LETTER_COLLECTION).delete_many({"customer_id": "TenantOutbox"})
+
+def enqueue(outbox, **fields):
+    ticket = {"_id": ObjectId(), "customer_id": "TenantOutbox", "title": "Outbox", "description": "Outbox test", "status": "Open"}
+    record = {**outbox_record(ticket, datetime.utcnow() - timedelta(seconds=1)), **fields}
+    return outbox.insert_one(record).inserted_id
+
+def dispatch(n8n):
+    dispatcher = OutboxDispatcher()
+    dispatcher._http = n8n
+    client.portal.call(dispatcher.dispatch_once)
+
+def test_delivered_records_are_removed(outbox):
+    record_id = enqueue(outbox)
+    later_id = enqueue(outbox, next_attempt_at=datetime.utcnow() + timedelta(minutes=5))
+    n8n = FakeN8n()
+    dispatch(n8n)
+    assert str(outbox.find_one({"_id": later_id})["ticket_id"]) not in n8n.posted
+    assert outbox.find_one({"_id": record_id}) is None
+    assert outbox.find_one({"_id": later_id})["status"] == "pending"
+
+def test_failed_delivery_backs_off(outbox):
+    record_id = enqueue(outbox)
+    dispatch(FakeN8n(fail=True))
+    record = outbox.find_one({"_id": record_id})
+    assert (record["status"], record["attempts"], record["last_error"]) == ("pending", 1, "n8n is down")
+    assert record["next_attempt_at"] > datetime.utcnow()
+    assert "claim_id" not in record
+
+    # Not due yet, so the next round leaves it alone
+    n8n = FakeN8n()
+    dispatch(n8n)
+    assert str(record["ticket_id"]) not in n8n.posted
+
+def test_expired_leases_are_claimed_again(outbox):
+    now = datetime.utcnow()
+    expired_id = enqueue(outbox, status="in_flight", claim_id="crashed-worker", lease_until=now - timedelta(seconds=1))
+    held_id = enqueue(outbox, status="in_flight", claim_id="live-worker", lease_until=now + timedelta(minutes=1))
+    dispatch(FakeN8n())
+    assert outbox.find_one({"_id": expired_id}) is None
+    assert outbox.find_one({"_id": held_id})["claim_id"] == "live-worker"
+
+def test_exhausted_records_are_dead_lettered_once(outbox):
+    dead_letters = db.get_sync_collection(DEAD_LETTER_COLLECTION)
+    record_id = enqueue(outbox, attempts=OUTBOX_MAX_ATTEMPTS - 1)
+    # Left behind by a round that wrote the dead letter but failed to remove the outbox record
+    dead_letters.insert_one({"_id": record_id, "customer_id": "TenantOutbox", "attempts": OUTBOX_MAX_ATTEMPTS})
+    dispatch(FakeN8n(fail=True))
+    assert outbox.find_one({"_id": record_id}) is None
+    dead_letter = dead_letters.find_one({"_id": record_id})
+    assert (dead_letter["attempts"], dead_letter["last_error"]) == (OUTBOX_MAX_ATTEMPTS, "n8n is down")
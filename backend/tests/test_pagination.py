@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.pagination import encode_cursor, decode_cursor
+from bson import ObjectId
+from datetime import datetime, timedelta
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+    doc_id = ObjectId()
+    assert decode_cursor(encode_cursor(created_at, doc_id)) == (created_at, doc_id)
+
+def test_ticket_pages_cover_every_ticket_once():
+    """Walking the cursor chain returns each ticket exactly once, newest first"""
+    tickets_collection = db.get_sync_collection("tickets")
+    base = datetime(2024, 1, 1)
+    # Several tickets share a created_at so the _id tie-breaker is exercised
+    docs = [{
+        "title": f"Paged {i}",
+        "description": "Pagination test",
+        "status": "Open",
+        "customer_id": "TenantPaging",
+        "created_by": "user@tenantPaging.com",
+        "created_at": base + timedelta(minutes=i // 3),
+        "updated_at": None
+    } for i in range(11)]
+    tickets_collection.insert_many(docs)
+    users_collection = db.get_sync_collection("users")
+    users_collection.insert_one({
+        "email": "user@tenantPaging.com",
+        "hashed_password": "!",
+        "customer_id": "TenantPaging",
+        "role": "User",
+        "created_at": base
+    })
+
+    try:
+        token = create_access_token({"sub": "user@tenantPaging.com", "customer_id": "TenantPaging", "role": "User"})
+        headers = {"Authorization": f"Bearer {token}"}
+        seen = []
+        params = {"limit": 4, "created_by": "user@tenantPaging.com"}
+        while True:
+            response = client.get("/api/tickets/", params=params, headers=headers)
+            assert response.status_code == 200
+            seen.extend(ticket["title"] for ticket in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            params["cursor"] = cursor
+
+        assert len(seen) == 11
+        assert len(set(seen)) == 11
+        assert seen[0] == "Paged 10"
+    finally:
+        tickets_collection.delete_many({"customer_id": "TenantPaging"})
+        users_collection.delete_one({"email": "user@tenantPaging.com"})
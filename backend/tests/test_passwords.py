@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from datetime import datetime
+from passlib.hash import bcrypt
+from app.main import app
+from app.db import db
+from app.passwords import BCRYPT_ROUNDS, PasswordHasher
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+class RecordingContext:
+    """Stands in for the CryptContext and records which thread runs it"""
+
+    def __init__(self):
+        self.threads = []
+        self.release = threading.Event()
+
+    def verify_and_update(self, password, hashed_password):
+        self.threads.append(threading.current_thread().name)
+        self.release.wait(5)
+        return password == hashed_password, None
+
+def test_verify_runs_on_the_pool_and_rejects_past_the_pending_limit():
+    context = RecordingContext()
+    hasher = PasswordHasher(workers=1, max_pending=1, context=context)
+
+    async def scenario():
+        first = asyncio.ensure_future(hasher.verify_and_update("secret", "secret"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as rejected:
+            await hasher.verify_and_update("secret", "other")
+        context.release.set()
+        return await first, rejected.value
+
+    (valid, new_hash), rejected = client.portal.call(scenario)
+    assert (valid, new_hash) == (True, None)
+    assert rejected.status_code == 503
+    assert context.threads == ["bcrypt_0"]
+    assert hasher.stats()["rejected"] == 1 and hasher.stats()["in_flight"] == 0
+
+def test_login_rehashes_a_legacy_cost_hash():
+    users = db.get_sync_collection("users")
+    legacy_rounds = 4 if BCRYPT_ROUNDS != 4 else 5
+    users.insert_one({
+        "email": "user@tenantRehash.com",
+        "hashed_password": bcrypt.using(rounds=legacy_rounds).hash("password"),
+        "customer_id": "TenantRehash",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+    try:
+        response = client.post("/auth/token", data={"username": "user@tenantRehash.com", "password": "password"})
+        assert response.status_code == 200
+        stored = users.find_one({"email": "user@tenantRehash.com"})["hashed_password"]
+        assert bcrypt.from_string(stored).rounds == BCRYPT_ROUNDS
+        assert bcrypt.verify("password", stored)
+
+        # Already at the current cost, so the next login leaves it as it is
+        assert client.post("/auth/token", data={"username": "user@tenantRehash.com", "password": "password"}).status_code == 200
+        assert users.find_one({"email": "user@tenantRehash.com"})["hashed_password"] == stored
+    finally:
+        users.delete_many({"customer_id": "TenantRehash"})
@@ -0,0 +1,65 @@
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+from datetime import datetime
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.registry import ScreenRegistry
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def write_registry(path, use_cases, mtime):
+    with open(path, "w") as f:
+        f.write(use_cases if isinstance(use_cases, str) else json.dumps({"useCases": use_cases}))
+    # Set explicitly, the filesystem's mtime resolution may be coarser than the test
+    os.utime(path, (mtime, mtime))
+
+def test_registry_reloads_on_mtime_change_and_keeps_the_last_good_index(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.registry.REGISTRY_CHECK_INTERVAL_SECONDS", 0)
+    path = str(tmp_path / "registry.json")
+    write_registry(path, [{"tenant": "TenantScreens", "screenUrl": "/support"}], 1_000_000)
+    registry = ScreenRegistry(path)
+    first = registry.screens_for("TenantScreens")
+    assert json.loads(first.body) == [{"tenant": "TenantScreens", "screenUrl": "/support"}]
+
+    write_registry(path, [{"tenant": "TenantScreens", "screenUrl": "/orders"}], 1_000_100)
+    second = registry.screens_for("TenantScreens")
+    assert json.loads(second.body) == [{"tenant": "TenantScreens", "screenUrl": "/orders"}]
+    assert second.etag != first.etag
+
+    # Half-written file: the last good index keeps being served
+    write_registry(path, '{"useCases": [{"tenant": "Tenant', 1_000_200)
+    assert registry.screens_for("TenantScreens") == second
+    write_registry(path, [{"tenant": "TenantScreens", "screenUrl": "/billing"}], 1_000_300)
+    assert json.loads(registry.screens_for("TenantScreens").body) == [{"tenant": "TenantScreens", "screenUrl": "/billing"}]
+
+def test_screens_answer_304_to_a_matching_etag():
+    db.get_sync_collection("users").insert_one({
+        "email": "user@tenantScreens.com",
+        "hashed_password": "!",
+        "customer_id": "TenantScreens",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+    token = create_access_token({"sub": "user@tenantScreens.com", "customer_id": "TenantScreens", "role": "User"})
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        response = client.get("/me/screens", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == [{"tenant": "TenantScreens", "screenUrl": "/support"}]
+        etag = response.headers["etag"]
+
+        cached = client.get("/me/screens", headers={**headers, "If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag
+        assert cached.content == b""
+        assert client.get("/me/screens", headers={**headers, "If-None-Match": '"stale"'}).status_code == 200
+    finally:
+        db.get_sync_collection("users").delete_many({"customer_id": "TenantScreens"})
@@ -0,0 +1,66 @@
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import Response
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.response_cache import ResponseCache, response_cache
+from datetime import datetime
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_lru_is_bounded_by_bytes():
+    cache = ResponseCache(True, max_bytes=10, max_entry_bytes=8, max_age=0)
+    for key in ("a", "b", "c"):
+        lookup = cache.lookup("T", (key,))
+        cache.store(lookup, Response(b"1234"))
+    assert cache.stats()["bytes"] == 8 and cache.stats()["evictions"] == 1
+    # Too large to keep, but still tagged and served
+    lookup = cache.lookup("T", ("big",))
+    assert cache.store(lookup, Response(b"123456789")).headers["etag"] == lookup.etag
+    assert cache.lookup("T", ("big",)).response is None
+    assert cache.lookup("T", ("c",)).response.body == b"1234"
+
+def test_polls_are_served_from_the_cache_until_a_write():
+    users_collection = db.get_sync_collection("users")
+    users_collection.insert_one({
+        "email": "user@tenantCache.com",
+        "hashed_password": "!",
+        "customer_id": "TenantCache",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+
+    try:
+        token = create_access_token({"sub": "user@tenantCache.com", "customer_id": "TenantCache", "role": "User"})
+        headers = {"Authorization": f"Bearer {token}"}
+        ticket = client.post("/api/tickets/", json={"title": "Cached", "description": "Poll me"}, headers=headers).json()
+
+        first = client.get("/api/tickets/", headers=headers)
+        etag = first.headers["etag"]
+        stats = response_cache.stats()
+        repeat = client.get("/api/tickets/", headers=headers)
+        assert repeat.json() == first.json() and repeat.headers["etag"] == etag
+        assert response_cache.stats()["hits"] == stats["hits"] + 1
+
+        not_modified = client.get("/api/tickets/", headers={**headers, "If-None-Match": etag})
+        assert not_modified.status_code == 304 and not_modified.headers["etag"] == etag
+
+        detail = client.get(f"/api/tickets/{ticket['id']}", headers=headers)
+        assert client.get(f"/api/tickets/{ticket['id']}", headers={**headers, "If-None-Match": detail.headers["etag"]}).status_code == 304
+
+        # Any write to the tenant changes the version behind every ETag
+        client.put(f"/api/tickets/{ticket['id']}", json={"status": "Done"}, headers=headers)
+        changed = client.get("/api/tickets/", headers={**headers, "If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["etag"] != etag
+        assert changed.json()[0]["status"] == "Done"
+        assert client.get(f"/api/tickets/{ticket['id']}", headers={**headers, "If-None-Match": detail.headers["etag"]}).json()["status"] == "Done"
+    finally:
+        users_collection.delete_many({"customer_id": "TenantCache"})
+        db.get_sync_collection("tickets").delete_many({"customer_id": "TenantCache"})
+        db.get_sync_collection("ticket_stats").delete_many({"_id": "TenantCache"})
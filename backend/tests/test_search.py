@@ -0,0 +1,58 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.search import highlight_spans, search_terms
+from datetime import datetime
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_search_terms_skip_negations_and_keep_phrases():
+    assert search_terms('"Password reset" failing -billing') == ["password", "reset", "failing"]
+
+def test_highlight_spans_match_word_variants():
+    text = "Login fails; logins from mobile failed"
+    spans = highlight_spans(text, ["login", "failing"])
+    assert [text[start:end] for start, end in spans] == ["Login", "fails", "logins", "failed"]
+
+def test_search_is_ranked_and_tenant_scoped():
+    tickets_collection = db.get_sync_collection("tickets")
+    users_collection = db.get_sync_collection("users")
+    now = datetime.utcnow()
+    users_collection.insert_one({
+        "email": "user@tenantSearch.com",
+        "hashed_password": "!",
+        "customer_id": "TenantSearch",
+        "role": "User",
+        "created_at": now
+    })
+    tickets_collection.insert_many([
+        {"title": "Invoice totals wrong", "description": "The invoice page shows a wrong invoice total",
+         "status": "Open", "customer_id": "TenantSearch", "created_by": "user@tenantSearch.com", "created_at": now, "updated_at": None},
+        {"title": "Dark mode", "description": "Please add dark mode to the invoice export",
+         "status": "Open", "customer_id": "TenantSearch", "created_by": "user@tenantSearch.com", "created_at": now, "updated_at": None},
+        {"title": "Invoice missing", "description": "Another tenant's invoice",
+         "status": "Open", "customer_id": "TenantSearchOther", "created_by": "x@other.com", "created_at": now, "updated_at": None},
+    ])
+
+    try:
+        token = create_access_token({"sub": "user@tenantSearch.com", "customer_id": "TenantSearch", "role": "User"})
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/api/tickets/search", params={"q": "invoice", "limit": 1}, headers=headers)
+        assert response.status_code == 200
+        first = response.json()
+        assert [ticket["title"] for ticket in first] == ["Invoice totals wrong"]
+        assert first[0]["highlights"]["title"] == [[0, 7]]
+
+        response = client.get("/api/tickets/search", params={"q": "invoice", "cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        assert [ticket["title"] for ticket in response.json()] == ["Dark mode"]
+        assert "X-Next-Cursor" not in response.headers
+    finally:
+        tickets_collection.delete_many({"customer_id": {"$in": ["TenantSearch", "TenantSearchOther"]}})
+        users_collection.delete_many({"customer_id": "TenantSearch"})
@@ -0,0 +1,61 @@
+import pytest
+from fastapi.testclient import TestClient
+from datetime import datetime
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.seed_data import generate_tickets, remove_bulk, seed_data, seed_synthetic
+
+PREFIX = "SeedTest"
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_generated_tickets_are_reproducible_and_realistic():
+    now = datetime(2026, 1, 1)
+    tickets = generate_tickets("SeedTest0", 5, 0, 2000, now, days=90, text_size=300, seed=1)
+    assert tickets == generate_tickets("SeedTest0", 5, 0, 2000, now, days=90, text_size=300, seed=1)
+    assert {ticket["status"] for ticket in tickets} == {"Open", "In Progress", "Done"}
+    assert all((now - ticket["created_at"]).days <= 90 for ticket in tickets)
+    assert all(ticket["created_at"] <= ticket["closed_at"] <= now for ticket in tickets if ticket["status"] == "Done")
+    mean_size = sum(len(ticket["description"]) for ticket in tickets) / len(tickets)
+    assert 200 < mean_size < 400
+
+def test_synthetic_tenants_are_added_appended_and_counted_in_stats():
+    tickets = db.get_sync_collection("tickets")
+    stats = db.get_sync_collection("ticket_stats")
+    try:
+        report = seed_synthetic(2, 3, 50, prefix=PREFIX, chunk_size=20, mode="replace")
+        assert report["tenants"] == ["SeedTest0", "SeedTest1"]
+        assert (report["users"], report["tickets"]) == (6, 100)
+        assert report["tickets_per_second"] > 0
+
+        # Incremental: new tenants continue the numbering, appends keep the users
+        assert seed_synthetic(1, 3, 10, prefix=PREFIX)["tenants"] == ["SeedTest2"]
+        appended = seed_synthetic(1, 3, 25, prefix=PREFIX, chunk_size=20, mode="append")
+        assert (appended["users"], appended["tickets"]) == (0, 25)
+        assert db.get_sync_collection("users").count_documents({"customer_id": "SeedTest0"}) == 3
+
+        assert tickets.count_documents({"customer_id": "SeedTest0"}) == 75
+        counters = stats.find_one({"_id": "SeedTest0"})
+        assert counters["total"] == 75
+        assert counters["closed_count"] == tickets.count_documents({"customer_id": "SeedTest0", "status": "Done"})
+    finally:
+        remove_bulk(PREFIX)
+    assert tickets.count_documents({"customer_id": "SeedTest0"}) == 0
+    assert stats.find_one({"_id": "SeedTest0"}) is None
+
+def test_demo_seed_counts_its_tickets_in_stats():
+    # Counters left over from an earlier seed must not survive a reseed
+    db.get_sync_collection("ticket_stats").replace_one({"_id": "TenantA"}, {"total": 40, "by_status": {"Open": 40}}, upsert=True)
+    assert seed_data(force=True)
+
+    token = create_access_token({"sub": "admin@tenantA.com", "customer_id": "TenantA", "role": "Admin"})
+    stats = client.get("/api/tickets/stats", headers={"Authorization": f"Bearer {token}"}).json()
+    assert stats["total"] == 2
+    assert stats["by_status"] == {"Open": 1, "In Progress": 1}
+    assert stats["created_per_day"][-1]["count"] == 2
@@ -0,0 +1,67 @@
+import json
+import pytest
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import db
+from app.models import TicketResponse
+from app.serialization import dumps, model_fields, to_public
+from app.auth import create_access_token
+from datetime import datetime
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_fast_path_matches_response_model():
+    ticket = {
+        "_id": ObjectId(),
+        "title": "Printer",
+        "description": "Out of toner",
+        "status": "Open",
+        "customer_id": "TenantA",
+        "created_by": "user@tenanta.com",
+        "created_at": datetime(2024, 5, 1, 12, 30, 15, 123456),
+        "updated_at": None,
+        "workflow_status": "completed",
+    }
+    expected = jsonable_encoder(TicketResponse.model_validate(dict(ticket, id=str(ticket["_id"]))))
+    assert json.loads(dumps(to_public(ticket, model_fields(TicketResponse)))) == expected
+
+def test_routes_keep_their_schema_and_return_public_fields():
+    schema = client.get("/openapi.json").json()
+    list_schema = schema["paths"]["/api/tickets/"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert list_schema["items"]["$ref"].endswith("/TicketResponse")
+
+    users_collection = db.get_sync_collection("users")
+    users_collection.insert_one({
+        "email": "user@tenantSerialization.com",
+        "hashed_password": "!",
+        "customer_id": "TenantSerialization",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+
+    try:
+        token = create_access_token({"sub": "user@tenantSerialization.com", "customer_id": "TenantSerialization", "role": "User"})
+        headers = {"Authorization": f"Bearer {token}"}
+        created = client.post("/api/tickets/", json={"title": "Serialized", "description": "Fast path"}, headers=headers)
+        assert created.status_code == 200
+        assert created.headers["content-type"] == "application/json"
+        ticket = created.json()
+        assert set(ticket) == set(model_fields(TicketResponse))
+
+        fetched = client.get(f"/api/tickets/{ticket['id']}", headers=headers).json()
+        # MongoDB stores datetimes to the millisecond
+        assert fetched.pop("created_at")[:23] == ticket.pop("created_at")[:23]
+        assert fetched == ticket
+        listed = client.get("/api/tickets/", params={"fields": "title,id"}, headers=headers).json()
+        assert all(list(item) == ["id", "title"] for item in listed)
+    finally:
+        users_collection.delete_many({"customer_id": "TenantSerialization"})
+        db.get_sync_collection("tickets").delete_many({"customer_id": "TenantSerialization"})
+        db.get_sync_collection("ticket_stats").delete_many({"_id": "TenantSerialization"})
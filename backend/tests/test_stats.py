@@ -0,0 +1,111 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import db
+from app.auth import create_access_token
+from app.stats import STATS_COLLECTION, StatsDelta, rebuild_stats, stats_response, status_update
+from datetime import datetime
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_status_names_with_dots_and_dollars_round_trip():
+    delta = StatsDelta().created({"customer_id": "T", "status": "$v1.2", "created_at": datetime(2024, 5, 1)})
+    increments = delta.operations(datetime.utcnow())[0]._doc["$inc"]
+    by_status = {field.split(".", 1)[1]: count for field, count in increments.items() if field.startswith("by_status.")}
+    assert stats_response({"by_status": by_status}, 1, datetime(2024, 5, 1))["by_status"] == {"$v1.2": 1}
+
+def test_counters_follow_writes_and_match_rebuild():
+    users_collection = db.get_sync_collection("users")
+    tickets_collection = db.get_sync_collection("tickets")
+    users_collection.insert_one({
+        "email": "user@tenantStats.com",
+        "hashed_password": "!",
+        "customer_id": "TenantStats",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+
+    try:
+        token = create_access_token({"sub": "user@tenantStats.com", "customer_id": "TenantStats", "role": "User"})
+        headers = {"Authorization": f"Bearer {token}"}
+        ids = [client.post("/api/tickets/", json={"title": f"Stats {i}", "description": "Stats test"}, headers=headers).json()["id"]
+               for i in range(3)]
+        assert client.put(f"/api/tickets/{ids[0]}", json={"status": "Done"}, headers=headers).status_code == 200
+        response = client.post("/webhook/ticket-done", json={"customer_id": "TenantStats", "status": "Done", "ticket_id": ids[1]},
+                               headers={"X-Shared-Secret": os.getenv("N8N_WEBHOOK_SECRET", "your_n8n_webhook_secret")})
+        assert response.status_code == 200
+        assert client.delete(f"/api/tickets/{ids[2]}", headers=headers).status_code == 200
+
+        stats = client.get("/api/tickets/stats", params={"days": 7}, headers=headers).json()
+        assert stats["total"] == 2
+        assert stats["by_status"] == {"Done": 2}
+        assert stats["closed_count"] == 2
+        assert stats["mean_time_to_close_seconds"] is not None
+        assert len(stats["created_per_day"]) == 7
+        assert stats["created_per_day"][-1] == {"date": datetime.utcnow().strftime("%Y-%m-%d"), "count": 2}
+
+        rebuild_stats("TenantStats")
+        rebuilt = client.get("/api/tickets/stats", params={"days": 7}, headers=headers).json()
+        for field in ("total", "by_status", "created_per_day", "closed_count"):
+            assert rebuilt[field] == stats[field]
+    finally:
+        tickets_collection.delete_many({"customer_id": "TenantStats"})
+        users_collection.delete_many({"customer_id": "TenantStats"})
+        db.get_sync_collection(STATS_COLLECTION).delete_many({"_id": "TenantStats"})
+
+class RacedTickets:
+    """The tickets collection, with another request changing the status just before the first guarded update"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.raced = False
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def find_one_and_update(self, filter, update, **kwargs):
+        if not self.raced:
+            self.raced = True
+            before = await self.collection.find_one({"_id": filter["_id"]})
+            now = datetime.utcnow()
+            await self.collection.update_one({"_id": filter["_id"]}, status_update({"status": "In Progress"}, now))
+            await StatsDelta().changed(before, {**before, "status": "In Progress"}).apply()
+        return await self.collection.find_one_and_update(filter, update, **kwargs)
+
+def test_update_returns_the_stored_ticket_and_counts_from_its_pre_image(monkeypatch):
+    users_collection = db.get_sync_collection("users")
+    users_collection.insert_one({
+        "email": "user@tenantStatsRace.com",
+        "hashed_password": "!",
+        "customer_id": "TenantStatsRace",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+
+    try:
+        token = create_access_token({"sub": "user@tenantStatsRace.com", "customer_id": "TenantStatsRace", "role": "User"})
+        headers = {"Authorization": f"Bearer {token}"}
+        ticket_id = client.post("/api/tickets/", json={"title": "Raced", "description": "Stats race test"}, headers=headers).json()["id"]
+
+        collection = db.get_collection
+        monkeypatch.setattr(db, "get_collection", lambda name: RacedTickets(collection(name)) if name == "tickets" else collection(name))
+        response = client.put(f"/api/tickets/{ticket_id}", json={"status": "Done", "title": "Raced and closed"}, headers=headers)
+        monkeypatch.setattr(db, "get_collection", collection)
+        assert response.status_code == 200
+        assert response.json() == client.get(f"/api/tickets/{ticket_id}", headers=headers).json()
+        assert (response.json()["status"], response.json()["title"]) == ("Done", "Raced and closed")
+
+        stats = client.get("/api/tickets/stats", headers=headers).json()
+        assert (stats["total"], stats["by_status"], stats["closed_count"]) == (1, {"Done": 1}, 1)
+        rebuild_stats("TenantStatsRace")
+        assert client.get("/api/tickets/stats", headers=headers).json()["by_status"] == {"Done": 1}
+    finally:
+        db.get_sync_collection("tickets").delete_many({"customer_id": "TenantStatsRace"})
+        users_collection.delete_many({"customer_id": "TenantStatsRace"})
+        db.get_sync_collection(STATS_COLLECTION).delete_many({"_id": "TenantStatsRace"})
@@ -8,6 +8,12 @@ from datetime import datetime
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    """Run the app lifespan so the async Mongo client is opened on the test client's loop"""
+    with client:
+        yield
+
 def create_test_jwt(email, customer_id, role):
     """Create JWT token for testing"""
     return create_access_token({
@@ -19,7 +25,7 @@ def create_test_jwt(email, customer_id, role):
 def test_tenant_isolation_admin_cannot_access_other_tenant_data():
     """Test that Admin from Tenant A cannot read Tenant B's data"""
     # Setup test data
-    tickets_collection = db.get_collection("tickets")
+    tickets_collection = db.get_sync_collection("tickets")
     
     # Create ticket for TenantA
     tenant_a_ticket = {
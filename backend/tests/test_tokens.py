@@ -0,0 +1,89 @@
+import pytest
+from fastapi.testclient import TestClient
+from jose import JWTError, jwt
+from datetime import datetime
+from app.main import app
+from app.db import db
+from app.auth import get_password_hash
+from app.tokens import ALGORITHM, REVOCATION_COLLECTION, Keyring, revocations, verified_tokens
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+@pytest.fixture
+def user():
+    users_collection = db.get_sync_collection("users")
+    users_collection.insert_one({
+        "email": "user@tenantTokens.com",
+        "hashed_password": get_password_hash("secret"),
+        "customer_id": "TenantTokens",
+        "role": "User",
+        "created_at": datetime.utcnow()
+    })
+    yield "user@tenantTokens.com"
+    users_collection.delete_many({"customer_id": "TenantTokens"})
+    db.get_sync_collection("refresh_tokens").delete_many({"customer_id": "TenantTokens"})
+
+def login(email):
+    return client.post("/auth/token", data={"username": email, "password": "secret"}).json()
+
+def test_refresh_rotates_and_a_reused_refresh_token_revokes_the_family(user, monkeypatch):
+    monkeypatch.setattr("app.tokens.REFRESH_REUSE_GRACE_SECONDS", 0)
+    tokens = login(user)
+    assert tokens["expires_in"] > 0
+    refreshed = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert refreshed.status_code == 200
+    rotated = refreshed.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert client.get("/me/profile", headers={"Authorization": f"Bearer {rotated['access_token']}"}).json()["email"] == user
+
+    # Someone replays the old token: both it and the one issued in its place stop working
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]}).status_code == 401
+
+def test_logout_revokes_the_access_token(user):
+    tokens = login(user)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/me/profile", headers=headers).status_code == 200
+    hits = verified_tokens.hits
+    assert client.get("/me/profile", headers=headers).status_code == 200
+    # Verified once, then served from the cache (the rate limiter counts as a lookup too)
+    assert verified_tokens.hits > hits
+
+    assert client.post("/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers).status_code == 200
+    assert client.get("/me/profile", headers=headers).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_keyring_verifies_every_key_and_signs_with_the_active_one():
+    previous = Keyring({"2026-04": "old-secret"}, "2026-04")
+    keyring = Keyring({"2026-10": "new-secret", "2026-04": "old-secret"}, "2026-10")
+    token = keyring.sign({"sub": "a"})
+    assert jwt.get_unverified_header(token)["kid"] == "2026-10"
+    assert keyring.decode(previous.sign({"sub": "b"}))["sub"] == "b"
+    with pytest.raises(JWTError):
+        previous.decode(token)
+
+    # Tokens from before the keyring have no kid and use the default key
+    legacy = jwt.encode({"sub": "c"}, "legacy-secret", algorithm=ALGORITHM)
+    assert Keyring({"default": "legacy-secret"}, "default").decode(legacy)["sub"] == "c"
+    with pytest.raises(JWTError):
+        keyring.decode(legacy)
+
+def test_user_revocation_spares_tokens_issued_in_the_same_second(user):
+    try:
+        client.portal.call(revocations.revoke_user, user)
+        before = revocations.users[user]
+        assert revocations.is_revoked({"sub": user, "iat": before - 1})
+        assert not revocations.is_revoked({"sub": user, "iat": before})
+
+        # Logging in again right after a password reset works
+        tokens = login(user)
+        assert client.get("/me/profile", headers={"Authorization": f"Bearer {tokens['access_token']}"}).status_code == 200
+    finally:
+        revocations.users.pop(user, None)
+        revocations._local.pop(("user", user), None)
+        db.get_sync_collection(REVOCATION_COLLECTION).delete_many({"sub": user})
@@ -0,0 +1,223 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import db
+from app.events import ticket_events
+from app.auth import create_access_token
+from app.stats import StatsDelta
+from app import webhook_batch
+from app.webhook_batch import IDEMPOTENCY_COLLECTION, WebhookBatcher, apply_status_events
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+from datetime import datetime, timedelta
+import asyncio
+
+client = TestClient(app)
+SECRET = {"X-Shared-Secret": os.getenv("N8N_WEBHOOK_SECRET", "your_n8n_webhook_secret")}
+
+@pytest.fixture(autouse=True, scope="module")
+def app_lifespan():
+    with client:
+        yield
+
+def test_batch_rejects_wrong_secret():
+    response = client.post("/webhook/ticket-done/batch", json={"events": []}, headers={"X-Shared-Secret": "wrong"})
+    assert response.status_code == 403
+
+def test_batch_dedupes_and_rejects_stale_events():
+    tickets_collection = db.get_sync_collection("tickets")
+    ticket_id = str(tickets_collection.insert_one({
+        "title": "Webhook batch",
+        "description": "Webhook batch test",
+        "status": "Open",
+        "customer_id": "TenantHook",
+        "created_by": "user@tenantHook.com",
+        "created_at": datetime.utcnow(),
+        "updated_at": None
+    }).inserted_id)
+    now = datetime.utcnow()
+
+    try:
+        response = client.post("/webhook/ticket-done/batch", params={"wait": "true"}, headers=SECRET, json={"events": [
+            {"customer_id": "TenantHook", "ticket_id": ticket_id, "status": "In Progress", "event_id": "e1", "occurred_at": (now - timedelta(minutes=5)).isoformat()},
+            {"customer_id": "TenantHook", "ticket_id": ticket_id, "status": "Done", "event_id": "e2", "occurred_at": now.isoformat()},
+            {"customer_id": "TenantHook", "ticket_id": ticket_id, "status": "Done", "event_id": "e2", "occurred_at": now.isoformat()},
+            {"customer_id": "TenantOther", "ticket_id": ticket_id, "status": "Done"},
+            {"customer_id": "TenantHook", "ticket_id": "not-an-id", "status": "Done"},
+        ]})
+        assert response.status_code == 200
+        assert [result["status"] for result in response.json()["results"]] == ["applied", "applied", "duplicate", "not_found", "invalid"]
+        assert tickets_collection.find_one({"_id": ObjectId(ticket_id)})["status"] == "Done"
+
+        # Older than the last applied change, so it must not reopen the ticket
+        response = client.post("/webhook/ticket-done/batch", params={"wait": "true"}, headers=SECRET, json={"events": [
+            {"customer_id": "TenantHook", "ticket_id": ticket_id, "status": "Open", "event_id": "e3", "occurred_at": (now - timedelta(minutes=1)).isoformat()},
+        ]})
+        assert [result["status"] for result in response.json()["results"]] == ["stale"]
+        assert tickets_collection.find_one({"_id": ObjectId(ticket_id)})["status"] == "Done"
+
+        response = client.post("/webhook/ticket-done/batch", headers=SECRET, json={"events": [
+            {"customer_id": "TenantHook", "ticket_id": ticket_id, "status": "Done", "event_id": "e4"},
+        ]})
+        assert response.status_code == 202
+        assert response.json() == {"accepted": 1, "invalid": []}
+    finally:
+        tickets_collection.delete_many({"customer_id": "TenantHook"})
+        db.get_sync_collection(IDEMPOTENCY_COLLECTION).delete_many({"_id": {"$regex": "^TenantHook:"}})
+
+class FailingTickets:
+    """The tickets collection, with one ticket changed by someone else before the batch write and the write failing at `fail_at`"""
+
+    def __init__(self, collection, concurrent_id, fail_at):
+        self.collection = collection
+        self.concurrent_id = concurrent_id
+        self.fail_at = fail_at
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def bulk_write(self, writes, ordered=True):
+        await self.collection.update_one({"_id": self.concurrent_id}, {"$set": {"status": "Closed", "status_changed_at": datetime.utcnow()}})
+        result = await self.collection.bulk_write(writes[:self.fail_at], ordered=ordered)
+        raise BulkWriteError({
+            "writeErrors": [{"index": self.fail_at, "code": 2, "errmsg": "injected failure"}],
+            "nMatched": result.matched_count,
+            "nModified": result.modified_count,
+        })
+
+def test_batch_counts_only_matched_writes_and_releases_unwritten_keys(monkeypatch):
+    tickets_collection = db.get_sync_collection("tickets")
+    ticket_ids = tickets_collection.insert_many([{
+        "title": f"Webhook batch {i}",
+        "description": "Webhook batch failure test",
+        "status": "Open",
+        "customer_id": "TenantHookFail",
+        "created_by": "user@tenantHookFail.com",
+        "created_at": datetime.utcnow(),
+        "updated_at": None
+    } for i in range(4)]).inserted_ids
+    db.get_sync_collection("ticket_stats").delete_one({"_id": "TenantHookFail"})
+    now = datetime.utcnow() - timedelta(minutes=1)
+    events = [{
+        "ticket_id": ticket_id,
+        "customer_id": "TenantHookFail",
+        "status": "Done",
+        "key": f"TenantHookFail:f{i}",
+        "occurred_at": now + timedelta(seconds=i),
+    } for i, ticket_id in enumerate(ticket_ids)]
+
+    collection = db.get_collection
+    monkeypatch.setattr(db, "get_collection", lambda name: FailingTickets(collection(name), ticket_ids[0], 2) if name == "tickets" else collection(name))
+    emitted = []
+    monkeypatch.setattr(ticket_events, "emit", lambda event_type, ticket: emitted.append(ticket["_id"]))
+
+    try:
+        # Ticket 0 was changed after the read, 1 is written, 2 fails and 3 never runs
+        assert client.portal.call(apply_status_events, events) == ["stale", "applied", "error", "error"]
+        assert emitted == [ticket_ids[1]]
+        assert [ticket["status"] for ticket in tickets_collection.find({"_id": {"$in": ticket_ids}}).sort("title", 1)] == ["Closed", "Done", "Open", "Open"]
+        stats = db.get_sync_collection("ticket_stats").find_one({"_id": "TenantHookFail"})
+        assert stats["by_status"] == {"Open": -1, "Done": 1}
+        keys = {key["_id"] for key in db.get_sync_collection(IDEMPOTENCY_COLLECTION).find({"_id": {"$regex": "^TenantHookFail:"}})}
+        assert keys == {"TenantHookFail:f0", "TenantHookFail:f1"}
+    finally:
+        tickets_collection.delete_many({"customer_id": "TenantHookFail"})
+        db.get_sync_collection("ticket_stats").delete_one({"_id": "TenantHookFail"})
+        db.get_sync_collection(IDEMPOTENCY_COLLECTION).delete_many({"_id": {"$regex": "^TenantHookFail:"}})
+
+def test_stop_waits_for_the_flush_in_progress(monkeypatch):
+    batches = []
+
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_apply(events):
+            # The app's own batcher may still be flushing an earlier test's event
+            batches.append([event["ticket_id"] for event in events])
+            started.set()
+            await release.wait()
+            return ["applied"] * len(events)
+
+        monkeypatch.setattr(webhook_batch, "apply_status_events", slow_apply)
+        batcher = WebhookBatcher(max_events=10, interval_ms=1, max_pending=100)
+        await batcher.start()
+        first = batcher.submit([{"ticket_id": "first", "key": None}])
+        await started.wait()
+        # Queued while the first batch is being written, then shut down mid-flush
+        second = batcher.submit([{"ticket_id": "second", "key": None}])
+        stopping = asyncio.create_task(batcher.stop())
+        await asyncio.sleep(0.01)
+        release.set()
+        await stopping
+        return [future.result() for future in first + second]
+
+    assert client.portal.call(scenario) == ["applied", "applied"]
+    assert [batch for batch in batches if batch[0] in ("first", "second")] == [["first"], ["second"]]
+
+def hook_ticket(customer_id, **fields):
+    return db.get_sync_collection("tickets").insert_one({
+        "title": "Webhook batch",
+        "description": "Webhook batch test",
+        "status": "Open",
+        "customer_id": customer_id,
+        "created_by": f"user@{customer_id}.com",
+        "created_at": datetime.utcnow(),
+        "updated_at": None,
+        **fields
+    }).inserted_id
+
+def test_failures_after_claiming_give_keys_back_and_stats_failures_keep_results(monkeypatch):
+    ticket_id = hook_ticket("TenantHookClaim")
+    event = {"ticket_id": ticket_id, "customer_id": "TenantHookClaim", "status": "Done", "key": "TenantHookClaim:c1", "occurred_at": datetime.utcnow()}
+    keys = db.get_sync_collection(IDEMPOTENCY_COLLECTION)
+
+    class BrokenTickets:
+        def find(self, *args, **kwargs):
+            raise PyMongoError("injected read failure")
+
+    collection = db.get_collection
+    try:
+        monkeypatch.setattr(db, "get_collection", lambda name: BrokenTickets() if name == "tickets" else collection(name))
+        with pytest.raises(PyMongoError):
+            client.portal.call(apply_status_events, [event])
+        # The retry must not come back as a duplicate
+        assert keys.find_one({"_id": "TenantHookClaim:c1"}) is None
+        monkeypatch.setattr(db, "get_collection", collection)
+
+        async def broken_apply(self, session=None):
+            raise PyMongoError("injected stats failure")
+
+        monkeypatch.setattr(StatsDelta, "apply", broken_apply)
+        assert client.portal.call(apply_status_events, [event]) == ["applied"]
+        assert db.get_sync_collection("tickets").find_one({"_id": ticket_id})["status"] == "Done"
+        assert keys.find_one({"_id": "TenantHookClaim:c1"}) is not None
+    finally:
+        db.get_sync_collection("tickets").delete_many({"customer_id": "TenantHookClaim"})
+        keys.delete_many({"_id": {"$regex": "^TenantHookClaim:"}})
+
+def test_event_older_than_an_api_status_change_is_stale():
+    db.get_sync_collection("users").insert_one({
+        "email": "admin@tenantHookApi.com",
+        "hashed_password": "!",
+        "customer_id": "TenantHookApi",
+        "role": "Admin",
+        "created_at": datetime.utcnow()
+    })
+    ticket_id = hook_ticket("TenantHookApi")
+    token = create_access_token({"sub": "admin@tenantHookApi.com", "customer_id": "TenantHookApi", "role": "Admin"})
+    try:
+        response = client.put(f"/api/tickets/{ticket_id}", json={"status": "In Progress"}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+
+        # Sent by n8n before the agent's change but delivered after it
+        response = client.post("/webhook/ticket-done/batch", params={"wait": "true"}, headers=SECRET, json={"events": [
+            {"customer_id": "TenantHookApi", "ticket_id": str(ticket_id), "status": "Done", "event_id": "a1",
+             "occurred_at": (datetime.utcnow() - timedelta(minutes=1)).isoformat()},
+        ]})
+        assert [result["status"] for result in response.json()["results"]] == ["stale"]
+        assert db.get_sync_collection("tickets").find_one({"_id": ticket_id})["status"] == "In Progress"
+    finally:
+        db.get_sync_collection("users").delete_many({"customer_id": "TenantHookApi"})
+        db.get_sync_collection("tickets").delete_many({"customer_id": "TenantHookApi"})
+        db.get_sync_collection(IDEMPOTENCY_COLLECTION).delete_many({"_id": {"$regex": "^TenantHookApi:"}})
@@ -82,6 +82,7 @@ const App = () => {
 
   const handleLogout = () => {
     localStorage.removeItem('access_token');
+    localStorage.removeItem('refresh_token');
     setIsAuthenticated(false);
     setScreens([]);
     window.location.reload();
@@ -31,12 +31,61 @@ apiClient.interceptors.request.use(
   }
 );
 
+// Trade the refresh token for new tokens instead of sending the user back to
+// the login form. Concurrent 401s share one refresh, since a refresh token
+// only works once.
+let refreshing = null;
+
+const refreshAccessToken = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem("refresh_token");
+    refreshing = (refreshToken
+      ? axios
+          .post(`${API_BASE_URL}/auth/refresh`, { refresh_token: refreshToken })
+          .then((response) => {
+            localStorage.setItem("access_token", response.data.access_token);
+            localStorage.setItem("refresh_token", response.data.refresh_token);
+            return response.data.access_token;
+          })
+      : Promise.reject(new Error("No refresh token"))
+    ).finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+};
+
+// The token to retry a request that got a 401 with, or null when the session is over
+const freshAccessToken = async (request) => {
+  const sent = (request.headers.Authorization || "").replace("Bearer ", "");
+  const stored = localStorage.getItem("access_token");
+  // Another app on the page may have refreshed already
+  if (stored && stored !== sent) {
+    return stored;
+  }
+  try {
+    return await refreshAccessToken();
+  } catch (refreshError) {
+    return null;
+  }
+};
+
 // Add response interceptor for error handling
 apiClient.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const request = error.config;
+    if (error.response?.status === 401 && request && !request._retried) {
+      const token = await freshAccessToken(request);
+      if (token) {
+        request._retried = true;
+        request.headers.Authorization = `Bearer ${token}`;
+        return apiClient(request);
+      }
+    }
     if (error.response?.status === 401) {
       localStorage.removeItem("access_token");
+      localStorage.removeItem("refresh_token");
       window.location.reload();
     }
     return Promise.reject(error);
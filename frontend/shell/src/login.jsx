@@ -22,6 +22,7 @@ const LoginForm = ({ onLogin }) => {
       });
 
       localStorage.setItem('access_token', response.data.access_token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       onLogin(response.data.access_token);
     } catch (err) {
       setError('Invalid credentials');
@@ -31,12 +31,61 @@ apiClient.interceptors.request.use(
   }
 );
 
+// Trade the refresh token for new tokens instead of sending the user back to
+// the login form. Concurrent 401s share one refresh, since a refresh token
+// only works once.
+let refreshing = null;
+
+const refreshAccessToken = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem("refresh_token");
+    refreshing = (refreshToken
+      ? axios
+          .post(`${API_BASE_URL}/auth/refresh`, { refresh_token: refreshToken })
+          .then((response) => {
+            localStorage.setItem("access_token", response.data.access_token);
+            localStorage.setItem("refresh_token", response.data.refresh_token);
+            return response.data.access_token;
+          })
+      : Promise.reject(new Error("No refresh token"))
+    ).finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+};
+
+// The token to retry a request that got a 401 with, or null when the session is over
+const freshAccessToken = async (request) => {
+  const sent = (request.headers.Authorization || "").replace("Bearer ", "");
+  const stored = localStorage.getItem("access_token");
+  // Another app on the page may have refreshed already
+  if (stored && stored !== sent) {
+    return stored;
+  }
+  try {
+    return await refreshAccessToken();
+  } catch (refreshError) {
+    return null;
+  }
+};
+
 // Add response interceptor for error handling
 apiClient.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const request = error.config;
+    if (error.response?.status === 401 && request && !request._retried) {
+      const token = await freshAccessToken(request);
+      if (token) {
+        request._retried = true;
+        request.headers.Authorization = `Bearer ${token}`;
+        return apiClient(request);
+      }
+    }
     if (error.response?.status === 401) {
       localStorage.removeItem("access_token");
+      localStorage.removeItem("refresh_token");
       // Don't redirect in micro-frontend, let parent handle
     }
     return Promise.reject(error);
@@ -45,8 +94,17 @@ apiClient.interceptors.response.use(
 
 export const fetchTickets = async () => {
   try {
-    const response = await apiClient.get("/api/tickets");
-    return response.data;
+    // The list is paginated; follow the cursor header until the last page
+    const tickets = [];
+    let cursor = null;
+    do {
+      const response = await apiClient.get("/api/tickets", {
+        params: cursor ? { cursor } : {},
+      });
+      tickets.push(...response.data);
+      cursor = response.headers["x-next-cursor"] || null;
+    } while (cursor);
+    return tickets;
   } catch (error) {
     console.error("API Error:", error);
     throw error;
@@ -62,3 +120,44 @@ export const createTicket = async (ticketData) => {
     throw error;
   }
 };
+
+export const searchTickets = async (q, cursor = null) => {
+  try {
+    // Ranked server-side search; pass the returned cursor to fetch the next page
+    const response = await apiClient.get("/api/tickets/search", {
+      params: cursor ? { q, cursor } : { q },
+    });
+    return {
+      results: response.data,
+      nextCursor: response.headers["x-next-cursor"] || null,
+    };
+  } catch (error) {
+    console.error("API Error:", error);
+    throw error;
+  }
+};
+
+export const fetchTicketStats = async (days = 30) => {
+  try {
+    const response = await apiClient.get("/api/tickets/stats", { params: { days } });
+    return response.data;
+  } catch (error) {
+    console.error("API Error:", error);
+    throw error;
+  }
+};
+
+// EventSource cannot send headers, so the token goes in the query string.
+// It reconnects on its own and resumes from the last event it saw.
+export const subscribeTicketEvents = (onEvent, onReset) => {
+  const token = localStorage.getItem("access_token");
+  const source = new EventSource(
+    `${API_BASE_URL}/api/tickets/events?access_token=${encodeURIComponent(token || "")}`
+  );
+  ["ticket.created", "ticket.updated", "ticket.deleted"].forEach((type) => {
+    source.addEventListener(type, (event) => onEvent(type, JSON.parse(event.data)));
+  });
+  // Events were missed; the caller should refetch the list
+  source.addEventListener("reset", () => onReset && onReset());
+  return () => source.close();
+};